@@ -0,0 +1,205 @@
+# batch_analyzer.py
+#
+# Bulk claim analysis for audits and replays. Queries are processed in
+# batches where each stage runs once per batch: one encode() over all
+# queries, one index.search() with every query vector, one nlp.pipe() pass
+# for parsing. LLM calls then fan out with bounded concurrency and a rate
+# limit, and results are written back with insert_many.
+#
+#   python batch_analyzer.py claims.jsonl -o results.jsonl [--store]
+#
+# Each input line is a JSON object with a "query" and optionally "id" and
+# "user_id" (a bare JSON string is also accepted as the query).
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import semantic_search
+import workers
+from query_parser import parse_queries
+from llm_reasoner import get_decision_async, parse_decision, build_result
+from mongodb import new_query_doc
+
+BATCH_SIZE = int(os.getenv("ANALYZE_BATCH_SIZE", "128"))  # queries per encode/search/parse pass
+BATCH_LLM_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_LLM_CONCURRENCY", "8"))
+BATCH_LLM_RPM = float(os.getenv("ANALYZE_BATCH_LLM_RPM", "300"))  # LLM requests per minute, 0 = unlimited
+TOP_K = 5
+
+class RateLimiter:
+    # Spaces calls evenly so at most `per_minute` start in any minute
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def read_jsonl(lines):
+    # Yields {"query", "id", "user_id"} or {"error"} per non-blank line
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"id": line_no, "error": f"invalid JSON: {e}"}
+            continue
+        if isinstance(record, str):
+            record = {"query": record}
+        if not isinstance(record, dict) or not record.get("query"):
+            yield {"id": record.get("id", line_no) if isinstance(record, dict) else line_no,
+                   "error": "missing query"}
+            continue
+        record.setdefault("id", line_no)
+        yield record
+
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def retrieve_batch(queries):
+    # One encode() and one index.search() for the whole batch (runs on the CPU pool)
+    return semantic_search.search_many(queries, TOP_K)
+
+async def retrieve_each(queries):
+    # Fallback when a batched pass fails: one query at a time, so a failure
+    # only costs its own line. (clauses, parsed, error) per query.
+    results = []
+    for query in queries:
+        try:
+            clauses, parsed = await asyncio.gather(
+                workers.run_cpu(retrieve_batch, [query]), workers.run_cpu(parse_queries, [query]))
+            results.append((clauses[0], parsed[0], None))
+        except Exception as e:
+            results.append((None, None, str(e)))
+    return results
+
+async def analyze_batch(records, collection=None, user_id=None, use_cache=True,
+                        batch_size=BATCH_SIZE, concurrency=BATCH_LLM_CONCURRENCY, rpm=BATCH_LLM_RPM):
+    # Async generator of progress events and per-query results:
+    #   {"type": "progress", "stage": ..., "done": n, ...}
+    #   {"type": "result", "id": ..., "query": ..., "decision": ..., ...}
+    #   {"type": "result", "id": ..., "error": ...}
+    # Results are inserted into `collection` (if given) once per batch.
+    slots = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm)
+    done = 0
+    failed = 0
+    started = time.perf_counter()
+
+    async def decide(record, parsed, clauses):
+        async with slots:
+            await limiter.wait()
+            try:
+                reply = await get_decision_async(record["query"], parsed, clauses, use_cache=use_cache)
+                return record, build_result(parse_decision(reply), clauses), None
+            except Exception as e:
+                return record, None, str(e)
+
+    batches = iter_batches(records, batch_size)
+    batch_no = 0
+    while True:
+        # Records are read from the file a batch at a time, off the event loop
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        batch_no += 1
+        invalid = [r for r in batch if "error" in r]
+        batch = [r for r in batch if "error" not in r]
+        for record in invalid:
+            failed += 1
+            yield {"type": "result", "id": record["id"], "error": record["error"]}
+
+        queries = [r["query"] for r in batch]
+        if queries:
+            batch_start = time.perf_counter()
+            try:
+                clause_lists, parsed_list = await asyncio.gather(
+                    workers.run_cpu(retrieve_batch, queries), workers.run_cpu(parse_queries, queries))
+                retrieved = list(zip(batch, clause_lists, parsed_list))
+            except Exception:
+                retrieved = []
+                for record, (clauses, parsed, error) in zip(batch, await retrieve_each(queries)):
+                    if error is not None:
+                        failed += 1
+                        yield {"type": "result", "id": record["id"], "query": record["query"], "error": error}
+                    else:
+                        retrieved.append((record, clauses, parsed))
+            yield {"type": "progress", "stage": "retrieve", "batch": batch_no, "queries": len(queries),
+                   "seconds": round(time.perf_counter() - batch_start, 3)}
+
+            docs = []
+            tasks = [asyncio.ensure_future(decide(record, parsed, clauses)) for record, clauses, parsed in retrieved]
+            for finished in asyncio.as_completed(tasks):
+                record, result, error = await finished
+                if error is not None:
+                    failed += 1
+                    yield {"type": "result", "id": record["id"], "query": record["query"], "error": error}
+                    continue
+                done += 1
+                docs.append(new_query_doc(record["query"], result, record.get("user_id") or user_id))
+                yield {"type": "result", "id": record["id"], "query": record["query"], **result}
+
+            if collection is not None and docs:
+                await collection.insert_many(docs, ordered=False)
+
+        elapsed = time.perf_counter() - started
+        yield {"type": "progress", "stage": "batch", "batch": batch_no, "done": done, "failed": failed,
+               "elapsed": round(elapsed, 3), "queries_per_sec": round((done + failed) / elapsed, 2) if elapsed else 0.0}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of claim queries through the analyzer.")
+    parser.add_argument("input", help="JSONL file, one query per line")
+    parser.add_argument("-o", "--output", help="write results as JSONL here (default: stdout)")
+    parser.add_argument("--store", action="store_true", help="also log results to the queries collection")
+    parser.add_argument("--user-id", help="user_id for records that don't carry one")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the decision cache")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=BATCH_LLM_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=BATCH_LLM_RPM, help="LLM requests per minute (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    async def run():
+        collection = None
+        if args.store:
+            import query_log
+            collection = query_log.writer
+        out = open(args.output, "w") if args.output else sys.stdout
+        try:
+            with open(args.input) as f:
+                events = analyze_batch(read_jsonl(f), collection, args.user_id, not args.no_cache,
+                                       args.batch_size, args.concurrency, args.rpm)
+                async for event in events:
+                    if event["type"] == "result":
+                        out.write(json.dumps({k: v for k, v in event.items() if k != "type"}, default=str) + "\n")
+                    elif event["stage"] == "batch":
+                        print(f"batch {event['batch']}: {event['done']} done, {event['failed']} failed, "
+                              f"{event['queries_per_sec']} queries/sec", file=sys.stderr)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+            if collection is not None:
+                await collection.close()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/chunking_benchmark.py
+#
+# Chunk counts, size distribution and chunking time for the old newline
+# chunker and the chunker.py strategies over the PDFs in ./data/. With
+# --embed, also times encoding every chunk, which is where most ingest time
+# goes.
+#
+#   cd backend && python -m benchmarks.chunking_benchmark
+#   cd backend && python -m benchmarks.chunking_benchmark --embed --max-tokens 128 160 256
+
+import os
+import time
+import argparse
+import fitz  # PyMuPDF
+import numpy as np
+import chunker
+import embeddings
+
+MODEL_MAX_TOKENS = 256  # all-MiniLM-L6-v2 truncates anything longer
+
+def legacy_chunk_text(text, max_chunk_size=300):
+    # The newline chunker document_ingestor and routes used before chunker.py
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        if len(current) + len(line) < max_chunk_size:
+            current += " " + line
+        else:
+            chunks.append(current.strip())
+            current = line
+    if current:
+        chunks.append(current.strip())
+    return chunks
+
+def load_pages(doc_dir, limit):
+    pages = []
+    for filename in sorted(os.listdir(doc_dir))[:limit]:
+        if filename.endswith(".pdf"):
+            with fitz.open(os.path.join(doc_dir, filename)) as doc:
+                pages.extend(page.get_text() for page in doc)
+    return pages
+
+def run(pages, chunk_fn):
+    start = time.perf_counter()
+    chunks = [c for text in pages for c in chunk_fn(text)]
+    return chunks, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunking strategies on the documents in ./data/.")
+    parser.add_argument("--data", default="./data/")
+    parser.add_argument("--files", type=int, default=None, help="only use the first N files")
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[chunker.CHUNK_MAX_TOKENS])
+    parser.add_argument("--overlap", type=int, default=chunker.CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--embed", action="store_true", help="also time encoding the chunks")
+    args = parser.parse_args()
+
+    pages = load_pages(args.data, args.files)
+    print(f"{len(pages)} pages, {sum(len(p) for p in pages) / 1e6:.1f}M characters\n")
+
+    configs = [("legacy (300 chars)", legacy_chunk_text)]
+    for strategy in ("sentence", "token"):
+        for max_tokens in args.max_tokens:
+            configs.append((f"{strategy} {max_tokens}/{args.overlap}",
+                            lambda text, s=strategy, m=max_tokens: [c["text"] for c in chunker.chunk_text(
+                                text, max_tokens=m, overlap_tokens=args.overlap, strategy=s)]))
+
+    header = f"{'chunker':<20} {'chunks':>7} {'empty':>6} {'mean tok':>9} {'p95 tok':>8} {'>model':>7} {'chunk s':>8}"
+    print(header + (f" {'embed s':>8}" if args.embed else ""))
+    for name, chunk_fn in configs:
+        chunks, seconds = run(pages, chunk_fn)
+        sizes = np.array([chunker.count_tokens(c) for c in chunks])
+        line = (f"{name:<20} {len(chunks):7d} {int((sizes == 0).sum()):6d} {sizes.mean():9.1f} "
+                f"{np.percentile(sizes, 95):8.0f} {int((sizes > MODEL_MAX_TOKENS).sum()):7d} {seconds:8.3f}")
+        if args.embed:
+            start = time.perf_counter()
+            embeddings.encode([c for c in chunks if c], batch_size=64)
+            line += f" {time.perf_counter() - start:8.2f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# benchmarks/e2e_benchmark.py
+#
+# Boots main.app in-process against local stand-ins (benchmarks/stand_ins.py)
+# and drives POST /analyze-query at each requested concurrency, with and
+# without file uploads. Reports p50/p95/p99 latency and throughput for the
+# whole request and for each stage inside it:
+#   request       client-side, the full HTTP round trip
+#   retrieve      query parsing + clause retrieval (or upload processing)
+#   parse         parse_query
+#   encode        query embedding through the batcher
+#   search        encode + index search through the batcher
+#   search_vector index search through the batcher for an already encoded query
+#   index         semantic_search.search_vectors, one batched FAISS + BM25 pass
+#   uploads       spooling, extracting and embedding uploaded files
+#   decision      get_decision_async (decision cache + LLM)
+#   llm           the LLM call itself
+#   log           queuing the query log (written behind, see query_log.py)
+# Needs the ingested clause index and the embedding model, like the app.
+#
+#   cd backend && python -m benchmarks.e2e_benchmark --requests 200 --concurrency 1 8 32
+#   cd backend && python -m benchmarks.e2e_benchmark --upload data/BAJHLIP23020V012223.pdf --llm-latency 0.8
+
+import os
+import time
+import asyncio
+import argparse
+import functools
+import numpy as np
+
+STAGES = ("request", "retrieve", "parse", "encode", "search", "search_vector", "index", "uploads", "decision", "llm",
+          "log")
+
+class StageTimes:
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def wrap_async(self, stage, fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_sync(self, stage, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+    def report(self, wall_seconds):
+        print(f"  {'stage':<13} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'per sec':>8}")
+        for stage in STAGES:
+            samples = np.array(self.samples[stage]) * 1000
+            if not len(samples):
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f"  {stage:<13} {len(samples):6d} {p50:9.1f} {p95:9.1f} {p99:9.1f} {samples.mean():9.1f} "
+                  f"{len(samples) / wall_seconds:8.1f}")
+
+def instrument(times):
+    # Wraps the app's stage functions where routes.py looks them up
+    import routes
+    import llm_reasoner
+    import semantic_search
+    routes.retrieve = times.wrap_async("retrieve", routes.retrieve)
+    routes.parse_query = times.wrap_sync("parse", routes.parse_query)
+    routes.read_uploads = times.wrap_async("uploads", routes.read_uploads)
+    routes.get_decision_async = times.wrap_async("decision", routes.get_decision_async)
+    routes.log_query = times.wrap_async("log", routes.log_query)
+    routes.batcher.encode = times.wrap_async("encode", routes.batcher.encode)
+    routes.batcher.search = times.wrap_async("search", routes.batcher.search)
+    routes.batcher.search_vector = times.wrap_async("search_vector", routes.batcher.search_vector)
+    semantic_search.search_vectors = times.wrap_sync("index", semantic_search.search_vectors)
+    llm_reasoner.call_llm = times.wrap_async("llm", llm_reasoner.call_llm)
+
+async def drive(client, queries, concurrency, upload, times):
+    # Sends every query, `concurrency` at a time; returns (wall seconds, errors)
+    pending = iter(queries)
+    errors = []
+
+    async def worker():
+        for query in pending:
+            files = {"files": (os.path.basename(upload[0]), upload[1], "application/pdf")} if upload else None
+            start = time.perf_counter()
+            response = await client.post("/analyze-query", data={"query": query}, files=files)
+            times.add("request", time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start, errors
+
+async def run(args):
+    # Cache settings are read at import time, so set them before the app loads
+    if not args.cache:
+        os.environ["DECISION_CACHE"] = "0"
+        os.environ["SEMANTIC_CACHE"] = "0"
+        os.environ["UPLOAD_CACHE"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["MONGO_ENSURE_INDEXES"] = "0"
+
+    import httpx
+    import openai
+    from benchmarks.stand_ins import FakeOpenAI, MemoryCollection
+    from benchmarks.parser_benchmark import synthetic_queries
+
+    fake_openai = FakeOpenAI(latency=args.llm_latency, jitter=args.llm_jitter)
+    openai.api_base = await fake_openai.start()
+    openai.api_key = os.environ["OPENAI_API_KEY"]
+
+    import main
+    import query_log
+    query_log.writer.queries = MemoryCollection(latency=args.mongo_latency)
+    query_log.writer.users = MemoryCollection(latency=args.mongo_latency)
+    times = StageTimes()
+    instrument(times)
+
+    scenarios = [("no upload", None)]
+    for path in args.upload or ():
+        with open(path, "rb") as f:
+            scenarios.append((f"upload {os.path.basename(path)}", (path, f.read())))
+
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+                for name, upload in scenarios:
+                    for concurrency in args.concurrency:
+                        queries = synthetic_queries(args.warmup + args.requests, args.seed)
+                        await drive(client, queries[:args.warmup], concurrency, upload, times)
+                        times.reset()
+                        llm_before = fake_openai.requests
+                        wall, errors = await drive(client, queries[args.warmup:], concurrency, upload, times)
+                        print(f"\n{name}, concurrency {concurrency}: {args.requests} requests in {wall:.2f}s "
+                              f"= {args.requests / wall:.1f} req/s, {len(errors)} errors, "
+                              f"{fake_openai.requests - llm_before} LLM calls")
+                        times.report(wall)
+                        for error in errors[:3]:
+                            print(f"  error {error}")
+    finally:
+        await fake_openai.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /analyze-query latency with local OpenAI and Mongo stand-ins.")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--upload", nargs="*", help="also run scenarios that attach each of these files")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake OpenAI reply delay, seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="up to this much extra delay, seconds")
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="fake Mongo round trip, seconds")
+    parser.add_argument("--cache", action="store_true", help="leave the decision, semantic and upload caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/embedding_benchmark.py
+#
+# Throughput (sentences/sec over the chunks of ./data/), single-query
+# latency and cosine agreement with the torch reference for each embedding
+# backend in embeddings.py, at each intra-op thread count given.
+#
+#   cd backend && python -m benchmarks.embedding_benchmark
+#   cd backend && python -m benchmarks.embedding_benchmark --backends torch int8 --threads 1 2 4 --sentences 5000
+
+import time
+import argparse
+import numpy as np
+import chunker
+import embeddings
+from benchmarks.chunking_benchmark import load_pages
+from benchmarks.parser_benchmark import synthetic_queries
+
+def load_sentences(doc_dir, files, limit):
+    chunks = [c["text"] for text in load_pages(doc_dir, files) for c in chunker.chunk_text(text)]
+    return [c for c in chunks if c][:limit]
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def throughput(model, sentences, batch_size):
+    start = time.perf_counter()
+    vectors = model.encode(sentences, batch_size=batch_size)
+    return len(sentences) / (time.perf_counter() - start), normalize(vectors)
+
+def query_latencies(model, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends against the torch reference.")
+    parser.add_argument("--backends", nargs="+", default=list(embeddings.BACKENDS), choices=embeddings.BACKENDS)
+    parser.add_argument("--threads", type=int, nargs="+", default=[embeddings.EMBEDDING_THREADS],
+                        help="intra-op threads per encode, 0 = library default")
+    parser.add_argument("--data", default="./data/")
+    parser.add_argument("--files", type=int, default=None, help="only use the first N files")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import torch
+    default_threads = torch.get_num_threads()
+    sentences = load_sentences(args.data, args.files, args.sentences)
+    queries = synthetic_queries(args.queries, args.seed)
+
+    # Reference vectors, for the agreement columns
+    reference = embeddings.load_torch(default_threads, device="cpu")
+    truth = normalize(reference.encode(sentences, batch_size=args.batch_size))
+    del reference
+    print(f"{len(sentences)} sentences, {len(queries)} queries, model {embeddings.MODEL_NAME}, "
+          f"batch {args.batch_size}\n")
+    print(f"{'backend':<8} {'threads':>7} {'load s':>7} {'sent/s':>8} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'min cos':>8} {'mean cos':>9}")
+
+    for backend in args.backends:
+        for threads in args.threads:
+            if backend != "onnx":
+                torch.set_num_threads(threads or default_threads)
+            start = time.perf_counter()
+            try:
+                model = embeddings.load_backend(backend, threads)
+            except Exception as e:
+                print(f"{backend:<8} {threads:7d}  could not load: {e}")
+                break
+            load_seconds = time.perf_counter() - start
+            model.encode(["warm up"])
+            rate, vectors = throughput(model, sentences, args.batch_size)
+            latencies = query_latencies(model, queries)
+            cosines = (vectors * truth).sum(axis=1)
+            print(f"{backend:<8} {threads:7d} {load_seconds:7.2f} {rate:8.1f} {np.percentile(latencies, 50):7.2f} "
+                  f"{np.percentile(latencies, 99):7.2f} {cosines.min():8.4f} {cosines.mean():9.4f}")
+            del model
+
+if __name__ == "__main__":
+    main()
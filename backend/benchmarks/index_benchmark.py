@@ -0,0 +1,90 @@
+# benchmarks/index_benchmark.py
+#
+# Recall@k and per-query latency of each index type against the flat baseline,
+# built from the vectors document_ingestor keeps in faiss_index/vectors/.
+#
+#   cd backend && python -m benchmarks.index_benchmark --k 5 --queries 500
+
+import json
+import time
+import argparse
+import numpy as np
+import faiss_indexes
+from document_ingestor import MANIFEST_PATH, read_vectors
+
+# (index type, search knob, values swept)
+SWEEPS = [
+    ("flat", None, [None]),
+    ("ivf_flat", "nprobe", [1, 4, 16, 64]),
+    ("hnsw", "ef_search", [16, 32, 64, 128]),
+    ("ivf_pq", "nprobe", [4, 16, 64]),
+]
+
+def load_corpus():
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    dim = manifest["dim"]
+    ids, vectors = [], []
+    for filename, entry in manifest["documents"].items():
+        block = np.asarray(read_vectors(filename, dim))
+        vectors.append(block)
+        ids.append(np.arange(entry["ids"][0], entry["ids"][0] + len(block), dtype="int64"))
+    return np.concatenate(ids), np.ascontiguousarray(np.concatenate(vectors), dtype="float32")
+
+def make_queries(vectors, count, noise, seed):
+    # Perturbed corpus vectors stand in for real queries
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    scale = noise * np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return np.ascontiguousarray(picks + rng.normal(size=picks.shape) * scale, dtype="float32")
+
+def build(kind, ids, vectors):
+    config = dict(faiss_indexes.index_config_from_env(), type=kind)
+    start = time.perf_counter()
+    index = faiss_indexes.create_index(config, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        faiss_indexes.train_index(index, vectors[:config["train_size"]])
+    index.add_with_ids(vectors, ids)
+    return index, time.perf_counter() - start
+
+def run_queries(index, queries, k, **knobs):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, labels = faiss_indexes.search(index, query[None, :], k, **knobs)
+        latencies.append(time.perf_counter() - start)
+        results.append(labels[0])
+    return np.array(results), np.array(latencies) * 1000
+
+def recall_at_k(found, truth):
+    hits = [len(set(f.tolist()) & set(t.tolist())) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) / truth.shape[1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types against the flat baseline.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, vectors = load_corpus()
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}\n")
+    print(f"{'index':<10} {'knob':<14} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+    truth = None
+    for kind, knob, values in SWEEPS:
+        index, build_seconds = build(kind, ids, vectors)
+        for value in values:
+            knobs = {knob: value} if knob else {}
+            found, latencies = run_queries(index, queries, args.k, **knobs)
+            if truth is None:
+                truth = found  # the flat sweep runs first and is exact
+            label = f"{knob}={value}" if knob else "-"
+            print(f"{kind:<10} {label:<14} {build_seconds:8.2f} {recall_at_k(found, truth):9.3f} "
+                  f"{np.percentile(latencies, 50):8.3f} {np.percentile(latencies, 99):8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/parser_benchmark.py
+#
+# Per-query latency of the fast (gazetteer + regex) parser against the full
+# spaCy pipeline, plus how often the two agree on each field.
+#
+#   cd backend && python -m benchmarks.parser_benchmark --queries 2000
+#   cd backend && python -m benchmarks.parser_benchmark --input claims.jsonl
+
+import json
+import time
+import random
+import argparse
+import numpy as np
+import query_parser
+
+FIELDS = ["age", "gender", "procedure", "city", "policy_duration_months"]
+
+AGES = ["{n}-year-old", "{n} year old", "aged {n}", "{n}yo"]
+GENDERS = ["male", "female", "man", "woman"]
+PROCEDURES = ["knee surgery", "cataract surgery", "heart bypass surgery", "hip replacement", "appendix operation"]
+CITIES = ["Pune", "Mumbai", "New Delhi", "Bangalore", "Chennai", "Hyderabad", "Kolkata", "Jaipur"]
+DURATIONS = ["{n}-month-old policy", "{n} month policy", "policy taken {n} years ago"]
+TEMPLATES = [
+    "{age} {gender}, {procedure} in {city}, {duration}",
+    "{gender} {age} needs {procedure} at a hospital in {city}; {duration}",
+    "Claim for {procedure}, {age} {gender} from {city}, {duration}",
+    "{procedure} {city} {age} {gender} {duration}",
+]
+
+def synthetic_queries(count, seed):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        queries.append(rng.choice(TEMPLATES).format(
+            age=rng.choice(AGES).format(n=rng.randint(18, 80)),
+            gender=rng.choice(GENDERS),
+            procedure=rng.choice(PROCEDURES),
+            city=rng.choice(CITIES),
+            duration=rng.choice(DURATIONS).format(n=rng.randint(1, 24))))
+    return queries
+
+def load_queries(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r if isinstance(r, str) else r["query"] for r in records]
+
+def time_each(fn, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fast query parser against the full spaCy pipeline.")
+    parser.add_argument("--input", help="JSONL file of queries (default: synthetic claims)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = load_queries(args.input) if args.input else synthetic_queries(args.queries, args.seed)
+
+    # Load both pipelines up front so model loading isn't timed
+    start = time.perf_counter()
+    query_parser.get_nlp()
+    full_load = time.perf_counter() - start
+    start = time.perf_counter()
+    query_parser.get_gazetteer()
+    fast_load = time.perf_counter() - start
+    print(f"{len(queries)} queries; load: full {full_load:.2f}s, fast {fast_load:.2f}s\n")
+
+    full, full_ms = time_each(query_parser.parse_query_full, queries)
+    fast, fast_ms = time_each(query_parser.parse_query_fast, queries)
+    fallbacks = sum(1 for q, r in zip(queries, fast)
+                    if r["city"] and query_parser.match_gazetteer(q) is None)
+
+    print(f"{'parser':<8} {'p50 ms':>8} {'p99 ms':>8} {'queries/s':>10}")
+    for name, ms in (("full", full_ms), ("fast", fast_ms)):
+        print(f"{name:<8} {np.percentile(ms, 50):8.3f} {np.percentile(ms, 99):8.3f} {1000 * len(ms) / ms.sum():10.0f}")
+    print(f"\nNER fallback used for {fallbacks} queries\n")
+
+    # Disagreements aren't necessarily fast-path errors: the full parser
+    # misreads "female" as male and the age in "46-year-old" as a duration
+    print(f"{'field':<24} {'agree':>7} {'full only':>10} {'fast only':>10}")
+    for field in FIELDS:
+        agree = sum(1 for a, b in zip(full, fast) if a[field] == b[field])
+        full_only = sum(1 for a, b in zip(full, fast) if a[field] is not None and b[field] is None)
+        fast_only = sum(1 for a, b in zip(full, fast) if a[field] is None and b[field] is not None)
+        print(f"{field:<24} {agree / len(queries):7.1%} {full_only:10d} {fast_only:10d}")
+
+if __name__ == "__main__":
+    main()
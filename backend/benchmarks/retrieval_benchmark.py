@@ -0,0 +1,93 @@
+# benchmarks/retrieval_benchmark.py
+#
+# Hit rate and MRR at small k for vector, BM25 and hybrid (RRF) retrieval
+# over the ingested clause index.
+#
+# Without --input, queries are phrases cut from random chunks (with a few
+# words dropped) and the chunk they came from is the one relevant result.
+# With --input, each JSONL line is {"query": ..., "source": ..., "page": ...}
+# and any chunk from that source (and page, if given) counts as relevant.
+#
+#   cd backend && python -m benchmarks.retrieval_benchmark --queries 300
+#   cd backend && python -m benchmarks.retrieval_benchmark --input labelled.jsonl
+
+import json
+import time
+import random
+import argparse
+import numpy as np
+import semantic_search
+
+KS = (1, 3, 5, 10)
+MODES = ("vector", "keyword", "hybrid")
+
+def synthetic_queries(store, count, words, drop, seed):
+    rng = random.Random(seed)
+    positions = list(range(len(store)))
+    rng.shuffle(positions)
+    labelled = []
+    for pos in positions:
+        if len(labelled) >= count:
+            break
+        meta = store._record(pos)
+        tokens = meta["text"].split()
+        if len(tokens) < words:
+            continue
+        start = rng.randrange(len(tokens) - words + 1)
+        phrase = [t for t in tokens[start:start + words] if rng.random() >= drop]
+        labelled.append({"query": " ".join(phrase), "source": meta["source"], "text": meta["text"]})
+    return labelled
+
+def load_labelled(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def is_relevant(meta, label):
+    if "text" in label:
+        return meta["source"] == label["source"] and meta["text"] == label["text"]
+    return meta["source"] == label["source"] and ("page" not in label or meta.get("page") == label["page"])
+
+def run_mode(mode, labelled, vectors, max_k):
+    queries = [label["query"] for label in labelled]
+    start = time.perf_counter()
+    if mode == "keyword":
+        found = [semantic_search.keyword_search(q, max_k) for q in queries]
+    else:
+        found = semantic_search.search_vectors(vectors, max_k, queries=queries, mode=mode)
+    seconds = time.perf_counter() - start
+    first_hit = []
+    for results, label in zip(found, labelled):
+        ranks = [rank for rank, meta in enumerate(results, 1) if is_relevant(meta, label)]
+        first_hit.append(ranks[0] if ranks else None)
+    return first_hit, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector, BM25 and hybrid retrieval quality at small k.")
+    parser.add_argument("--input", help="labelled JSONL queries (default: synthetic phrases from the corpus)")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--words", type=int, default=10, help="words per synthetic query")
+    parser.add_argument("--drop", type=float, default=0.2, help="fraction of words dropped from synthetic queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    state = semantic_search.current()
+    store = state.metadata
+    if state.keyword_index is None:
+        parser.error("no BM25 index found; run document_ingestor.py first")
+    labelled = load_labelled(args.input) if args.input else \
+        synthetic_queries(store, args.queries, args.words, args.drop, args.seed)
+    vectors = semantic_search.encode_queries([label["query"] for label in labelled])
+    max_k = max(KS)
+    print(f"{len(store)} chunks, {len(labelled)} queries, RRF k={semantic_search.RRF_K}, "
+          f"{semantic_search.HYBRID_CANDIDATES} candidates per ranking\n")
+
+    header = " ".join(f"{'hit@' + str(k):>7}" for k in KS)
+    print(f"{'mode':<8} {header} {'MRR@10':>7} {'ms/query':>9}")
+    for mode in MODES:
+        first_hit, seconds = run_mode(mode, labelled, vectors, max_k)
+        hits = " ".join(f"{np.mean([r is not None and r <= k for r in first_hit]):7.3f}" for k in KS)
+        mrr = np.mean([1.0 / r if r is not None else 0.0 for r in first_hit])
+        print(f"{mode:<8} {hits} {mrr:7.3f} {1000 * seconds / len(labelled):9.3f}")
+
+if __name__ == "__main__":
+    main()
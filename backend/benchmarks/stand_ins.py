@@ -0,0 +1,144 @@
+# benchmarks/stand_ins.py
+#
+# Local stand-ins for the app's external services, so main.app can be
+# benchmarked in-process without an OpenAI key or a MongoDB server:
+#   FakeOpenAI       an aiohttp server speaking the chat completions API,
+#                    with configurable latency and a canned JSON reply
+#   MemoryCollection an in-memory, async collection with the parts of the
+#                    motor API the request handlers use
+
+import json
+import time
+import asyncio
+import random
+import uuid
+from aiohttp import web
+
+CANNED_REPLY = {
+    "decision": "Approved",
+    "amount": 50000,
+    "justification": "Knee surgery is covered after the 90 day waiting period (benchmark reply).",
+}
+
+class FakeOpenAI:
+    # Replies after `latency` seconds plus up to `jitter` more; stream=True
+    # requests get the reply as SSE deltas of `stream_piece` characters
+    def __init__(self, latency=0.5, jitter=0.1, reply=None, stream_piece=8):
+        self.latency = latency
+        self.jitter = jitter
+        self.reply = json.dumps(reply or CANNED_REPLY)
+        self.stream_piece = stream_piece
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner = None
+        self.base_url = None
+
+    async def _handle(self, request):
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+            if body.get("stream"):
+                return await self._stream(request, body)
+            return web.json_response({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request, body):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i in range(0, len(self.reply), self.stream_piece):
+            chunk = {"object": "chat.completion.chunk", "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": self.reply[i:i + self.stream_piece]}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+class InsertResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.inserted_id = inserted_ids[0] if inserted_ids else None
+
+class MemoryCollection:
+    # Just enough of a motor collection for the request path: documents are
+    # kept in a list and queries only match on equality
+    def __init__(self, latency=0.0):
+        self.latency = latency  # simulated round trip per call
+        self.docs = []
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _matches(self, doc, query):
+        return all(doc.get(k) == v for k, v in (query or {}).items())
+
+    async def insert_one(self, doc):
+        await self._round_trip()
+        doc.setdefault("_id", uuid.uuid4().hex)
+        self.docs.append(doc)
+        return InsertResult([doc["_id"]])
+
+    async def insert_many(self, docs, ordered=True):
+        await self._round_trip()
+        for doc in docs:
+            doc.setdefault("_id", uuid.uuid4().hex)
+        self.docs.extend(docs)
+        return InsertResult([doc["_id"] for doc in docs])
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        await self._round_trip()
+        return next((doc for doc in self.docs if self._matches(doc, query)), None)
+
+    async def update_one(self, query, update, upsert=False):
+        await self._round_trip()
+        self._update(query, update, upsert)
+
+    async def bulk_write(self, requests, ordered=True):
+        # UpdateOne requests only, all in one round trip
+        await self._round_trip()
+        for request in requests:
+            self._update(request._filter, request._doc, request._upsert)
+
+    def _update(self, query, update, upsert):
+        doc = next((doc for doc in self.docs if self._matches(doc, query)), None)
+        if doc is None and upsert:
+            doc = dict(query)
+            self.docs.append(doc)
+        if doc is not None:
+            doc.update(update.get("$set", {}))
+            for key, amount in update.get("$inc", {}).items():
+                doc[key] = doc.get(key, 0) + amount
+
+    async def create_index(self, *args, **kwargs):
+        return "index"
+
@@ -0,0 +1,126 @@
+# bm25_index.py
+#
+# Compact inverted index over chunk texts for BM25 keyword scoring, built by
+# document_ingestor alongside the FAISS index and memory-mapped at query
+# time. Layout (one directory):
+#   vocab.json     list of terms, sorted
+#   offsets.npy    int64[V+1]  start of each term's postings
+#   postings.npy   int32[P]    positions (into chunk_ids) of chunks containing the term
+#   tfs.npy        uint16[P]   term frequency in that chunk
+#   chunk_ids.npy  int64[N]    chunk id at each position
+#   lengths.npy    int32[N]    chunk length in tokens
+#
+# Tokens are lowercase alphanumeric runs; dotted or hyphenated runs such as
+# "4.2.1" or "sub-limit" are kept whole and also split into their parts, so
+# clause numbers match exactly and "sub limit" still matches "sub-limit".
+
+import os
+import re
+import json
+from collections import Counter, defaultdict
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+ARRAYS = ("offsets", "postings", "tfs", "chunk_ids", "lengths")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in", "is", "it",
+    "of", "on", "or", "such", "that", "the", "this", "to", "was", "will", "with",
+}
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(p for p in re.split(r"[.\-/]", token) if p not in STOPWORDS)
+    return tokens
+
+def exists(directory):
+    return os.path.exists(os.path.join(directory, "vocab.json"))
+
+def build_index(directory, records):
+    # records: iterable of (chunk_id, meta). Replaces whatever is in directory.
+    os.makedirs(directory, exist_ok=True)
+    chunk_ids, lengths = [], []
+    postings = defaultdict(list)  # term -> [(position, tf)]
+    for pos, (chunk_id, meta) in enumerate(records):
+        counts = Counter(tokenize(meta["text"]))
+        chunk_ids.append(chunk_id)
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings[term].append((pos, min(tf, 65535)))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype="int64")
+    offsets[1:] = np.cumsum([len(postings[t]) for t in vocab])
+    flat = [p for t in vocab for p in postings[t]]
+    arrays = {
+        "offsets": offsets,
+        "postings": np.array([p for p, _ in flat], dtype="int32"),
+        "tfs": np.array([tf for _, tf in flat], dtype="uint16"),
+        "chunk_ids": np.array(chunk_ids, dtype="int64"),
+        "lengths": np.array(lengths, dtype="int32"),
+    }
+    for name, array in arrays.items():
+        with open(os.path.join(directory, name + ".npy.tmp"), "wb") as f:
+            np.save(f, array)
+    with open(os.path.join(directory, "vocab.json.tmp"), "w") as f:
+        json.dump(vocab, f)
+    for name in [a + ".npy" for a in ARRAYS] + ["vocab.json"]:
+        path = os.path.join(directory, name)
+        os.replace(path + ".tmp", path)
+    return len(vocab)
+
+class BM25Index:
+    def __init__(self, directory, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+        with open(os.path.join(directory, "vocab.json")) as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self.avg_length = float(np.mean(self.lengths)) if len(self.lengths) else 0.0
+        # Per-chunk length normalisation, reused by every query
+        self.norms = (k1 * (1 - b + b * np.asarray(self.lengths, dtype="float32") / max(self.avg_length, 1.0))
+                      ).astype("float32")
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def scores(self, query):
+        # BM25 score of every chunk for the query, as a float32 array by position
+        scores = np.zeros(len(self.chunk_ids), dtype="float32")
+        total = len(self.chunk_ids)
+        for term, qtf in Counter(tokenize(query)).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            positions = self.postings[start:end]
+            tfs = self.tfs[start:end].astype("float32")
+            df = end - start
+            idf = np.log(1 + (total - df + 0.5) / (df + 0.5))
+            scores[positions] += qtf * idf * tfs * (self.k1 + 1) / (tfs + self.norms[positions])
+        return scores
+
+    def search(self, query, top_k=5, id_ranges=None):
+        # Returns (chunk_ids, scores) of the best matches, skipping chunks with no
+        # matching term; with id_ranges, only chunks inside one of those [first, end) ranges
+        scores = self.scores(query)
+        if id_ranges is not None:
+            keep = np.zeros(len(scores), dtype=bool)
+            for first, end in id_ranges:
+                keep[np.searchsorted(self.chunk_ids, first):np.searchsorted(self.chunk_ids, end)] = True
+            scores[~keep] = 0
+        if not len(scores):
+            return np.empty(0, dtype="int64"), np.empty(0, dtype="float32")
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return np.asarray(self.chunk_ids[top]), scores[top]
@@ -0,0 +1,171 @@
+# chunk_store.py
+#
+# On-disk chunk metadata, read through mmap so a lookup only touches the
+# records it returns. Layout (one directory):
+#   ids.npy       int64[n]    chunk ids, sorted
+#   offsets.npy   int64[n+1]  byte offsets of each chunk's text in text.bin
+#   sources.npy   int32[n]    index into sources.json
+#   pages.npy     int32[n]    page number, 0 if the chunk has none
+#   sections.npy  int32[n]    section number, 0 if the chunk has none
+#   starts.npy    int32[n]    character offset of the chunk in its page/section text, -1 if unknown
+#   ends.npy      int32[n]    end offset, -1 if unknown
+#   text.bin      utf-8 chunk texts, back to back
+#   sources.json  list of source file names
+
+import os
+import sys
+import json
+import mmap
+import pickle
+import numpy as np
+
+ARRAYS = ("ids", "offsets", "sources", "pages", "sections")
+OPTIONAL_ARRAYS = ("starts", "ends")  # absent in stores written before chunks had offsets
+
+def exists(directory):
+    return os.path.exists(os.path.join(directory, "ids.npy"))
+
+class ChunkStore:
+    def __init__(self, directory):
+        self.directory = directory
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="r"))
+        for name in OPTIONAL_ARRAYS:
+            path = os.path.join(directory, name + ".npy")
+            setattr(self, name, np.load(path, mmap_mode="r") if os.path.exists(path) else None)
+        with open(os.path.join(directory, "sources.json")) as f:
+            self.source_names = json.load(f)
+        self._blob_file = open(os.path.join(directory, "text.bin"), "rb")
+        size = os.fstat(self._blob_file.fileno()).st_size
+        self.blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _record(self, pos):
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        meta = {"id": int(self.ids[pos]), "source": self.source_names[int(self.sources[pos])]}
+        if self.pages[pos]:
+            meta["page"] = int(self.pages[pos])
+        if self.sections[pos]:
+            meta["section"] = int(self.sections[pos])
+        if self.starts is not None and self.starts[pos] >= 0:
+            meta["start"] = int(self.starts[pos])
+            meta["end"] = int(self.ends[pos])
+        meta["text"] = self.blob[start:end].decode("utf-8")
+        return meta
+
+    def get(self, chunk_id):
+        pos = int(np.searchsorted(self.ids, chunk_id))
+        if pos < len(self.ids) and self.ids[pos] == chunk_id:
+            return self._record(pos)
+        return None
+
+    def __getitem__(self, chunk_id):
+        meta = self.get(chunk_id)
+        if meta is None:
+            raise KeyError(chunk_id)
+        return meta
+
+    def get_many(self, chunk_ids):
+        # Skips ids that are not in the store (e.g. FAISS's -1 padding)
+        return [meta for meta in (self.get(int(i)) for i in chunk_ids) if meta is not None]
+
+    def items(self):
+        for pos in range(len(self.ids)):
+            yield int(self.ids[pos]), self._record(pos)
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self._blob_file.close()
+
+def write_store(directory, records):
+    # records: iterable of (chunk_id, meta) in increasing id order. Files are
+    # written under a .tmp suffix; call commit_store() to swap them in.
+    os.makedirs(directory, exist_ok=True)
+    ids, offsets, sources, pages, sections, starts, ends = [], [0], [], [], [], [], []
+    source_index = {}
+    with open(os.path.join(directory, "text.bin.tmp"), "wb") as blob:
+        for chunk_id, meta in records:
+            data = meta["text"].encode("utf-8")
+            blob.write(data)
+            ids.append(chunk_id)
+            offsets.append(offsets[-1] + len(data))
+            sources.append(source_index.setdefault(meta["source"], len(source_index)))
+            pages.append(meta.get("page", 0))
+            sections.append(meta.get("section", 0))
+            starts.append(meta.get("start", -1))
+            ends.append(meta.get("end", -1))
+    arrays = {
+        "ids": np.array(ids, dtype="int64"),
+        "offsets": np.array(offsets, dtype="int64"),
+        "sources": np.array(sources, dtype="int32"),
+        "pages": np.array(pages, dtype="int32"),
+        "sections": np.array(sections, dtype="int32"),
+        "starts": np.array(starts, dtype="int32"),
+        "ends": np.array(ends, dtype="int32"),
+    }
+    for name, array in arrays.items():
+        with open(os.path.join(directory, name + ".npy.tmp"), "wb") as f:
+            np.save(f, array)
+    with open(os.path.join(directory, "sources.json.tmp"), "w") as f:
+        json.dump(list(source_index), f)
+    return len(ids)
+
+def commit_store(directory):
+    for name in [a + ".npy" for a in ARRAYS + OPTIONAL_ARRAYS] + ["text.bin", "sources.json"]:
+        path = os.path.join(directory, name)
+        os.replace(path + ".tmp", path)
+
+class ChunkTable:
+    # Pending edits on top of an existing store (or None): chunk ids dropped
+    # from it plus newly added chunks. save() merges them into a new store.
+    def __init__(self, store=None):
+        self.store = store
+        self.removed = set()
+        self.added = {}
+
+    def __setitem__(self, chunk_id, meta):
+        self.added[chunk_id] = meta
+
+    def pop(self, chunk_id, default=None):
+        if chunk_id in self.added:
+            return self.added.pop(chunk_id)
+        self.removed.add(chunk_id)
+        return default
+
+    def records(self):
+        # New ids are always above the existing ones, so this stays sorted
+        if self.store is not None:
+            for chunk_id, meta in self.store.items():
+                if chunk_id not in self.removed:
+                    yield chunk_id, meta
+        for chunk_id in sorted(self.added):
+            yield chunk_id, self.added[chunk_id]
+
+    def save(self, directory):
+        count = write_store(directory, self.records())
+        # Release the old mmap before its files are replaced (required on Windows)
+        if self.store is not None:
+            self.store.close()
+        commit_store(directory)
+        self.store = ChunkStore(directory)
+        self.removed.clear()
+        self.added.clear()
+        return count
+
+def convert_pickle(pkl_path, directory):
+    # metadata.pkl held either a list (ids are positions) or an {id: chunk} dict
+    with open(pkl_path, "rb") as f:
+        metadata = pickle.load(f)
+    items = sorted(metadata.items()) if isinstance(metadata, dict) else enumerate(metadata)
+    count = write_store(directory, items)
+    commit_store(directory)
+    return count
+
+if __name__ == "__main__":
+    # python chunk_store.py [faiss_index/metadata.pkl] [faiss_index/chunks]
+    pkl_path = sys.argv[1] if len(sys.argv) > 1 else "./faiss_index/metadata.pkl"
+    directory = sys.argv[2] if len(sys.argv) > 2 else "./faiss_index/chunks"
+    print(f"Wrote {convert_pickle(pkl_path, directory)} chunks to {directory}")
@@ -0,0 +1,120 @@
+# chunker.py
+#
+# The one text chunker, used by document_ingestor and by the upload path in
+# routes.py. Chunks are produced lazily and carry the character offsets of
+# their text within the page (PDF) or document (docx/eml) they came from.
+#
+# Strategies (CHUNK_STRATEGY):
+#   sentence  sentences are packed into chunks of up to CHUNK_MAX_TOKENS, and
+#             each chunk starts with the last CHUNK_OVERLAP_TOKENS worth of
+#             sentences of the one before; a sentence longer than a whole
+#             chunk is split on token boundaries
+#   token     fixed windows of CHUNK_MAX_TOKENS tokens, CHUNK_OVERLAP_TOKENS apart
+#
+# Tokens are words and punctuation marks, a close enough stand-in for the
+# embedding model's word pieces (all-MiniLM-L6-v2 reads at most 256).
+
+import os
+import re
+
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "sentence")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "160"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "5"))  # shorter chunks (page numbers, stray headers) are dropped
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Sentence ends (not after "Rs.", "No." and the like), blank lines, and
+# line breaks that start a list item
+BOUNDARY_RE = re.compile(
+    r"(?<=[.!?;])(?<!\bRs\.)(?<!\bNo\.)(?<!\bDr\.)(?<!\bSr\.)(?<!\bvs\.)(?<!e\.g\.)(?<!i\.e\.)"
+    r"\s+(?=[\"'(\[]?[A-Z0-9])"
+    r"|\n\s*\n"
+    r"|\n(?=\s*(?:[-•*▪●]|\(?(?:[0-9]{1,3}|[a-z]|[ivx]{1,4})[.)])\s)")
+
+def settings():
+    # Recorded in the ingest manifest; documents are re-chunked when this changes
+    return {"strategy": CHUNK_STRATEGY, "max_tokens": CHUNK_MAX_TOKENS,
+            "overlap_tokens": CHUNK_OVERLAP_TOKENS, "min_tokens": CHUNK_MIN_TOKENS}
+
+def count_tokens(text):
+    return sum(1 for _ in TOKEN_RE.finditer(text))
+
+def sentence_spans(text, start=0, end=None):
+    # (start, end) of each non-blank sentence in text[start:end]
+    end = len(text) if end is None else end
+    pos = start
+    for match in BOUNDARY_RE.finditer(text, start, end):
+        yield from _trimmed(text, pos, match.start())
+        pos = match.end()
+    yield from _trimmed(text, pos, end)
+
+def _trimmed(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        yield start, end
+
+def token_windows(text, start, end, max_tokens, overlap_tokens):
+    # (start, end) spans of max_tokens tokens each, stepping by max_tokens - overlap
+    tokens = [m.span() for m in TOKEN_RE.finditer(text, start, end)]
+    step = max(1, max_tokens - overlap_tokens)
+    for first in range(0, len(tokens), step):
+        window = tokens[first:first + max_tokens]
+        yield window[0][0], window[-1][1], len(window)
+        if first + max_tokens >= len(tokens):
+            return
+
+def _sentence_chunks(text, max_tokens, overlap_tokens):
+    # Yields (start, end, tokens); a chunk always spans whole sentences unless
+    # one sentence alone is too long
+    current = []  # (start, end, tokens) of the sentences in the open chunk
+    size = 0
+    for start, end in sentence_spans(text):
+        tokens = count_tokens(text[start:end])
+        if tokens > max_tokens:
+            if current:
+                yield current[0][0], current[-1][1], size
+                current, size = [], 0
+            yield from token_windows(text, start, end, max_tokens, overlap_tokens)
+            continue
+        if current and size + tokens > max_tokens:
+            yield current[0][0], current[-1][1], size
+            # Carry the tail of the chunk over as overlap, as long as it leaves room
+            carried, carried_size = [], 0
+            for sentence in reversed(current[1:]):
+                if carried_size + sentence[2] > overlap_tokens or carried_size + sentence[2] + tokens > max_tokens:
+                    break
+                carried.insert(0, sentence)
+                carried_size += sentence[2]
+            current, size = carried, carried_size
+        current.append((start, end, tokens))
+        size += tokens
+    if current:
+        yield current[0][0], current[-1][1], size
+
+def chunk_text(text, max_tokens=None, overlap_tokens=None, strategy=None):
+    # Generator of {"text", "start", "end"}; start/end index into `text` and the
+    # chunk text has its whitespace (PDF line breaks) collapsed
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy == "token":
+        spans = token_windows(text, 0, len(text), max_tokens, overlap_tokens)
+    elif strategy == "sentence":
+        spans = _sentence_chunks(text, max_tokens, overlap_tokens)
+    else:
+        raise ValueError(f"Unknown CHUNK_STRATEGY {strategy!r}; expected 'sentence' or 'token'")
+    for start, end, tokens in spans:
+        if tokens >= CHUNK_MIN_TOKENS:
+            yield {"text": " ".join(text[start:end].split()), "start": start, "end": end}
+
+def chunk_unit(source, page, text, **kwargs):
+    # Chunk metadata for one extracted unit: a PDF page (page is its number) or
+    # a whole docx/eml (page is None; chunks are numbered as sections)
+    for idx, chunk in enumerate(chunk_text(text, **kwargs)):
+        if page is not None:
+            yield {"source": source, "page": page, **chunk}
+        else:
+            yield {"source": source, "section": idx + 1, **chunk}
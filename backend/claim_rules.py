@@ -0,0 +1,338 @@
+# claim_rules.py
+#
+# Deterministic pre-screen that runs before the LLM. Waiting-period,
+# entry-age and exclusion rules are compiled into an evaluator that checks
+# the parsed query (age, procedure, policy_duration_months) against them.
+# When a rule settles the claim for every policy the retrieved clauses come
+# from, the decision comes back at once with the clause it rests on and the
+# LLM is never called.
+#
+# Rules come from two files:
+#   faiss_index/claim_rules.json  extracted from the indexed clauses by the ingestor (extract_rules)
+#   claim_rules.json              maintained by hand, next to this file (CLAIM_RULES_FILE)
+# Each rule is {"id", "kind", "clause": {"text", "source", "page" or "section"}}
+# scoped by "sources" (file names) or "insurers" (codes, see shards.py), plus:
+#   waiting_period  "days", "period" ("24 months"), "conditions" (terms the
+#                   query must mention; empty = every claim), "accident_exempt",
+#                   "continuity_exception"
+#   age_limit       "max_entry_age", "continuity_exception"
+#   exclusion       "procedures" (terms), "unless" (terms that lift it)
+#
+# Only rejections are decided here: they need no payout amount, and a rule
+# fires only when the parsed fields settle it beyond doubt. A 3-month-old
+# policy is inside a 24-month waiting period; a policy of unknown age is
+# not. Queries mentioning an accident never trip an accident-exempt rule.
+# The policy's age stands for the length of cover, so a query mentioning a
+# renewal, port or earlier policy is left to the LLM; so is a rule whose
+# clause credits earlier cover to every insured. The standard portability
+# paragraph ("if the insured is continuously covered ... as defined under the
+# portability norms") only helps an insured who ported, and leaves the rule
+# be. Uploaded files go to the LLM too: the rules describe the indexed
+# documents only.
+# Anything less clear-cut goes to the LLM as before.
+
+import os
+import re
+import json
+import threading
+import shards
+import semantic_search
+import llm_reasoner
+
+CLAIM_RULES_ENABLED = os.getenv("CLAIM_RULES", "1") == "1"
+CLAIM_RULES_FILE = os.getenv(
+    "CLAIM_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "claim_rules.json"))
+EXTRACTED_RULES_PATH = "./faiss_index/claim_rules.json"
+
+KINDS = ("waiting_period", "age_limit", "exclusion")
+
+ACCIDENT_TERMS = ["accident", "injur", "trauma", "fracture", "burn"]  # matched as word prefixes
+PED_TERMS = ["pre-existing", "pre existing", "preexisting", "PED"]
+
+# Terms of the standard "specified disease/procedure" lists (IRDAI Excl02) ->
+# the terms a query names them by
+LISTED_CONDITIONS = {
+    "cataract": ["cataract"],
+    "hernia": ["hernia"],
+    "hydrocele": ["hydrocele"],
+    "hysterectomy": ["hysterectomy"],
+    "fibroid": ["fibroid", "fibromyoma", "myomectomy"],
+    "fibromyoma": ["fibroid", "fibromyoma", "myomectomy"],
+    "haemorrhoids": ["haemorrhoid", "hemorrhoid", "piles"],
+    "hemorrhoids": ["haemorrhoid", "hemorrhoid", "piles"],
+    "fistula": ["fistula"],
+    "tonsil": ["tonsil", "tonsillectomy"],
+    "adenoid": ["adenoid", "adenoidectomy"],
+    "nasal septum": ["nasal septum", "septoplasty"],
+    "joint replacement": ["joint replacement", "knee replacement", "hip replacement"],
+    "cholecystectomy": ["cholecystectomy", "gall bladder removal", "gallbladder removal"],
+    "varicose": ["varicose"],
+    "prostatic hypertrophy": ["prostate enlargement", "prostatic hypertrophy", "BPH"],
+    "endometriosis": ["endometriosis"],
+}
+LISTED_SPAN = 8000  # characters after the clause searched for its list of conditions
+EXCEPTION_SPAN = 600  # characters after a clause searched for a continuity exception
+
+INITIAL_WAITING_RES = [
+    re.compile(r"(\d+)\s*days'?\s+waiting period (?:would|shall|will) (?:be )?appl\w*\s+(?:for|to)\s+all claims"
+               r"\s+except[^.]*?accident", re.IGNORECASE),
+    re.compile(r"treatment of any illness within (\d+) days from the (?:first )?policy "
+               r"(?:commencement|inception|start) date shall be excluded except[^.]*?accident", re.IGNORECASE),
+]
+PED_WAITING_RE = re.compile(r"pre[- ]existing disease[^.]{0,80}?excluded until the expiry of (\d+) months", re.IGNORECASE)
+LISTED_WAITING_RE = re.compile(
+    r"listed conditions, surgeries/treatments shall be excluded until the expiry of (\d+) months", re.IGNORECASE)
+LISTED_END_RE = re.compile(r"Excl\s*0?3\b")
+ENTRY_AGE_RES = [
+    re.compile(r"not older than (\d+) years of age at the commencement", re.IGNORECASE),
+    re.compile(r"entry age[^.]{0,80}?(?:between|from)\s+\d+\s*(?:days|months|years)\s+(?:to|and)\s+(\d+)\s*years",
+               re.IGNORECASE),
+]
+# Cover carried over from an earlier policy, shortening the wait or lifting the age limit
+CARRY_OVER_RE = re.compile(
+    r"\b(?:reduced|credit\w*|counted|waived|set off)\b[^.]{0,80}?"
+    r"\b(?:prior|previous|earlier|expiring|existing) (?:coverage|cover|insurance|polic\w*|insurer)", re.IGNORECASE)
+# ...unless only for an insured who ported or migrated
+PORTED_ONLY_RE = re.compile(r"\bif\b[^.]{0,200}?\b(?:portab|migrat)\w*", re.IGNORECASE)
+QUERY_CONTINUITY_RE = re.compile(
+    r"renew\w*|\bport(?:ed|ing|ability)?\b|migrat\w*|continu\w* (?:cover\w*|polic\w*)"
+    r"|(?:previous|prior|earlier|old) (?:polic\w*|insurer|cover\w*)", re.IGNORECASE)
+EXCLUSION_MARKER_RE = re.compile(r"\bExcl\s*\d+|\bexclusions?\b|\bexcluded\b|not covered|not payable", re.IGNORECASE)
+EXCLUSIONS = [
+    {"id": "cosmetic_surgery",
+     "clause": re.compile(r"cosmetic (?:or plastic )?(?:treatment|surgery)|plastic surgery", re.IGNORECASE),
+     "procedures": ["cosmetic", "plastic surgery", "aesthetic", "liposuction"],
+     "unless": ACCIDENT_TERMS + ["reconstruct", "cancer"]},
+    {"id": "gender_change",
+     "clause": re.compile(r"change of gender|gender reassignment|sex change", re.IGNORECASE),
+     "procedures": ["gender reassignment", "sex change", "change of gender"],
+     "unless": []},
+]
+
+def terms_re(terms, prefix=False):
+    # Whole words (plurals too), or any word starting with a term
+    if not terms:
+        return None
+    end = "" if prefix else r"(?:e?s)?\b"
+    return re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + ")" + end, re.IGNORECASE)
+
+ACCIDENT_RE = terms_re(ACCIDENT_TERMS, prefix=True)
+
+# --- Extraction from the indexed clauses ---
+
+def sentence_at(text, start, end):
+    # The sentence around text[start:end]
+    first = text.rfind(". ", 0, start)
+    last = text.find(". ", end)
+    return " ".join(text[first + 2 if first >= 0 else 0:last + 1 if last >= 0 else len(text)].split())
+
+def clause_of(meta, text):
+    clause = {"text": text, "source": meta["source"]}
+    for field in ("page", "section"):
+        if field in meta:
+            clause[field] = meta[field]
+    return clause
+
+def continuity_exception(sentence, after, span=EXCEPTION_SPAN):
+    # A sentence of the clause, or of the text after it, carrying earlier cover over
+    text = sentence + " " + after[:span]
+    return any(CARRY_OVER_RE.search(s) and not PORTED_ONLY_RE.search(s) for s in text.split(". "))
+
+def rules_in_chunk(meta, following):
+    # Rules stated in one chunk; `following` is the text of the chunks after it
+    # in the same document, where a list of conditions may continue
+    text = meta["text"]
+    source = meta["source"]
+    for pattern in INITIAL_WAITING_RES:
+        for m in pattern.finditer(text):
+            sentence = sentence_at(text, m.start(), m.end())
+            yield {"id": "initial_waiting_period", "kind": "waiting_period", "sources": [source],
+                   "days": int(m.group(1)), "period": f"{int(m.group(1))} days", "conditions": [],
+                   "accident_exempt": True,
+                   "continuity_exception": continuity_exception(sentence, text[m.end():] + " " + following),
+                   "clause": clause_of(meta, sentence)}
+    for m in PED_WAITING_RE.finditer(text):
+        months = int(m.group(1))
+        sentence = sentence_at(text, m.start(), m.end())
+        yield {"id": "pre_existing_disease_waiting_period", "kind": "waiting_period", "sources": [source],
+               "days": months * 30, "period": f"{months} months", "conditions": PED_TERMS,
+               "accident_exempt": True,
+               "continuity_exception": continuity_exception(sentence, text[m.end():] + " " + following),
+               "clause": clause_of(meta, sentence)}
+    for m in LISTED_WAITING_RE.finditer(text):
+        months = int(m.group(1))
+        window = (text[m.end():] + " " + following)[:LISTED_SPAN]
+        end = LISTED_END_RE.search(window)
+        window = window[:end.start()] if end else window
+        conditions = sorted({term for listed, terms in LISTED_CONDITIONS.items()
+                             if re.search(r"\b" + re.escape(listed), window, re.IGNORECASE) for term in terms})
+        if conditions:
+            # The exception, if any, follows the whole list
+            sentence = sentence_at(text, m.start(), m.end())
+            yield {"id": "listed_conditions_waiting_period", "kind": "waiting_period", "sources": [source],
+                   "days": months * 30, "period": f"{months} months", "conditions": conditions,
+                   "accident_exempt": True,
+                   "continuity_exception": continuity_exception(sentence, window, span=LISTED_SPAN),
+                   "clause": clause_of(meta, sentence)}
+    for pattern in ENTRY_AGE_RES:
+        for m in pattern.finditer(text):
+            sentence = sentence_at(text, m.start(), m.end())
+            yield {"id": "max_entry_age", "kind": "age_limit", "sources": [source], "max_entry_age": int(m.group(1)),
+                   "continuity_exception": continuity_exception(sentence, text[m.end():] + " " + following),
+                   "clause": clause_of(meta, sentence)}
+    if EXCLUSION_MARKER_RE.search(text):
+        for exclusion in EXCLUSIONS:
+            m = exclusion["clause"].search(text)
+            if m:
+                yield {"id": exclusion["id"], "kind": "exclusion", "sources": [source],
+                       "procedures": exclusion["procedures"], "unless": exclusion["unless"],
+                       "clause": clause_of(meta, sentence_at(text, m.start(), m.end()))}
+
+def rule_value(rule):
+    # What two statements of the same rule must agree on
+    return {k: v for k, v in rule.items() if k not in ("clause", "conditions")}
+
+def extract_rules(items, following_chunks=6):
+    # Rules from (chunk id, meta) pairs in id order (ChunkStore.items()). A
+    # document stating the same rule with different values (two entry ages,
+    # say) gets neither: the rule isn't clear-cut for it.
+    chunks = [meta for _, meta in items]
+    found = {}
+    for i, meta in enumerate(chunks):
+        following = " ".join(c["text"] for c in chunks[i + 1:i + 1 + following_chunks]
+                             if c["source"] == meta["source"])
+        for rule in rules_in_chunk(meta, following):
+            key = (meta["source"], rule["id"])
+            if key not in found:
+                found[key] = rule
+            elif found[key] is not None and rule_value(found[key]) != rule_value(rule):
+                found[key] = None
+            elif found[key] is not None and rule["kind"] == "waiting_period":
+                found[key]["conditions"] = sorted(set(found[key]["conditions"]) | set(rule["conditions"]))
+    return [rule for _, rule in sorted(found.items()) if rule is not None]
+
+# --- Evaluation ---
+
+def fires(rule, query, parsed):
+    # The reason the rule rejects this claim, or None
+    kind = rule["kind"]
+    months = parsed.get("policy_duration_months")
+    if kind in ("waiting_period", "age_limit"):
+        # The policy's age may not be the length of cover
+        if rule.get("continuity_exception") or QUERY_CONTINUITY_RE.search(query):
+            return None
+    if kind == "waiting_period":
+        if months is None or (rule.get("accident_exempt") and ACCIDENT_RE.search(query)):
+            return None
+        if rule["conditions_re"] is not None and not rule["conditions_re"].search(query):
+            return None
+        # Durations are in whole months: even the last day of the stated month must be inside the period
+        if months * 30 + 30 <= rule["days"]:
+            return f"The policy is {months} months old, inside the waiting period of {rule['period']}"
+        return None
+    if kind == "age_limit":
+        age = parsed.get("age")
+        if age is None or months is None:
+            return None
+        # Youngest the insured can have been when the policy started
+        if age - months / 12 - 1 > rule["max_entry_age"]:
+            return f"A {age}-year-old with a {months}-month-old policy was over the maximum entry age of {rule['max_entry_age']}"
+        return None
+    if kind == "exclusion":
+        text = " ".join(filter(None, [query, parsed.get("procedure")]))
+        if not rule["procedures_re"].search(text):
+            return None
+        if rule["unless_re"] is not None and rule["unless_re"].search(text):
+            return None
+        return f"{rule['id'].replace('_', ' ').capitalize()} is excluded"
+    return None
+
+def compile_rule(rule):
+    compiled = dict(rule)
+    compiled["conditions_re"] = terms_re(rule.get("conditions"))
+    compiled["procedures_re"] = terms_re(rule.get("procedures"))
+    compiled["unless_re"] = terms_re(rule.get("unless"), prefix=True)
+    return compiled
+
+class RuleEngine:
+    def __init__(self, paths=(EXTRACTED_RULES_PATH, CLAIM_RULES_FILE)):
+        self.paths = paths
+        self._lock = threading.Lock()
+        self._by_source = None
+        self._by_insurer = None
+        self.version = None
+        self.rules_loaded = 0
+        self.evaluated = 0
+        self.short_circuited = 0
+        self.fired = {kind: 0 for kind in KINDS}
+
+    def load(self):
+        # Re-read whenever the ingestor writes a new index, like semantic_search.current()
+        version = semantic_search.index_version()
+        if self._by_source is None or version != self.version:
+            with self._lock:
+                if self._by_source is None or version != self.version:
+                    by_source, by_insurer = {}, {}
+                    rules_loaded = 0
+                    for path in self.paths:
+                        if not os.path.exists(path):
+                            continue
+                        with open(path) as f:
+                            rules = json.load(f)["rules"]
+                        for rule in rules:
+                            compiled = compile_rule(rule)
+                            for source in rule.get("sources", []):
+                                by_source.setdefault(source, []).append(compiled)
+                            for code in rule.get("insurers", []):
+                                by_insurer.setdefault(code.upper(), []).append(compiled)
+                        rules_loaded += len(rules)
+                    self._by_source, self._by_insurer = by_source, by_insurer
+                    self.rules_loaded = rules_loaded
+                    self.version = version
+
+    def rules_for(self, source):
+        return self._by_source.get(source, []) + self._by_insurer.get(shards.insurer_code(source), [])
+
+    def evaluate(self, query, parsed, clauses):
+        # A rejection decided by rules for every document among `clauses`, or
+        # None when any of them needs the LLM
+        self.load()
+        self.evaluated += 1
+        # Uploaded clauses have no chunk id; an upload named like an indexed
+        # document isn't necessarily that document
+        if not clauses or any("id" not in c for c in clauses):
+            return None
+        sources = list(dict.fromkeys(c["source"] for c in clauses))
+        applied = []
+        for source in sources:
+            for rule in self.rules_for(source):
+                reason = fires(rule, query, parsed)
+                if reason is not None:
+                    applied.append((source, rule, reason))
+                    break
+            else:
+                return None
+        self.short_circuited += 1
+        for _, rule, _ in applied:
+            self.fired[rule["kind"]] += 1
+        return {
+            "decision": "Rejected",
+            "amount": 0,
+            "justification": " ".join(
+                f"{source}: {reason} ({llm_reasoner.clause_label(rule['clause'])}: \"{rule['clause']['text']}\")."
+                for source, rule, reason in applied),
+            "rules": [{"id": rule["id"], "kind": rule["kind"], "source": source, "clause": rule["clause"]}
+                      for source, rule, _ in applied],
+        }
+
+    def stats(self):
+        return {
+            "enabled": CLAIM_RULES_ENABLED,
+            "rules_loaded": self.rules_loaded,
+            "evaluated": self.evaluated,
+            "short_circuited": self.short_circuited,
+            "short_circuit_rate": self.short_circuited / self.evaluated if self.evaluated else 0.0,
+            **{f"fired_{kind}": n for kind, n in self.fired.items()},
+        }
+
+engine = RuleEngine()
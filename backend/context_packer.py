@@ -0,0 +1,173 @@
+# context_packer.py
+#
+# Chooses which retrieved clauses go into the LLM prompt and how much of
+# each. Clauses arrive best-first from retrieval and go through three steps:
+#   1. near-duplicate removal: a clause mostly contained in a better-ranked
+#      one (overlapping fragments, boilerplate shared across insurers) is dropped
+#   2. MMR: the rest are reordered to trade relevance against redundancy,
+#      using the stored clause embeddings (word overlap for uploads, which
+#      have none on disk)
+#   3. packing: clauses are added in that order until CONTEXT_TOKEN_BUDGET
+#      is spent, each cut to at most CONTEXT_MAX_CLAUSE_TOKENS
+# Token counts use tiktoken when it is installed and an estimate otherwise.
+
+import os
+import re
+import threading
+import numpy as np
+import semantic_search
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))  # tokens for all clauses together
+CONTEXT_MAX_CLAUSE_TOKENS = int(os.getenv("CONTEXT_MAX_CLAUSE_TOKENS", "400"))
+CONTEXT_MIN_CLAUSE_TOKENS = 40  # don't bother adding a clause cut shorter than this
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # shingle containment
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only
+SHINGLE_SIZE = 3
+TRUNCATION_MARK = " ..."  # appended to a cut clause
+
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+def get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.encoding_for_model(os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+        except KeyError:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly one token per word or punctuation mark, a bit more for long words
+    return sum(1 + len(w) // 8 for w in WORD_RE.findall(text))
+
+def truncate_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_tokens -= count_tokens(TRUNCATION_MARK)  # leave room for the mark
+    encoding = get_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text)[:max_tokens])
+    else:
+        cut, used = [], 0
+        for match in re.finditer(r"\S+\s*", text):
+            used += count_tokens(match.group(0))
+            if used > max_tokens:
+                break
+            cut.append(match.group(0))
+        cut = "".join(cut)
+    # Prefer ending on a sentence boundary if one is reasonably close
+    end = max(cut.rfind(". "), cut.rfind(".\n"))
+    if end > len(cut) * 0.6:
+        cut = cut[:end + 1]
+    return cut.rstrip() + TRUNCATION_MARK
+
+def shingles(text):
+    words = text.lower().split()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+
+def drop_near_duplicates(clauses, threshold=CONTEXT_DEDUP_THRESHOLD):
+    # Keeps the better-ranked of any pair where most of one clause's shingles
+    # appear in the other
+    kept, kept_shingles = [], []
+    for clause in clauses:
+        s = shingles(clause["text"])
+        if any(len(s & k) / max(1, min(len(s), len(k))) >= threshold for k in kept_shingles):
+            continue
+        kept.append(clause)
+        kept_shingles.append(s)
+    return kept
+
+def similarity_matrix(clauses):
+    vectors = semantic_search.clause_vectors([c["id"] for c in clauses]) if all("id" in c for c in clauses) else None
+    if vectors is not None and all(v is not None for v in vectors):
+        matrix = np.stack(vectors).astype("float32")
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8
+        return matrix @ matrix.T
+    # Jaccard over word sets
+    sets = [set(c["text"].lower().split()) for c in clauses]
+    return np.array([[len(a & b) / max(1, len(a | b)) for b in sets] for a in sets], dtype="float32")
+
+def mmr_order(clauses, lambda_=CONTEXT_MMR_LAMBDA):
+    # Retrieval already ranked the clauses, so relevance is taken from the
+    # rank (1.0 for the first, falling linearly) rather than re-scored
+    if len(clauses) < 3:
+        return clauses
+    sims = similarity_matrix(clauses)
+    relevance = 1.0 - np.arange(len(clauses)) / len(clauses)
+    order = [0]
+    remaining = list(range(1, len(clauses)))
+    while remaining:
+        scores = [lambda_ * relevance[i] - (1 - lambda_) * max(sims[i][j] for j in order) for i in remaining]
+        order.append(remaining.pop(int(np.argmax(scores))))
+    return [clauses[i] for i in order]
+
+def pack(clauses, budget=CONTEXT_TOKEN_BUDGET, max_clause_tokens=CONTEXT_MAX_CLAUSE_TOKENS):
+    packed = []
+    remaining = budget
+    for clause in clauses:
+        limit = min(max_clause_tokens, remaining)
+        if limit < CONTEXT_MIN_CLAUSE_TOKENS:
+            break
+        text = truncate_tokens(clause["text"], limit)
+        packed.append(dict(clause, text=text) if text != clause["text"] else clause)
+        remaining -= count_tokens(text)
+    return packed
+
+class PackerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.clauses_in = 0
+        self.clauses_out = 0
+        self.duplicates_dropped = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def record(self, clauses_in, deduped, clauses_out, tokens_in, tokens_out):
+        with self._lock:
+            self.prompts += 1
+            self.clauses_in += clauses_in
+            self.duplicates_dropped += clauses_in - deduped
+            self.clauses_out += clauses_out
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+
+    def stats(self):
+        saved = self.tokens_in - self.tokens_out
+        return {
+            "enabled": CONTEXT_PACKING,
+            "token_budget": CONTEXT_TOKEN_BUDGET,
+            "max_clause_tokens": CONTEXT_MAX_CLAUSE_TOKENS,
+            "tokenizer": "tiktoken" if get_encoding() is not None else "estimate",
+            "prompts": self.prompts,
+            "clauses_in": self.clauses_in,
+            "clauses_out": self.clauses_out,
+            "duplicates_dropped": self.duplicates_dropped,
+            "clause_tokens_in": self.tokens_in,
+            "clause_tokens_out": self.tokens_out,
+            "clause_tokens_saved": saved,
+            "saved_ratio": saved / self.tokens_in if self.tokens_in else 0.0,
+            "avg_tokens_saved_per_prompt": saved / self.prompts if self.prompts else 0.0,
+        }
+
+stats = PackerStats()
+
+def assemble_context(clauses):
+    # Returns the clauses to put in the prompt, in prompt order
+    if not CONTEXT_PACKING or not clauses:
+        return clauses
+    deduped = drop_near_duplicates(clauses)
+    packed = pack(mmr_order(deduped))
+    stats.record(len(clauses), len(deduped), len(packed),
+                 sum(count_tokens(c["text"]) for c in clauses), sum(count_tokens(c["text"]) for c in packed))
+    return packed
@@ -0,0 +1,191 @@
+# decision_cache.py
+#
+# Caches LLM replies from llm_reasoner keyed on a hash of the normalized
+# prompt (query + parsed fields + retrieved clauses) and the model name.
+# An in-process LRU is always used; DECISION_CACHE_BACKEND=sqlite|mongo adds
+# a persistent layer shared across workers and restarts.
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import workers
+
+CACHE_ENABLED = os.getenv("DECISION_CACHE", "1") == "1"
+CACHE_BACKEND = os.getenv("DECISION_CACHE_BACKEND", "memory")  # memory | sqlite | mongo
+CACHE_MAX_ENTRIES = int(os.getenv("DECISION_CACHE_MAX_ENTRIES", "1024"))  # in-process LRU
+CACHE_PERSISTENT_MAX_ENTRIES = int(os.getenv("DECISION_CACHE_PERSISTENT_MAX_ENTRIES", "100000"))
+CACHE_TTL = float(os.getenv("DECISION_CACHE_TTL", "86400"))  # seconds
+CACHE_SQLITE_PATH = os.getenv("DECISION_CACHE_SQLITE_PATH", "./decision_cache.sqlite3")
+
+def cache_key(prompt: str, model: str):
+    # Case and whitespace differences in the prompt shouldn't cause a miss
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+class LRUCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    def __init__(self, path, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS decisions_accessed ON decisions (accessed_at)")
+        self._conn.commit()
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM decisions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM decisions WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE decisions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?)", (key, value, now, now))
+            # Drop expired rows, then the least recently used beyond the size cap
+            self._conn.execute("DELETE FROM decisions WHERE stored_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM decisions WHERE key IN (SELECT key FROM decisions ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self._conn.commit()
+
+    async def get(self, key):
+        return await workers.run_cpu(self._get, key)
+
+    async def set(self, key, value):
+        await workers.run_cpu(self._set, key, value)
+
+class MongoBackend:
+    def __init__(self, collection, max_entries, ttl):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            # Mongo's TTL monitor removes expired entries on its own
+            await self.collection.create_index("stored_at", expireAfterSeconds=int(self.ttl))
+            await self.collection.create_index("accessed_at")
+            self._indexed = True
+
+    async def get(self, key):
+        await self._ensure_indexes()
+        doc = await self.collection.find_one_and_update(
+            {"_id": key}, {"$set": {"accessed_at": time.time()}}, projection={"value": 1, "stored_at": 1})
+        if doc is None:
+            return None
+        # pymongo hands back naive UTC datetimes
+        stored_at = doc["stored_at"].replace(tzinfo=timezone.utc).timestamp()
+        if time.time() - stored_at > self.ttl:
+            return None
+        return doc["value"], stored_at
+
+    async def set(self, key, value):
+        await self._ensure_indexes()
+        now = time.time()
+        await self.collection.replace_one(
+            {"_id": key},
+            # TTL indexes only work on BSON dates
+            {"value": value, "stored_at": datetime.fromtimestamp(now, tz=timezone.utc), "accessed_at": now},
+            upsert=True)
+        excess = await self.collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            oldest = self.collection.find({}, {"_id": 1}).sort("accessed_at", 1).limit(excess)
+            ids = [doc["_id"] async for doc in oldest]
+            await self.collection.delete_many({"_id": {"$in": ids}})
+
+def make_backend(name):
+    if name == "sqlite":
+        return SQLiteBackend(CACHE_SQLITE_PATH, CACHE_PERSISTENT_MAX_ENTRIES, CACHE_TTL)
+    if name == "mongo":
+        import mongodb
+        return MongoBackend(mongodb.db.decision_cache, CACHE_PERSISTENT_MAX_ENTRIES, CACHE_TTL)
+    return None
+
+class DecisionCache:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, backend=None):
+        self.memory = LRUCache(max_entries, ttl)
+        self.backend = backend
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            found = await self.backend.get(key)
+            if found is not None:
+                value, stored_at = found
+                self.memory.set(key, value, stored_at)
+                self.persistent_hits += 1
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key, value):
+        self.memory.set(key, value)
+        if self.backend is not None:
+            await self.backend.set(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": CACHE_ENABLED,
+            "backend": CACHE_BACKEND,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_max_entries": self.memory.max_entries,
+            "ttl_seconds": self.memory.ttl,
+        }
+
+cache = DecisionCache(backend=make_backend(CACHE_BACKEND) if CACHE_ENABLED else None)
@@ -1,39 +1,35 @@
 import os
+import time
+import json
+import shutil
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 import numpy as np
 import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
+import faiss_indexes
+import chunk_store
+import bm25_index
+import chunker
+import shards
+import claim_rules
+import embeddings
 from docx import Document
-import email
 from email import policy
 from email.parser import BytesParser
 
-# Initialize model
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-
 # Where your documents are located
 DOC_DIR = "./data/"
 FAISS_DIR = "./faiss_index/"
 os.makedirs(FAISS_DIR, exist_ok=True)
 
-# To store embeddings and metadata
-embeddings = []
-metadata = []
-
-def chunk_text(text, max_chunk_size=300):
-    # Basic chunking by newlines
-    chunks = []
-    current = ""
-    for line in text.split("\n"):
-        if len(current) + len(line) < max_chunk_size:
-            current += " " + line
-        else:
-            chunks.append(current.strip())
-            current = line
-    if current:
-        chunks.append(current.strip())
-    return chunks
+# Pipeline tuning
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))  # chunks handed to one encode() call
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "64"))  # batch_size passed to encode()
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
 
 def extract_text_from_docx(docx_path):
     doc = Document(docx_path)
@@ -54,60 +50,459 @@ def extract_text_from_eml(eml_path):
         return msg.get_content()
     return ""
 
-def ingest_documents():
-    for filename in os.listdir(DOC_DIR):
+class StageStats:
+    # Wall time spent inside one pipeline stage and the chunks it produced
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.chunks = 0
+
+    def rate(self):
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def report(self):
+        print(f"  {self.name:<10} {self.chunks:>7} chunks  {self.seconds:8.2f}s  {self.rate():10.1f} chunks/sec")
+
+# --- Stage 1: text extraction (runs in a process pool) ---
+
+def extraction_tasks(doc_dir, filenames):
+    # Large PDFs are split into page ranges so one file can use several workers
+    for filename in filenames:
+        path = os.path.join(doc_dir, filename)
         if filename.endswith(".pdf"):
-            pdf_path = os.path.join(DOC_DIR, filename)
-            doc = fitz.open(pdf_path)
-            for page_num, page in enumerate(doc):
-                text = page.get_text()
-                chunks = chunk_text(text)
-                for chunk in chunks:
-                    vector = embedding_model.encode(chunk)
-                    embeddings.append(vector)
-                    metadata.append({
-                        "source": filename,
-                        "page": page_num + 1,
-                        "text": chunk
-                    })
-        elif filename.endswith(".docx"):
-            docx_path = os.path.join(DOC_DIR, filename)
-            text = extract_text_from_docx(docx_path)
-            chunks = chunk_text(text)
-            for idx, chunk in enumerate(chunks):
-                vector = embedding_model.encode(chunk)
-                embeddings.append(vector)
-                metadata.append({
-                    "source": filename,
-                    "section": idx + 1,
-                    "text": chunk
-                })
-        elif filename.endswith(".eml"):
-            eml_path = os.path.join(DOC_DIR, filename)
-            text = extract_text_from_eml(eml_path)
-            chunks = chunk_text(text)
-            for idx, chunk in enumerate(chunks):
-                vector = embedding_model.encode(chunk)
-                embeddings.append(vector)
-                metadata.append({
-                    "source": filename,
-                    "section": idx + 1,
-                    "text": chunk
-                })
-
-    print(f"Ingested {len(embeddings)} chunks from documents")
-
-    # Save FAISS index
-    if embeddings:
-        dim = len(embeddings[0])
-        index = faiss.IndexFlatL2(dim)
-        index.add(np.array(embeddings).astype('float32'))
-        faiss.write_index(index, os.path.join(FAISS_DIR, "clause_index.faiss"))
-        # Save metadata alongside FAISS
-        with open(os.path.join(FAISS_DIR, "metadata.pkl"), "wb") as f:
-            pickle.dump(metadata, f)
-    else:
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                yield (path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+        elif filename.endswith(".docx") or filename.endswith(".eml"):
+            yield (path, None, None)
+
+def extract_task(task):
+    # Returns a list of (source, page, text); page is None for docx/eml
+    path, start, stop = task
+    filename = os.path.basename(path)
+    if filename.endswith(".pdf"):
+        with fitz.open(path) as doc:
+            return [(filename, page_num + 1, doc[page_num].get_text()) for page_num in range(start, stop)]
+    elif filename.endswith(".docx"):
+        return [(filename, None, extract_text_from_docx(path))]
+    elif filename.endswith(".eml"):
+        return [(filename, None, extract_text_from_eml(path))]
+    return []
+
+def timed(iterable, stats):
+    # Charges the time spent producing each item to the given stage
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.seconds += time.perf_counter() - start
+            return
+        stats.seconds += time.perf_counter() - start
+        yield item
+
+# --- Stage 2: streaming chunk generator ---
+
+def iter_chunks(units, extract_stats):
+    # Chunk sizes and overlap come from CHUNK_* settings, see chunker.py
+    for source, page, text in units:
+        for meta in chunker.chunk_unit(source, page, text):
+            extract_stats.chunks += 1
+            yield meta
+
+def iter_batches(items, batch_size):
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# --- Stage 3: batched embedding ---
+
+def embed_batches(batches, embed_stats, encode_batch_size=ENCODE_BATCH_SIZE):
+    # The model loads lazily here, so extraction worker processes never load it
+    embeddings.get_model()
+    for batch in batches:
+        start = time.perf_counter()
+        vectors = embeddings.encode([m["text"] for m in batch], batch_size=encode_batch_size)
+        embed_stats.seconds += time.perf_counter() - start
+        embed_stats.chunks += len(batch)
+        yield batch, np.asarray(vectors, dtype="float32")
+
+def run_pipeline(doc_dir, filenames, index, metadata, manifest, workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE):
+    # Embeds the given files under sequential ids starting at manifest["next_id"].
+    # Vectors always go to the per-document vector store; they are also added to
+    # `index` straight away unless it is None (i.e. it will be rebuilt afterwards).
+    # Returns {source: [first_id, end_id]}.
+    extract_stats = StageStats("extract")
+    chunk_stats = StageStats("chunk")
+    embed_stats = StageStats("embed")
+    write_stats = StageStats("write")
+
+    id_ranges = {}
+    next_id = manifest["next_id"]
+    os.makedirs(VECTOR_DIR, exist_ok=True)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = list(extraction_tasks(doc_dir, filenames))
+        units = itertools.chain.from_iterable(timed(pool.map(extract_task, tasks), extract_stats))
+        chunks = timed(iter_chunks(units, extract_stats), chunk_stats)
+        batches = iter_batches(chunks, batch_size)
+        for batch, vectors in embed_batches(batches, embed_stats):
+            chunk_stats.chunks += len(batch)
+            # Write each batch out as soon as it is encoded
+            start = time.perf_counter()
+            manifest["dim"] = vectors.shape[1]
+            ids = np.arange(next_id, next_id + len(batch), dtype="int64")
+            if index is not None:
+                index.add_with_ids(vectors, ids)
+            append_vectors(batch, vectors)
+            for chunk_id, meta in zip(ids.tolist(), batch):
+                metadata[chunk_id] = meta
+                id_ranges.setdefault(meta["source"], [chunk_id, chunk_id])[1] = chunk_id + 1
+            next_id += len(batch)
+            write_stats.seconds += time.perf_counter() - start
+            write_stats.chunks += len(batch)
+
+    manifest["next_id"] = next_id
+    # The chunk stage timer also covered the extraction it pulled from
+    chunk_stats.seconds = max(chunk_stats.seconds - extract_stats.seconds, 0.0)
+
+    elapsed = time.perf_counter() - started
+    print(f"Ingested {embed_stats.chunks} chunks from {len(filenames)} documents in {elapsed:.2f}s")
+    for stats in (extract_stats, chunk_stats, embed_stats, write_stats):
+        stats.report()
+
+    return id_ranges
+
+# --- Incremental index state ---
+
+INDEX_PATH = os.path.join(FAISS_DIR, "clause_index.faiss")
+# Chunk texts and source/page info, see chunk_store.py
+STORE_DIR = os.path.join(FAISS_DIR, "chunks")
+# BM25 inverted index over the same chunks, see bm25_index.py
+BM25_DIR = os.path.join(FAISS_DIR, "bm25")
+# Per-insurer (or per-source) indexes, see shards.py
+SHARD_DIR = os.path.join(FAISS_DIR, "shards")
+SHARDS_PATH = os.path.join(SHARD_DIR, "shards.json")
+# Waiting-period, entry-age and exclusion rules found in the chunks, see claim_rules.py
+RULES_PATH = os.path.join(FAISS_DIR, "claim_rules.json")
+LEGACY_META_PATH = os.path.join(FAISS_DIR, "metadata.pkl")
+MANIFEST_PATH = os.path.join(FAISS_DIR, "manifest.json")
+# Raw float32 vectors per source file, so the index can be retrained or
+# rebuilt (e.g. after switching INDEX_TYPE) without re-embedding anything
+VECTOR_DIR = os.path.join(FAISS_DIR, "vectors")
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".eml")
+REBUILD_BATCH_SIZE = 8192
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def replace_file(path, write):
+    # Write to a temp file first so a crash never leaves a half-written index behind
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def vector_path(filename):
+    return os.path.join(VECTOR_DIR, filename + ".f32")
+
+def append_vectors(batch, vectors):
+    # A batch can span several source files; append each run of rows to its own file
+    start = 0
+    for source, group in itertools.groupby(batch, key=lambda m: m["source"]):
+        count = len(list(group))
+        with open(vector_path(source), "ab") as f:
+            f.write(vectors[start:start + count].tobytes())
+        start += count
+
+def read_vectors(filename, dim):
+    path = vector_path(filename)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.empty((0, dim), dtype="float32")
+    return np.memmap(path, dtype="float32", mode="r").reshape(-1, dim)
+
+def empty_state():
+    # Starting over: stale vectors would otherwise be appended to
+    shutil.rmtree(VECTOR_DIR, ignore_errors=True)
+    os.makedirs(VECTOR_DIR, exist_ok=True)
+    return None, chunk_store.ChunkTable(), {"next_id": 0, "dim": None, "index": None, "chunking": None, "documents": {}}
+
+def load_state():
+    # Returns (index, chunk table, manifest); anything written before the
+    # manifest and vector store existed is discarded so the next sync rebuilds.
+    if not os.path.exists(MANIFEST_PATH):
+        return empty_state()
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    if "index" not in manifest:
+        print("Existing index predates the manifest; rebuilding from scratch.")
+        return empty_state()
+    if not chunk_store.exists(STORE_DIR):
+        if not os.path.exists(LEGACY_META_PATH):
+            return empty_state()
+        # Index built before the chunk store existed: carry its metadata over
+        print(f"Converted {chunk_store.convert_pickle(LEGACY_META_PATH, STORE_DIR)} chunks from metadata.pkl")
+    index = faiss.read_index(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+    return index, chunk_store.ChunkTable(chunk_store.ChunkStore(STORE_DIR)), manifest
+
+def build_keyword_index(metadata):
+    # Rebuilt from the whole chunk store; tokenizing is cheap next to embedding
+    start = time.perf_counter()
+    terms = bm25_index.build_index(BM25_DIR, metadata.store.items())
+    print(f"Built BM25 index ({terms} terms) in {time.perf_counter() - start:.2f}s")
+
+def build_rules(metadata):
+    rules = claim_rules.extract_rules(metadata.store.items())
+    write_json(RULES_PATH, {"rules": rules})
+    print(f"Extracted {len(rules)} claim rules")
+
+def write_json(path, data):
+    def write(p):
+        with open(p, "w") as f:
+            json.dump(data, f, indent=2)
+    replace_file(path, write)
+
+def save_state(index, metadata, manifest):
+    if index is not None:
+        replace_file(INDEX_PATH, lambda p: faiss.write_index(index, p))
+    elif os.path.exists(INDEX_PATH):
+        os.remove(INDEX_PATH)
+    metadata.save(STORE_DIR)
+    build_keyword_index(metadata)
+    build_rules(metadata)
+    write_json(MANIFEST_PATH, manifest)
+    build_shards(manifest)
+
+def training_sample(manifest, size, filenames=None):
+    # Evenly strided rows from every document (or just `filenames`), capped at `size`
+    dim = manifest["dim"]
+    filenames = list(manifest["documents"]) if filenames is None else filenames
+    ntotal = sum(manifest["documents"][f]["chunks"] for f in filenames)
+    step = max(1, ntotal // max(size, 1))
+    parts = [read_vectors(filename, dim)[::step] for filename in filenames]
+    return np.concatenate(parts)[:size]
+
+def rebuild_index(manifest, config, filenames=None):
+    # Create, train and fill a fresh index from the vector store, over every
+    # document or just `filenames` (a shard)
+    docs = manifest["documents"]
+    if filenames is not None:
+        docs = {f: docs[f] for f in filenames}
+    ntotal = sum(e["chunks"] for e in docs.values())
+    if not ntotal:
+        return None
+    dim = manifest["dim"]
+    start = time.perf_counter()
+    index = faiss_indexes.create_index(config, dim, ntotal)
+    if not index.is_trained:
+        faiss_indexes.train_index(index, training_sample(manifest, config["train_size"], list(docs)))
+    for filename, entry in docs.items():
+        vectors = read_vectors(filename, dim)
+        first_id = entry["ids"][0]
+        for offset in range(0, len(vectors), REBUILD_BATCH_SIZE):
+            block = np.ascontiguousarray(vectors[offset:offset + REBUILD_BATCH_SIZE])
+            index.add_with_ids(block, np.arange(first_id + offset, first_id + offset + len(block), dtype="int64"))
+    if filenames is None:
+        manifest["index"] = config
+    print(f"Built {faiss_indexes.describe(index)} over {index.ntotal} vectors in {time.perf_counter() - start:.2f}s")
+    return index
+
+def build_shards(manifest):
+    # One index per shard key, rebuilt from the vector store only when the
+    # shard's documents, the index settings or SHARD_BY changed
+    if not shards.SHARDS_ENABLED:
+        return
+    config = faiss_indexes.index_config_from_env()
+    try:
+        with open(SHARDS_PATH) as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {"shards": {}}
+    groups = {}
+    for filename in sorted(manifest["documents"]):
+        if manifest["documents"][filename]["chunks"]:
+            groups.setdefault(shards.shard_key(filename), []).append(filename)
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    shard_map = {"shard_by": shards.SHARD_BY, "index": config, "shards": {}}
+    rebuilt = 0
+    for key, filenames in groups.items():
+        # ids too: a reindex moves a document's chunks without changing its hash
+        fingerprint = {f: [manifest["documents"][f]["sha256"], manifest["documents"][f]["ids"]] for f in filenames}
+        path = os.path.join(SHARD_DIR, shards.shard_file(key))
+        old = previous["shards"].get(key)
+        unchanged = (old is not None and old["fingerprint"] == fingerprint and previous.get("index") == config
+                     and previous.get("shard_by") == shards.SHARD_BY and os.path.exists(path))
+        if not unchanged:
+            print(f"Building shard {key} ({len(filenames)} documents)")
+            index = rebuild_index(manifest, config, filenames)
+            replace_file(path, lambda p: faiss.write_index(index, p))
+            rebuilt += 1
+        shard_map["shards"][key] = {
+            "file": shards.shard_file(key),
+            "sources": {f: manifest["documents"][f]["ids"] for f in filenames},
+            "chunks": sum(manifest["documents"][f]["chunks"] for f in filenames),
+            "fingerprint": fingerprint,
+        }
+    kept = {shard["file"] for shard in shard_map["shards"].values()}
+    for name in os.listdir(SHARD_DIR):
+        if name.endswith(".faiss") and name not in kept:
+            os.remove(os.path.join(SHARD_DIR, name))
+    write_json(SHARDS_PATH, shard_map)
+    print(f"{len(groups)} shards by {shards.SHARD_BY} ({rebuilt} rebuilt)")
+
+def can_update_in_place(index, manifest, config):
+    return index is not None and index.is_trained and manifest["index"] == config
+
+def drop_document(index, metadata, manifest, filename):
+    # Returns the number of chunks removed and whether the index must be rebuilt
+    entry = manifest["documents"].pop(filename, None)
+    if entry is None:
+        return 0, False
+    first_id, end_id = entry["ids"]
+    needs_rebuild = False
+    if index is not None and end_id > first_id:
+        if faiss_indexes.supports_remove(index):
+            index.remove_ids(np.arange(first_id, end_id, dtype="int64"))
+        else:
+            needs_rebuild = True
+    for chunk_id in range(first_id, end_id):
+        metadata.pop(chunk_id, None)
+    if os.path.exists(vector_path(filename)):
+        os.remove(vector_path(filename))
+    return end_id - first_id, needs_rebuild
+
+def add_documents(doc_dir, filenames, hashes, index, metadata, manifest, **pipeline_kwargs):
+    if not filenames:
+        return
+    id_ranges = run_pipeline(doc_dir, filenames, index, metadata, manifest, **pipeline_kwargs)
+    for filename in filenames:
+        first_id, end_id = id_ranges.get(filename, [manifest["next_id"], manifest["next_id"]])
+        manifest["documents"][filename] = {
+            "sha256": hashes[filename],
+            "ids": [first_id, end_id],
+            "chunks": end_id - first_id,
+        }
+
+def update_index(index, metadata, manifest, doc_dir, drop=(), embed=(), hashes=None, **pipeline_kwargs):
+    # Drop and (re-)embed documents, adding to the index in place when possible and
+    # rebuilding it from the vector store otherwise. Returns the resulting index.
+    config = faiss_indexes.index_config_from_env()
+    needs_rebuild = not can_update_in_place(index, manifest, config)
+    for filename in drop:
+        count, rebuild = drop_document(index, metadata, manifest, filename)
+        needs_rebuild = needs_rebuild or rebuild
+        print(f"Removed {count} chunks for {filename}")
+    # Only feed the live index while it stays valid; otherwise rebuild at the end
+    add_documents(doc_dir, list(embed), hashes or {}, None if needs_rebuild else index,
+                  metadata, manifest, **pipeline_kwargs)
+    if needs_rebuild:
+        index = rebuild_index(manifest, config)
+    return index
+
+def ingest_documents(doc_dir=DOC_DIR, force=(), rebuild=False, **pipeline_kwargs):
+    # Sync the index with doc_dir: embed new or changed files, drop deleted ones.
+    # Files named in `force` are re-embedded even if their content hash is unchanged.
+    index, metadata, manifest = empty_state() if rebuild else load_state()
+    documents = manifest["documents"]
+    if documents and manifest.get("chunking") != chunker.settings():
+        print("Chunking settings changed; re-embedding every document.")
+        force = set(force) | set(documents)
+    manifest["chunking"] = chunker.settings()
+
+    hashes = {
+        filename: file_sha256(os.path.join(doc_dir, filename))
+        for filename in sorted(os.listdir(doc_dir))
+        if filename.endswith(SUPPORTED_EXTENSIONS)
+    }
+    removed = [f for f in documents if f not in hashes]
+    changed = [f for f in hashes if f in documents and (documents[f]["sha256"] != hashes[f] or f in force)]
+    added = [f for f in hashes if f not in documents]
+
+    to_embed = sorted(changed + added)
+    config = faiss_indexes.index_config_from_env()
+    if not to_embed and not removed and can_update_in_place(index, manifest, config):
+        if not bm25_index.exists(BM25_DIR) and metadata.store is not None:
+            build_keyword_index(metadata)
+        if not os.path.exists(RULES_PATH) and metadata.store is not None:
+            build_rules(metadata)
+        build_shards(manifest)
+        print("Index is up to date.")
+        return
+    index = update_index(index, metadata, manifest, doc_dir, drop=removed + changed,
+                         embed=to_embed, hashes=hashes, **pipeline_kwargs)
+
+    save_state(index, metadata, manifest)
+    if index is None:
         print("No embeddings found. No index created.")
+        return
+    print(f"Index holds {index.ntotal} chunks from {len(documents)} documents "
+          f"({len(added)} added, {len(changed)} re-embedded, {len(removed)} removed)")
+
+def add_document(path, doc_dir=DOC_DIR):
+    # Copy the file into doc_dir (if it is not already there) and embed it
+    filename = os.path.basename(path)
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise ValueError(f"{filename}: only {', '.join(SUPPORTED_EXTENSIONS)} files can be indexed")
+    target = os.path.join(doc_dir, filename)
+    if os.path.abspath(path) != os.path.abspath(target):
+        shutil.copyfile(path, target)
+    reindex_document(filename, doc_dir)
+
+def reindex_document(filename, doc_dir=DOC_DIR):
+    # Re-embed one file already in doc_dir, leaving every other document as it is
+    index, metadata, manifest = load_state()
+    index = update_index(index, metadata, manifest, doc_dir, drop=[filename], embed=[filename],
+                         hashes={filename: file_sha256(os.path.join(doc_dir, filename))})
+    save_state(index, metadata, manifest)
+
+def remove_document(filename, doc_dir=DOC_DIR, delete_file=False):
+    index, metadata, manifest = load_state()
+    index = update_index(index, metadata, manifest, doc_dir, drop=[filename])
+    save_state(index, metadata, manifest)
+    path = os.path.join(doc_dir, filename)
+    if delete_file and os.path.exists(path):
+        os.remove(path)
+    elif os.path.exists(path):
+        print(f"{path} is still in the data directory and will be re-added on the next sync.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and update the clause index.")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("sync", help="embed new or changed files and drop deleted ones (default)")
+    sub.add_parser("rebuild", help="re-embed every document from scratch")
+    add_cmd = sub.add_parser("add", help="add a single document")
+    add_cmd.add_argument("path")
+    remove_cmd = sub.add_parser("remove", help="remove a single document from the index")
+    remove_cmd.add_argument("filename")
+    remove_cmd.add_argument("--delete-file", action="store_true", help="also delete it from the data directory")
+    reindex_cmd = sub.add_parser("reindex", help="re-embed a single document")
+    reindex_cmd.add_argument("filename")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        if not args.path.endswith(SUPPORTED_EXTENSIONS):
+            parser.error(f"{args.path}: only {', '.join(SUPPORTED_EXTENSIONS)} files can be indexed")
+        add_document(args.path)
+    elif args.command == "remove":
+        remove_document(args.filename, delete_file=args.delete_file)
+    elif args.command == "reindex":
+        if not os.path.isfile(os.path.join(DOC_DIR, args.filename)):
+            parser.error(f"{args.filename} is not in {DOC_DIR}")
+        reindex_document(args.filename)
+    elif args.command == "rebuild":
+        ingest_documents(rebuild=True)
+    else:
+        ingest_documents()
 
 if __name__ == "__main__":
-    ingest_documents()
\ No newline at end of file
+    main()
@@ -0,0 +1,165 @@
+# embeddings.py
+#
+# The one place the sentence embedding model is loaded. The model is created
+# lazily on first use, once per process, and shared by every module.
+#
+# EMBEDDING_BACKEND picks how it runs on the CPU:
+#   torch  the PyTorch SentenceTransformer as published (the reference)
+#   int8   the same model with its Linear layers dynamically quantized to int8
+#   onnx   an ONNX Runtime export of the model, written to EMBEDDING_ONNX_DIR
+#          on first use (needs `pip install optimum[onnxruntime]`)
+# EMBEDDING_THREADS sets the intra-op threads each encode uses (0 keeps the
+# library default, one per core). Encodes already run in parallel on the
+# CPU_WORKERS pool, so a small value avoids oversubscribing the cores.
+#
+# A backend other than torch is checked against the reference model when it
+# loads: both encode SELF_CHECK_SENTENCES and every pair must agree to at
+# least EMBEDDING_MIN_COSINE, since the stored clause vectors may come from
+# a different backend than the queries searched against them. A backend that
+# fails the check is not used; the reference model serves instead.
+#
+# Compare backends with: python -m benchmarks.embedding_benchmark
+
+import os
+import time
+import logging
+import threading
+import numpy as np
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./onnx_models")
+EMBEDDING_SELF_CHECK = os.getenv("EMBEDDING_SELF_CHECK", "1") == "1"
+EMBEDDING_MIN_COSINE = float(os.getenv("EMBEDDING_MIN_COSINE", "0.99"))
+
+BACKENDS = ("torch", "int8", "onnx")
+
+# Queries and clause text like the ones the model sees in production
+SELF_CHECK_SENTENCES = [
+    "46-year-old male, knee surgery in Pune, 3-month-old insurance policy",
+    "Is cataract surgery covered in the first year of the policy?",
+    "maternity expenses for a 29 year old female with a 2 year policy",
+    "Pre-existing diseases are covered after a waiting period of 36 months of continuous coverage.",
+    "Expenses related to cosmetic or plastic surgery are excluded unless necessitated by an accident.",
+    "The Sum Insured shall be reinstated once during the Policy Year.",
+    "Room rent is limited to 1% of the Sum Insured per day.",
+    "warm up",
+]
+
+logger = logging.getLogger("decigenie")
+
+_model = None
+_lock = threading.Lock()
+load_seconds = None  # how long the model took to load, once it has
+active_backend = None  # the backend actually serving, once loaded
+self_check = None  # {"min_cosine", "mean_cosine", "passed"} of the last check
+
+def onnx_path(model_name=MODEL_NAME):
+    return os.path.join(EMBEDDING_ONNX_DIR, model_name.replace("/", "__"))
+
+def load_torch(threads=EMBEDDING_THREADS, device=None):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    return SentenceTransformer(MODEL_NAME, device=device)
+
+def load_int8(threads=EMBEDDING_THREADS, reference=None):
+    # Quantizes a copy, so a reference model passed in stays float32.
+    # Quantized kernels only run on the CPU.
+    import torch
+    model = reference if reference is not None else load_torch(threads, device="cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=False)
+
+def load_onnx(threads=EMBEDDING_THREADS):
+    import onnxruntime
+    from sentence_transformers import SentenceTransformer
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+    path = onnx_path()
+    if os.path.isdir(path):
+        return SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    # First use: export from the published model and keep the export
+    model = SentenceTransformer(MODEL_NAME, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    model.save_pretrained(path)
+    print(f"Exported {MODEL_NAME} to ONNX in {path}")
+    return model
+
+def load_backend(backend, threads=EMBEDDING_THREADS, reference=None):
+    if backend == "torch":
+        return reference if reference is not None else load_torch(threads)
+    if backend == "int8":
+        return load_int8(threads, reference)
+    if backend == "onnx":
+        return load_onnx(threads)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+def agreement(model, reference, sentences=SELF_CHECK_SENTENCES):
+    # Cosine similarity of each sentence's embedding under both models
+    a = np.asarray(model.encode(sentences), dtype="float32")
+    b = np.asarray(reference.encode(sentences), dtype="float32")
+    cosines = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean()),
+            "passed": bool(cosines.min() >= EMBEDDING_MIN_COSINE)}
+
+def load(backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS):
+    # (model, backend serving, self-check result or None)
+    if backend == "torch" or not EMBEDDING_SELF_CHECK:
+        return load_backend(backend, threads), backend, None
+    reference = load_torch(threads, device="cpu")
+    try:
+        model = load_backend(backend, threads, reference)
+    except Exception:
+        logger.exception("Could not load the %s embedding backend, using torch", backend)
+        return reference, "torch", None
+    check = agreement(model, reference)
+    print(f"Embedding backend {backend}: cosine agreement with torch "
+          f"min {check['min_cosine']:.4f}, mean {check['mean_cosine']:.4f}")
+    if not check["passed"]:
+        logger.error("Embedding backend %s disagrees with the reference model (min cosine %.4f < %.4f), using torch",
+                     backend, check["min_cosine"], EMBEDDING_MIN_COSINE)
+        return reference, "torch", check
+    return model, backend, check
+
+def get_model():
+    global _model, load_seconds, active_backend, self_check
+    if _model is None:
+        with _lock:
+            if _model is None:
+                start = time.perf_counter()
+                model, active_backend, self_check = load()
+                load_seconds = time.perf_counter() - start
+                print(f"Loaded embedding model {MODEL_NAME} ({active_backend}) in {load_seconds:.2f}s")
+                _model = model
+    return _model
+
+def is_loaded():
+    return _model is not None
+
+def settings():
+    # What the vectors depend on; caches of embeddings are keyed on it
+    return {"model": MODEL_NAME, "backend": active_backend or EMBEDDING_BACKEND}
+
+def encode(texts, batch_size=32, **kwargs):
+    return get_model().encode(texts, batch_size=batch_size, **kwargs)
+
+def warm_up():
+    # Load the model and run one encode so the first request doesn't pay for either
+    get_model()
+    encode(["warm up"])
+    return load_seconds
+
+def stats():
+    return {
+        "backend": active_backend,
+        "requested_backend": EMBEDDING_BACKEND,
+        "threads": EMBEDDING_THREADS,
+        "loaded": is_loaded(),
+        "load_seconds": load_seconds or 0.0,
+        "self_check_min_cosine": self_check["min_cosine"] if self_check else None,
+        "self_check_passed": self_check["passed"] if self_check else None,
+    }
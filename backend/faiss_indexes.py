@@ -0,0 +1,110 @@
+# faiss_indexes.py
+
+import os
+import math
+import numpy as np
+import faiss
+
+# Supported index types and their build parameters (overridable via env)
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+def index_config_from_env():
+    return {
+        "type": os.getenv("INDEX_TYPE", "flat"),
+        "nlist": int(os.getenv("INDEX_NLIST", "0")),  # 0 = derive from corpus size
+        "hnsw_m": int(os.getenv("INDEX_HNSW_M", "32")),
+        "hnsw_ef_construction": int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "200")),
+        "pq_m": int(os.getenv("INDEX_PQ_M", "48")),
+        "pq_nbits": int(os.getenv("INDEX_PQ_NBITS", "8")),
+        "train_size": int(os.getenv("INDEX_TRAIN_SIZE", "50000")),
+    }
+
+# Search-time knobs; None leaves the value stored in the index untouched
+DEFAULT_NPROBE = int(os.getenv("SEARCH_NPROBE", "0")) or None
+DEFAULT_EF_SEARCH = int(os.getenv("SEARCH_EF_SEARCH", "0")) or None
+
+def choose_nlist(config, ntotal):
+    # Rule of thumb: ~4*sqrt(n) lists, but keep >= 39 training points per list
+    nlist = config["nlist"] or int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // 39 or 1))
+
+def factory_string(config, dim, ntotal):
+    kind = config["type"]
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{config['hnsw_m']}"
+    nlist = choose_nlist(config, ntotal)
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_pq":
+        m = config["pq_m"]
+        if dim % m:
+            raise ValueError(f"INDEX_PQ_M={m} must divide the embedding dimension {dim}")
+        # PQ training wants ~39 points per centroid, i.e. 39 * 2**nbits of them;
+        # a smaller corpus (or shard) gets an exact flat index instead
+        nbits = config["pq_nbits"]
+        if min(ntotal, config["train_size"]) < 39 * 2 ** nbits:
+            return "IDMap2,Flat"
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    raise ValueError(f"Unknown INDEX_TYPE {kind!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+def create_index(config, dim, ntotal):
+    index = faiss.index_factory(dim, factory_string(config, dim, ntotal), faiss.METRIC_L2)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = config["hnsw_ef_construction"]
+    return index
+
+def train_index(index, vectors):
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(vectors, dtype="float32"))
+
+def base_index(index):
+    # Unwrap IndexIDMap/IndexIDMap2 to reach the index doing the work
+    if hasattr(index, "id_map"):
+        return faiss.downcast_index(index.index)
+    return index
+
+def supports_remove(index):
+    # HNSW graphs cannot drop vectors; those indexes are rebuilt instead
+    return not isinstance(base_index(index), faiss.IndexHNSW)
+
+def describe(index):
+    return type(base_index(index)).__name__
+
+def id_selector(id_ranges):
+    # Restricts a search to ids inside the given [first, end) ranges
+    selectors = [faiss.IDSelectorRange(first, end) for first, end in id_ranges] or [faiss.IDSelectorRange(0, 0)]
+    selector = selectors[0]
+    for other in selectors[1:]:
+        selector = faiss.IDSelectorOr(selector, other)
+    # The combined selectors only hold pointers to their parts; keep the parts alive with it
+    selector.parts = selectors
+    return selector
+
+def search_params(index, nprobe=None, ef_search=None, selector=None):
+    nprobe = nprobe or DEFAULT_NPROBE
+    ef_search = ef_search or DEFAULT_EF_SEARCH
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF) and (nprobe or selector):
+        params = faiss.SearchParametersIVF(sel=selector) if selector else faiss.SearchParametersIVF()
+        if nprobe:
+            params.nprobe = nprobe
+        return params
+    if isinstance(base, faiss.IndexHNSW) and (ef_search or selector):
+        params = faiss.SearchParametersHNSW(sel=selector) if selector else faiss.SearchParametersHNSW()
+        if ef_search:
+            params.efSearch = ef_search
+        return params
+    if selector:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+def search(index, vectors, top_k, nprobe=None, ef_search=None, id_ranges=None):
+    # id_ranges: only return ids inside these [first, end) ranges
+    selector = id_selector(id_ranges) if id_ranges is not None else None
+    params = search_params(index, nprobe, ef_search, selector)
+    if params is None:
+        return index.search(vectors, top_k)
+    return index.search(vectors, top_k, params=params)
@@ -1,16 +1,52 @@
 # llm_reasoner.py
 
 import os
+import asyncio
+import re
+import json
+import time
 import openai
+import metrics
+import workers
+import claim_rules
 from dotenv import load_dotenv
+from decision_cache import cache as decision_cache, cache_key, CACHE_ENABLED
+from context_packer import assemble_context
 
-load_dotenv()# Debug print to check the API key value
-print("OpenAI Key:", repr(os.getenv("OPENAI_API_KEY")))
+load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# LLM call settings
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # seconds per attempt
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))  # seconds, doubled per retry
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # in-flight calls per worker
+
+# Caps in-flight LLM calls so a burst of requests can't flood the API
+llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+RETRYABLE_ERRORS = (
+    openai.error.Timeout,
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    asyncio.TimeoutError,
+)
+
+def clause_label(c):
+    # PDF chunks carry a page, docx/eml chunks a section
+    if "page" in c:
+        return f"Page {c['page']}"
+    return f"Section {c['section']}" if "section" in c else "Document"
+
 def build_prompt(query: str, parsed: dict, clauses: list):
-    clauses_text = "\n\n".join([f"(Page {c['page']} - {c['source']}): {c['text']}" for c in clauses])
+    # Deduplicated, diversified and cut to the token budget, see context_packer.py
+    with metrics.span("prompt"):
+        clauses = assemble_context(clauses)
+    clauses_text = "\n\n".join([f"({clause_label(c)} - {c['source']}): {c['text']}" for c in clauses])
     
     prompt = f"""
 You are an expert insurance claims analyst.
@@ -44,21 +80,199 @@ Respond in this strict JSON format:
 """
     return prompt.strip()
 
+def build_messages(prompt: str):
+    return [
+        {"role": "system", "content": "You are a helpful insurance claims assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def rule_decision(query: str, parsed: dict, clauses: list):
+    # A reply in the LLM's JSON format when a claim rule settles the claim
+    # (see claim_rules.py), else None
+    if not claim_rules.CLAIM_RULES_ENABLED:
+        return None
+    with metrics.span("rules"):
+        decision = claim_rules.engine.evaluate(query, parsed, clauses)
+    return json.dumps(decision) if decision is not None else None
+
 def get_decision(query: str, parsed: dict, clauses: list):
+    ruled = rule_decision(query, parsed, clauses)
+    if ruled is not None:
+        return ruled
     prompt = build_prompt(query, parsed, clauses)
 
     response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a helpful insurance claims assistant."},
-            {"role": "user", "content": prompt}
-        ],
+        model=LLM_MODEL,
+        messages=build_messages(prompt),
         temperature=0.3,
+        request_timeout=LLM_TIMEOUT,
     )
 
     reply = response['choices'][0]['message']['content']
     return reply
 
+async def cached_reply(key: str, use_cache: bool):
+    if not CACHE_ENABLED:
+        return None
+    if not use_cache:
+        decision_cache.bypassed += 1
+        return None
+    return await decision_cache.get(key)
+
+async def store_reply(key: str, reply: str):
+    # Only cache replies that contain a JSON object the caller can parse
+    if CACHE_ENABLED and re.search(r'\{.*\}', reply, re.DOTALL):
+        await decision_cache.set(key, reply)
+
+async def get_decision_async(query: str, parsed: dict, clauses: list, use_cache: bool = True):
+    # Non-blocking variant for request handlers: replies are cached on the
+    # normalized prompt; use_cache=False skips the lookup and refreshes the entry.
+    # Claims a rule settles skip both. Rules and prompt packing are CPU work (and
+    # may reload the index), so they run in the worker pool.
+    ruled = await workers.run_cpu(rule_decision, query, parsed, clauses)
+    if ruled is not None:
+        return ruled
+    prompt = await workers.run_cpu(build_prompt, query, parsed, clauses)
+    key = cache_key(prompt, LLM_MODEL)
+    cached = await cached_reply(key, use_cache)
+    if cached is not None:
+        return cached
+
+    reply = await call_llm(prompt)
+    await store_reply(key, reply)
+    return reply
+
+async def stream_decision(query: str, parsed: dict, clauses: list, use_cache: bool = True):
+    # Yields the reply text piece by piece as the LLM produces it (a cached
+    # or rule-decided reply comes out in one piece); the full reply is cached at the end
+    ruled = await workers.run_cpu(rule_decision, query, parsed, clauses)
+    if ruled is not None:
+        yield ruled
+        return
+    prompt = await workers.run_cpu(build_prompt, query, parsed, clauses)
+    key = cache_key(prompt, LLM_MODEL)
+    cached = await cached_reply(key, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    pieces = []
+    async for piece in stream_llm(prompt):
+        pieces.append(piece)
+        yield piece
+    await store_reply(key, "".join(pieces))
+
+async def call_llm(prompt: str):
+    # At most LLM_MAX_CONCURRENCY calls in flight, each attempt bounded by
+    # LLM_TIMEOUT, transient errors retried with exponential backoff.
+    # "llm_wait" is time spent waiting for a slot, "llm" the whole call.
+    with metrics.span("llm"):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                with metrics.span("llm_wait"):
+                    await llm_slots.acquire()
+                try:
+                    response = await asyncio.wait_for(
+                        openai.ChatCompletion.acreate(
+                            model=LLM_MODEL,
+                            messages=build_messages(prompt),
+                            temperature=0.3,
+                            request_timeout=LLM_TIMEOUT,
+                        ),
+                        LLM_TIMEOUT,
+                    )
+                finally:
+                    llm_slots.release()
+                return response['choices'][0]['message']['content']
+            except RETRYABLE_ERRORS:
+                metrics.stage_errors.inc(stage="llm_attempt")
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(LLM_RETRY_BACKOFF * 2 ** attempt)
+
+async def read_stream(prompt: str, pieces: asyncio.Queue):
+    # Reads the whole upstream reply into pieces (None at the end) while holding
+    # an LLM slot, so the slot is freed as soon as the LLM is done rather than
+    # when a slow client is
+    try:
+        async with llm_slots:
+            stream = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(
+                    model=LLM_MODEL,
+                    messages=build_messages(prompt),
+                    temperature=0.3,
+                    request_timeout=LLM_TIMEOUT,
+                    stream=True,
+                ),
+                LLM_TIMEOUT,
+            )
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), LLM_TIMEOUT)
+                except StopAsyncIteration:
+                    return
+                piece = chunk['choices'][0]['delta'].get('content')
+                if piece:
+                    pieces.put_nowait(piece)
+    finally:
+        pieces.put_nowait(None)
+
+async def stream_llm(prompt: str):
+    # Streaming counterpart of call_llm. LLM_TIMEOUT bounds the wait for each
+    # piece; retries only happen before the first piece has been yielded.
+    # Only the time to the first piece is recorded ("llm_first_piece"), the
+    # rest of the stream is paced by the client.
+    start = time.perf_counter()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        started = False
+        pieces = asyncio.Queue()
+        reader = asyncio.ensure_future(read_stream(prompt, pieces))
+        try:
+            while (piece := await pieces.get()) is not None:
+                if not started:
+                    metrics.record("llm_first_piece", time.perf_counter() - start)
+                started = True
+                yield piece
+            await reader
+            return
+        except RETRYABLE_ERRORS:
+            if started or attempt == LLM_MAX_RETRIES:
+                raise
+            await asyncio.sleep(LLM_RETRY_BACKOFF * 2 ** attempt)
+        finally:
+            reader.cancel()
+
+def parse_decision(decision_json):
+    # Parse the LLM's response as JSON
+    try:
+        return json.loads(decision_json)
+    except Exception:
+        match = re.search(r'\{.*\}', decision_json, re.DOTALL)
+        if match:
+            return json.loads(match.group(0))
+        raise ValueError("LLM did not return valid JSON.")
+
+def build_result(decision_data, clauses):
+    # A rule-decided reply lists the clauses it rests on ahead of the retrieved ones
+    rules = decision_data.get("rules", [])
+    supporting = [r["clause"] for r in rules]
+    justification = {
+        "explanation": decision_data.get("justification", ""),
+        "clauses": [
+            {"clause": c["text"], "document": c["source"], "page": c.get("page", c.get("section", None))}
+            for c in supporting + clauses
+        ]
+    }
+
+    result = {
+        "decision": decision_data.get("decision", ""),
+        "amount": decision_data.get("amount", 0),
+        "justification": justification
+    }
+    if rules:
+        result["rules"] = [{"id": r["id"], "kind": r["kind"], "document": r["source"]} for r in rules]
+    return result
+
 # Example test
 if __name__ == "__main__":
     dummy_query = "46-year-old male, knee surgery in Pune, 3-month-old insurance policy"
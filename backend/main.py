@@ -1,8 +1,33 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from routes import router
+import embeddings
+import semantic_search
+import workers
+import metrics
+import mongodb
+import query_log
+import claim_rules
+from query_batcher import batcher
 
-app = FastAPI(title="Insurance LLM System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model, clause index and claim rules before the first request arrives
+    if os.getenv("EMBEDDING_WARMUP", "1") == "1":
+        await run_in_threadpool(embeddings.warm_up)
+        await run_in_threadpool(semantic_search.load_index)
+        await run_in_threadpool(claim_rules.engine.load)
+    await mongodb.ensure_indexes()
+    yield
+    await batcher.close()
+    await query_log.writer.close()
+    workers.shutdown()
+    mongodb.close()
+
+app = FastAPI(title="Insurance LLM System", lifespan=lifespan)
 
 # Allow all origins for development
 app.add_middleware(
@@ -13,4 +38,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(router)
\ No newline at end of file
+# Request latency, stage breakdowns of slow requests and opt-in profiling (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+
+app.include_router(router)
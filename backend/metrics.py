@@ -0,0 +1,238 @@
+# metrics.py
+#
+# Request and stage timings, exported in the Prometheus text format at
+# GET /metrics. Code marks a stage with
+#
+#   with metrics.span("faiss_search"):
+#       ...
+#
+# which records into the decigenie_stage_seconds histogram and, inside an
+# HTTP request, into that request's trace. MetricsMiddleware opens a trace
+# per request, records request latency and status, and logs the per-stage
+# breakdown of any request slower than SLOW_REQUEST_SECONDS.
+#
+# Traces live in a contextvar: workers.run_cpu carries it into the CPU pool.
+# Work the query batcher does for several requests at once is recorded in
+# the histograms only; the request's own span around the batcher call
+# shows how long it waited.
+#
+# With PROFILING=1, a request sent with an "X-Profile: 1" header (or
+# ?profile=1) is also sampled by a stack-sampling profiler; the collapsed
+# stacks are written to PROFILE_DIR for flame graph tools. The sampler sees
+# every thread, so other requests running at the same time show up too.
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2.0"))
+PROFILING_ENABLED = os.getenv("PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("decigenie.metrics")
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {series[-1]:.6f}")
+        return lines
+
+class CounterMetric:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+stage_seconds = Histogram("decigenie_stage_seconds", "Time spent in each processing stage.")
+stage_errors = CounterMetric("decigenie_stage_errors_total", "Stages that ended with an exception.")
+request_seconds = Histogram("decigenie_request_seconds", "HTTP request latency, until the last body byte is sent.")
+requests_total = CounterMetric("decigenie_requests_total", "HTTP requests by route, method and status.")
+slow_requests = CounterMetric("decigenie_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS.")
+METRICS = [stage_seconds, stage_errors, request_seconds, requests_total, slow_requests]
+
+# Components with a stats() dict (caches, batcher, ...); numeric fields are exported as gauges
+_gauge_sources = {}
+
+def register_stats(component, stats_fn):
+    _gauge_sources[component] = stats_fn
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for component, stats_fn in sorted(_gauge_sources.items()):
+        for field, value in stats_fn().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"decigenie_{component}_{field}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
+
+async def timed(stage, awaitable):
+    # span() for an awaitable, so it can be passed to asyncio.gather
+    with span(stage):
+        return await awaitable
+
+# --- Sampling profiler ---
+
+class Sampler:
+    # Samples the stacks of all threads every `interval` seconds until stopped
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    async def stop(self):
+        # The sampling thread may be mid-sample; wait for it off the event loop
+        self._stop.set()
+        await asyncio.to_thread(self._thread.join)
+
+    def write(self, label):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def wants_profile(scope):
+    if not PROFILING_ENABLED:
+        return False
+    headers = dict(scope.get("headers") or ())
+    return headers.get(b"x-profile") == b"1" or b"profile=1" in scope.get("query_string", b"")
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = {}
+        token = current_trace.set(trace)
+        sampler = Sampler().start() if wants_profile(scope) else None
+        start = time.perf_counter()
+        status = [500]
+        finished = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished[0] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_trace.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            request_seconds.observe(elapsed, path=path)
+            requests_total.inc(path=path, method=scope["method"], status=status[0])
+            profile_path = None
+            if sampler is not None:
+                await sampler.stop()
+                profile_path = await asyncio.to_thread(sampler.write, f"{scope['method']}{path}")
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                slow_requests.inc(path=path)
+                breakdown = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in
+                                      sorted(trace.items(), key=lambda item: -item[1]))
+                logger.warning("Slow request %s %s: %.0fms (status %s%s) [%s]", scope["method"], scope["path"],
+                               elapsed * 1000, status[0], "" if finished[0] else ", incomplete", breakdown)
+            if profile_path:
+                logger.warning("Profile for %s %s: %d samples written to %s", scope["method"], scope["path"],
+                               sampler.samples, profile_path)
@@ -1,6 +1,113 @@
-from pymongo import MongoClient
+# mongodb.py
+#
+# The app's only MongoDB client: one pooled motor (async) client shared by
+# the request handlers, the decision cache and the batch analyzer, so no
+# handler blocks a worker thread on the database. ensure_indexes() runs at
+# startup; history and login lookups are served from those indexes.
+
 import os
+import uuid
+import base64
+import logging
+from datetime import datetime
+import motor.motor_asyncio
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-client = MongoClient(MONGO_URI)
-db = client["insurance_llm"]  # Use your DB name
+MONGO_DB = os.getenv("MONGO_DB", "insurance_llm")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))  # server selection and connect
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+
+logger = logging.getLogger("decigenie")
+
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_TIMEOUT_MS,
+)
+db = client[MONGO_DB]
+users = db.users
+queries = db.queries
+pictures = motor.motor_asyncio.AsyncIOMotorGridFSBucket(db, bucket_name="profile_pictures")  # see profile_pictures.py
+
+# Projections: only the fields each caller reads are sent over the wire.
+# None of them include a legacy base64 profile_picture.
+LOGIN_FIELDS = {"password": 1}
+PROFILE_FIELDS = {"name": 1, "email": 1, "profile_picture_version": 1, "queries_made": 1, "last_login": 1,
+                  "created_at": 1}
+HISTORY_FIELDS = {"query_id": 1, "query": 1, "timestamp": 1, "decision": 1, "amount": 1,
+                  "justification.explanation": 1}
+
+async def ensure_indexes():
+    # Idempotent; a failure is logged rather than stopping the app from starting
+    if not MONGO_ENSURE_INDEXES:
+        return
+    try:
+        try:
+            await users.create_index([("email", ASCENDING)], unique=True, name="email_1")
+        except OperationFailure as e:
+            # Existing duplicate emails: still index the lookup, without the constraint
+            logger.warning("users.email is not unique, creating a plain index instead: %s", e)
+            await users.create_index([("email", ASCENDING)], name="email_1")
+        # Chat history: equality on user_id, then newest first with _id as the tie-breaker
+        await queries.create_index(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_id_1_timestamp_-1__id_-1")
+        # Finding a user's old thumbnails when a new picture is uploaded
+        await db["profile_pictures.files"].create_index([("metadata.user_id", ASCENDING)], name="metadata.user_id_1")
+    except PyMongoError as e:
+        logger.warning("Could not create MongoDB indexes: %s", e)
+
+def close():
+    client.close()
+
+def new_query_doc(query, result, user_id=None):
+    # Query log document with a unique query_id and timestamp (and user_id if provided)
+    doc = {
+        "query_id": str(uuid.uuid4()),
+        "query": query,
+        "timestamp": datetime.utcnow(),
+        **result
+    }
+    if user_id:
+        doc["user_id"] = user_id
+    return doc
+
+# --- Keyset pagination ---
+
+def encode_cursor(doc):
+    # Opaque "continue after this document" token: its timestamp and _id
+    oid = doc["_id"]
+    kind = "o" if isinstance(oid, ObjectId) else "s"
+    raw = f"{doc['timestamp'].isoformat()}|{kind}{oid}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    # Raises ValueError for a malformed token
+    try:
+        timestamp, oid = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(timestamp), ObjectId(oid[1:]) if oid[0] == "o" else oid[1:]
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+async def query_history(user_id, limit, before=None):
+    # One page of a user's queries, newest first. Each page seeks straight to
+    # its first entry in the (user_id, timestamp, _id) index instead of
+    # skipping the earlier pages, so deep pages cost the same as the first.
+    # Returns (documents, cursor for the next page or None).
+    match = {"user_id": user_id}
+    if before is not None:
+        timestamp, oid = decode_cursor(before)
+        match["$or"] = [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "_id": {"$lt": oid}}]
+    found = queries.find(match, HISTORY_FIELDS).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+    docs = await found.to_list(length=limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
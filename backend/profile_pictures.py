@@ -0,0 +1,109 @@
+# profile_pictures.py
+#
+# Profile pictures live in the "profile_pictures" GridFS bucket, not in the
+# user document, so reading a user no longer drags the image along. At
+# upload time the picture is cropped square and resized to each of
+# PROFILE_PICTURE_SIZES; the user document only keeps a version string
+# (a hash of the upload), which doubles as the ETag of every thumbnail.
+#
+# Users whose picture is still a base64 string in their document (from
+# before GridFS) are converted the first time their profile or picture is
+# requested.
+
+import os
+import io
+import base64
+import hashlib
+from urllib.parse import urlencode
+from gridfs.errors import NoFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+import workers
+import mongodb
+
+PROFILE_PICTURE_SIZES = sorted(int(s) for s in os.getenv("PROFILE_PICTURE_SIZES", "64,256").split(","))
+PROFILE_PICTURE_FORMAT = os.getenv("PROFILE_PICTURE_FORMAT", "WEBP").upper()  # WEBP | JPEG | PNG
+PROFILE_PICTURE_QUALITY = int(os.getenv("PROFILE_PICTURE_QUALITY", "85"))
+PROFILE_PICTURE_MAX_BYTES = int(os.getenv("PROFILE_PICTURE_MAX_BYTES", str(10 * 1024 * 1024)))
+PROFILE_PICTURE_MAX_PIXELS = int(os.getenv("PROFILE_PICTURE_MAX_PIXELS", str(40_000_000)))
+
+MEDIA_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+def picture_version(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def make_thumbnails(data):
+    # {size: encoded bytes} for each configured size (runs on the CPU pool).
+    # Raises ValueError if data isn't an image Pillow can read.
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > PROFILE_PICTURE_MAX_PIXELS:
+                raise ValueError(f"Image is larger than {PROFILE_PICTURE_MAX_PIXELS} pixels.")
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError("File is not a readable image.") from e
+    mode = "RGB" if PROFILE_PICTURE_FORMAT == "JPEG" else "RGBA"
+    image = image.convert(mode)
+    thumbnails = {}
+    for size in PROFILE_PICTURE_SIZES:
+        # Center crop to a square, then resize (never upscale past the original)
+        side = min(size, image.width, image.height)
+        out = io.BytesIO()
+        ImageOps.fit(image, (side, side), Image.LANCZOS).save(
+            out, PROFILE_PICTURE_FORMAT, quality=PROFILE_PICTURE_QUALITY)
+        thumbnails[size] = out.getvalue()
+    return thumbnails
+
+def file_name(user_id, size):
+    return f"{user_id}/{size}"
+
+async def store(user_id, data):
+    # Stores the thumbnails of `data` as the user's picture and returns its version.
+    # New files are written before the old ones are removed, so there is no gap.
+    version = picture_version(data)
+    thumbnails = await workers.run_cpu(make_thumbnails, data)
+    new_ids = []
+    for size, thumbnail in thumbnails.items():
+        new_ids.append(await mongodb.pictures.upload_from_stream(
+            file_name(user_id, size), thumbnail,
+            metadata={"user_id": user_id, "size": size, "version": version,
+                      "content_type": MEDIA_TYPES[PROFILE_PICTURE_FORMAT]}))
+    await mongodb.users.update_one(
+        {"_id": user_id}, {"$set": {"profile_picture_version": version}, "$unset": {"profile_picture": ""}})
+    stale = mongodb.pictures.find({"metadata.user_id": user_id, "_id": {"$nin": new_ids}})
+    async for old in stale:
+        await mongodb.pictures.delete(old._id)
+    return version
+
+async def migrate_legacy(user_id):
+    # Moves a base64 picture from the user document into GridFS; returns its version or None
+    user = await mongodb.users.find_one({"_id": user_id}, {"profile_picture": 1})
+    legacy = user.get("profile_picture") if user else None
+    if not legacy or not isinstance(legacy, str):
+        return None
+    try:
+        return await store(user_id, base64.b64decode(legacy))
+    except ValueError:
+        return None
+
+def pick_size(requested):
+    # The smallest stored size at least as large as requested (else the largest)
+    if requested is None:
+        return PROFILE_PICTURE_SIZES[-1]
+    return next((size for size in PROFILE_PICTURE_SIZES if size >= requested), PROFILE_PICTURE_SIZES[-1])
+
+async def open_picture(user_id, size):
+    # A GridFS download stream for the user's thumbnail, or None. Its metadata
+    # (version, content type) is available before any image bytes are read.
+    try:
+        return await mongodb.pictures.open_download_stream_by_name(file_name(user_id, size))
+    except NoFile:
+        if await migrate_legacy(user_id) is None:
+            return None
+        return await mongodb.pictures.open_download_stream_by_name(file_name(user_id, size))
+
+def picture_url(user_id, version, size=None):
+    # Versioned URL, so browsers can cache it for good and a new upload changes it
+    if not version:
+        return ""
+    return "/api/user/profile-picture?" + urlencode({"user_id": user_id, "size": pick_size(size), "v": version})
@@ -0,0 +1,129 @@
+# query_batcher.py
+#
+# Concurrent queries share one encode() and one index search per batch.
+
+import os
+import asyncio
+import contextvars
+from collections import Counter
+import numpy as np
+import semantic_search
+import shards
+import workers
+
+BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+def run_jobs(batch):
+    # Runs on the CPU pool. batch items are (kind, payload, top_k, future), where
+    # payload is the query for "encode", (query, filter) for "search" and
+    # (vector, query, filter) for "search_vector"; returns one result per item, in order.
+    results = [None] * len(batch)
+    encode_pos = [i for i, item in enumerate(batch) if item[0] in ("encode", "search")]
+    vectors = {}
+    if encode_pos:
+        encoded = semantic_search.encode_queries(
+            [batch[i][1] if batch[i][0] == "encode" else batch[i][1][0] for i in encode_pos])
+        vectors = dict(zip(encode_pos, encoded))
+    for i in encode_pos:
+        if batch[i][0] == "encode":
+            results[i] = vectors[i]
+    # One index search per distinct filter (usually just the unfiltered one)
+    groups = {}
+    for i, item in enumerate(batch):
+        if item[0] in ("search", "search_vector"):
+            groups.setdefault(item[1][-1], []).append(i)
+    for search_filter, search_pos in groups.items():
+        query_vectors = np.stack([vectors[i] if batch[i][0] == "search" else batch[i][1][0] for i in search_pos])
+        # Query texts for hybrid search
+        queries = [batch[i][1][0] if batch[i][0] == "search" else batch[i][1][1] for i in search_pos]
+        top_k = max(batch[i][2] for i in search_pos)
+        found = semantic_search.search_vectors(query_vectors, top_k, queries=queries, search_filter=search_filter)
+        for i, clauses in zip(search_pos, found):
+            results[i] = clauses[:batch[i][2]]
+    return results
+
+class QueryBatcher:
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.requests = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+
+    def _ensure_worker(self):
+        # Started on the running loop, outside any request's trace
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def _submit(self, kind, payload, top_k=0):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, payload, top_k, future))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def encode(self, query):
+        # The query's embedding (float32 vector)
+        return await self._submit("encode", query)
+
+    async def search(self, query, top_k=5, sources=None, insurers=None):
+        # Encode and search in one round; sources / insurers as in semantic_search.search
+        return await self._submit("search", (query, shards.search_filter(sources, insurers)), top_k)
+
+    async def search_vector(self, vector, top_k=5, query=None, sources=None, insurers=None):
+        # Search with an embedding obtained from encode(); pass the query text
+        # as well so hybrid search can score it with BM25
+        return await self._submit("search_vector", (vector, query, shards.search_filter(sources, insurers)), top_k)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Give concurrent requests a moment to join, unless the batch is already full
+            if self.window > 0 and self._queue.qsize() < self.max_batch_size - 1:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch):
+        try:
+            results = await workers.run_cpu(run_jobs, batch)
+        except Exception as e:
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        for item, result in zip(batch, results):
+            if not item[3].done():
+                item[3].set_result(result)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+batcher = QueryBatcher()
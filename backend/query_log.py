@@ -0,0 +1,210 @@
+# query_log.py
+#
+# Write-behind query logging: one insert_many plus one bulk $inc of
+# queries_made per batch, flushed by size or age.
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from collections import Counter
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import mongodb
+import metrics
+
+QUERY_LOG_WRITE_BEHIND = os.getenv("QUERY_LOG_WRITE_BEHIND", "1") == "1"
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "100"))
+QUERY_LOG_FLUSH_MS = float(os.getenv("QUERY_LOG_FLUSH_MS", "500"))
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_MAX_WAIT_MS = float(os.getenv("QUERY_LOG_MAX_WAIT_MS", "100"))
+QUERY_LOG_MAX_RETRIES = int(os.getenv("QUERY_LOG_MAX_RETRIES", "5"))
+QUERY_LOG_RETRY_BACKOFF = float(os.getenv("QUERY_LOG_RETRY_BACKOFF", "0.5"))  # seconds, doubled per retry
+QUERY_LOG_SHUTDOWN_TIMEOUT = float(os.getenv("QUERY_LOG_SHUTDOWN_TIMEOUT", "10"))  # seconds
+
+logger = logging.getLogger("decigenie")
+
+_STOP = object()
+
+def user_counts(batch):
+    return Counter(doc["user_id"] for doc in batch if doc.get("user_id"))
+
+class QueryLogWriter:
+    def __init__(self, queries, users, batch_size=QUERY_LOG_BATCH_SIZE, flush_ms=QUERY_LOG_FLUSH_MS,
+                 queue_size=QUERY_LOG_QUEUE_SIZE, max_wait_ms=QUERY_LOG_MAX_WAIT_MS, enabled=QUERY_LOG_WRITE_BEHIND):
+        self.queries = queries
+        self.users = users
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queue_size = queue_size
+        self.max_wait = max_wait_ms / 1000
+        self.enabled = enabled
+        self._queue = None
+        self._worker = None
+        self._in_flight = []
+        self.logged = 0
+        self.written = 0
+        self.flushes = 0
+        self.counter_updates = 0
+        self.retries = 0
+        self.write_errors = 0  # documents rejected by the server (e.g. already inserted by an earlier attempt)
+        self.dropped = 0
+        self.full_events = 0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+
+    def _ensure_worker(self):
+        # Same worker setup as QueryBatcher
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def log(self, doc):
+        # Queues a query document (from mongodb.new_query_doc); returns at once
+        # unless the queue is full
+        self.logged += 1
+        if not self.enabled:
+            await self._write([doc])
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            self.full_events += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._queue.put(doc), self.max_wait)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning("Query log queue is full (%d documents), dropped a query log", self.queue_size)
+            finally:
+                self.blocked_seconds += time.perf_counter() - start
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    async def insert_many(self, docs, ordered=False):
+        # Same call as on the queries collection, so batch_analyzer can log through the writer
+        for doc in docs:
+            await self.log(doc)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._in_flight = batch
+            await self._flush(batch)
+            self._in_flight = []
+            if stopping:
+                return
+
+    async def _flush(self, batch):
+        # Retries only the part that failed: documents that were inserted are
+        # not inserted again if the counter update fails afterwards
+        counts = user_counts(batch)
+        inserted = False
+        for attempt in range(QUERY_LOG_MAX_RETRIES + 1):
+            try:
+                with metrics.span("query_log_flush"):
+                    start = time.perf_counter()
+                    if not inserted:
+                        await self._insert(batch)
+                        inserted = True
+                    if counts:
+                        await self._increment(counts)
+                self.flushes += 1
+                self.last_flush_ms = (time.perf_counter() - start) * 1000
+                return
+            except Exception as e:
+                if attempt == QUERY_LOG_MAX_RETRIES:
+                    if not inserted:
+                        self.dropped += len(batch)
+                    logger.error("Query log flush of %d documents failed after %d attempts (%s): %s",
+                                 len(batch), attempt + 1, "counters lost" if inserted else "dropped", e)
+                    return
+                self.retries += 1
+                logger.warning("Query log flush failed, retrying: %s", e)
+                await asyncio.sleep(QUERY_LOG_RETRY_BACKOFF * 2 ** attempt)
+
+    async def _write(self, batch):
+        # Unbuffered write, when write-behind is off
+        await self._insert(batch)
+        counts = user_counts(batch)
+        if counts:
+            await self._increment(counts)
+
+    async def _insert(self, batch):
+        # insert_many sets each document's _id before sending, so a retry of a
+        # partly written batch only gets duplicate key errors for the documents
+        # that already made it
+        try:
+            await self.queries.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except BulkWriteError as e:
+            failed = len(e.details.get("writeErrors", []))
+            self.write_errors += failed
+            self.written += len(batch) - failed
+
+    async def _increment(self, counts):
+        # One $inc per user. Not idempotent: a retry after the server applied
+        # the updates but the reply was lost counts those queries twice.
+        await self.users.bulk_write(
+            [UpdateOne({"_id": user_id}, {"$inc": {"queries_made": n}}) for user_id, n in counts.items()],
+            ordered=False)
+        self.counter_updates += len(counts)
+
+    def stats(self):
+        return {
+            "write_behind": self.enabled,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_size": self.queue_size,
+            "logged": self.logged,
+            "written": self.written,
+            "flushes": self.flushes,
+            "avg_batch_size": self.written / self.flushes if self.flushes else 0.0,
+            "counter_updates": self.counter_updates,
+            "retries": self.retries,
+            "write_errors": self.write_errors,
+            "dropped": self.dropped,
+            "full_events": self.full_events,
+            "blocked_seconds": self.blocked_seconds,
+            "last_flush_ms": self.last_flush_ms,
+            "batch_size": self.batch_size,
+            "flush_ms": self.flush_interval * 1000,
+        }
+
+    async def close(self):
+        # Flushes everything queued so far, waiting at most QUERY_LOG_SHUTDOWN_TIMEOUT
+        if self._worker is None or self._worker.done():
+            return
+        try:
+            await asyncio.wait_for(self._queue.put(_STOP), QUERY_LOG_SHUTDOWN_TIMEOUT)
+            await asyncio.wait_for(asyncio.shield(self._worker), QUERY_LOG_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._worker.cancel()
+            lost = len(self._in_flight)
+            while not self._queue.empty():
+                lost += self._queue.get_nowait() is not _STOP
+            self.dropped += lost
+            logger.error("Query log shutdown timed out, %d query logs were not written", lost)
+        self._worker = None
+
+writer = QueryLogWriter(mongodb.queries, mongodb.users)
@@ -1,9 +1,42 @@
 # query_parser.py
 
+import os
 import re
+import json
+import threading
 import spacy
+from spacy.matcher import PhraseMatcher
+import metrics
 
-nlp = spacy.load("en_core_web_sm")
+# "fast": gazetteer + precompiled regexes, spaCy NER only as a fallback
+# "full": the original en_core_web_sm pipeline on every query
+QUERY_PARSER_MODE = os.getenv("QUERY_PARSER_MODE", "fast")
+NER_FALLBACK = os.getenv("QUERY_PARSER_NER_FALLBACK", "1") == "1"
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json")
+
+_lock = threading.Lock()
+_nlp = None
+_ner_nlp = None
+_gazetteer = None
+
+def get_nlp():
+    # Full pipeline (tagger, parser, lemmatizer, NER), loaded on first use
+    global _nlp
+    if _nlp is None:
+        with _lock:
+            if _nlp is None:
+                _nlp = spacy.load("en_core_web_sm")
+    return _nlp
+
+def get_ner_nlp():
+    # Same model with everything but NER (and the tok2vec it needs) left out
+    global _ner_nlp
+    if _ner_nlp is None:
+        with _lock:
+            if _ner_nlp is None:
+                _ner_nlp = spacy.load(
+                    "en_core_web_sm", exclude=["tagger", "parser", "attribute_ruler", "lemmatizer", "senter"])
+    return _ner_nlp
 
 def extract_age(text):
     match = re.search(r"(\d{2})[- ]?year[- ]?old", text)
@@ -25,14 +58,16 @@ def extract_policy_duration(text):
         return number * 12 if "year" in unit else number
     return None
 
-def extract_city(text):
+def city_from_doc(doc):
     # naive extraction using spaCy's GPE (Geopolitical Entity)
-    doc = nlp(text)
     for ent in doc.ents:
         if ent.label_ == "GPE":
             return ent.text
     return None
 
+def extract_city(text):
+    return city_from_doc(get_nlp()(text))
+
 def extract_procedure(text):
     # very naive: look for "surgery" + previous 2 words
     match = re.search(r"([a-zA-Z\s]+?)\s+(surgery)", text.lower())
@@ -40,7 +75,7 @@ def extract_procedure(text):
         return match.group(0)
     return None
 
-def parse_query(query: str):
+def parse_query_full(query: str):
     return {
         "age": extract_age(query),
         "gender": extract_gender(query),
@@ -49,8 +84,123 @@ def parse_query(query: str):
         "policy_duration_months": extract_policy_duration(query)
     }
 
+# --- Fast path ---
+
+AGE_RE = re.compile(
+    r"\b(\d{1,3})\s*[- ]?\s*(?:years?|yrs?|y)[- ]?old\b"
+    r"|\b(?:aged?|age of)\s*(\d{1,3})\b"
+    r"|\b(\d{1,3})\s*(?:yo|y/o)\b"
+    r"|\b(\d{1,3})(?-i:[MF])\b",  # "46M", but not "3m policy"
+    re.IGNORECASE)
+DURATION_RE = re.compile(r"\b(\d+)\s*[- ]?\s*(months?|mos?|years?|yrs?)\b", re.IGNORECASE)
+# No pronouns: "surgery for his wife" is about the wife
+FEMALE_RE = re.compile(r"\b(?:female|woman|lady|girl|\d{1,3}(?-i:F))\b", re.IGNORECASE)
+MALE_RE = re.compile(r"\b(?:male|man|gentleman|boy|\d{1,3}(?-i:M))\b", re.IGNORECASE)
+PROCEDURE_RE = re.compile(
+    r"((?:[a-z]+\s+){0,2}?[a-z]+)\s+(surgery|operation|replacement|transplant|procedure)\b", re.IGNORECASE)
+# Only queries that look like they name a place are worth the NER fallback
+PLACE_HINT_RE = re.compile(r"\b(?:in|at|from|near)\s+[A-Z][a-z]+")
+PROCEDURE_STOPWORDS = {"a", "an", "the", "for", "of", "and", "with", "had", "has", "needs", "needing", "underwent", "undergo"}
+
+def get_gazetteer():
+    # (blank tokenizer, PhraseMatcher) over city names, built once
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                with open(GAZETTEER_PATH) as f:
+                    names = json.load(f)
+                blank = spacy.blank("en")
+                matcher = PhraseMatcher(blank.vocab, attr="LOWER")
+                matcher.add("CITY", list(blank.tokenizer.pipe(names["cities"])))
+                _gazetteer = (blank, matcher)
+    return _gazetteer
+
+def match_gazetteer(text):
+    # The first city mentioned
+    blank, matcher = get_gazetteer()
+    doc = blank.make_doc(text)
+    matches = matcher(doc)
+    if not matches:
+        return None
+    _, start, end = min(matches, key=lambda m: m[1])
+    return doc[start:end].text
+
+def fast_age(text):
+    match = AGE_RE.search(text)
+    if not match:
+        return None, None
+    value = next(g for g in match.groups() if g is not None)
+    return int(value), match.span()
+
+def fast_policy_duration(text, age_span=None):
+    # Skips the age ("46-year-old") so it isn't read as a 46-year policy
+    for match in DURATION_RE.finditer(text):
+        if age_span and match.start() < age_span[1] and match.end() > age_span[0]:
+            continue
+        number = int(match.group(1))
+        return number * 12 if match.group(2).lower().startswith("y") else number
+    return None
+
+def fast_gender(text):
+    # "female" contains "male", so check it first and only on word boundaries
+    if FEMALE_RE.search(text):
+        return "female"
+    if MALE_RE.search(text):
+        return "male"
+    return None
+
+def fast_procedure(text):
+    match = PROCEDURE_RE.search(text)
+    if not match:
+        return None
+    words = [w for w in match.group(1).lower().split() if len(w) > 1 and w not in PROCEDURE_STOPWORDS]
+    return " ".join(words[-2:] + [match.group(2).lower()])
+
+def parse_query_fast(query: str, ner_fallback=NER_FALLBACK):
+    age, age_span = fast_age(query)
+    city = match_gazetteer(query)
+    if city is None and ner_fallback and PLACE_HINT_RE.search(query):
+        city = city_from_doc(get_ner_nlp()(query))
+    return {
+        "age": age,
+        "gender": fast_gender(query),
+        "procedure": fast_procedure(query),
+        "city": city,
+        "policy_duration_months": fast_policy_duration(query, age_span)
+    }
+
+def parse_query(query: str):
+    with metrics.span("parse"):
+        if QUERY_PARSER_MODE == "full":
+            return parse_query_full(query)
+        return parse_query_fast(query)
+
+def parse_queries(queries, batch_size=64):
+    # Batch version of parse_query: spaCy runs once over all queries via nlp.pipe
+    if QUERY_PARSER_MODE == "full":
+        results = []
+        for query, doc in zip(queries, get_nlp().pipe(queries, batch_size=batch_size)):
+            results.append({
+                "age": extract_age(query),
+                "gender": extract_gender(query),
+                "procedure": extract_procedure(query),
+                "city": city_from_doc(doc),
+                "policy_duration_months": extract_policy_duration(query)
+            })
+        return results
+
+    results = [parse_query_fast(query, ner_fallback=False) for query in queries]
+    pending = [i for i, r in enumerate(results) if r["city"] is None and PLACE_HINT_RE.search(queries[i])]
+    if NER_FALLBACK and pending:
+        # Only loaded when some query still needs it
+        docs = get_ner_nlp().pipe([queries[i] for i in pending], batch_size=batch_size)
+        for i, doc in zip(pending, docs):
+            results[i]["city"] = city_from_doc(doc)
+    return results
+
 # Test
 if __name__ == "__main__":
     sample = "46-year-old male, knee surgery in Pune, 3-month-old insurance policy"
     parsed = parse_query(sample)
-    print(parsed)
\ No newline at end of file
+    print(parsed)
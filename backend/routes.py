@@ -1,186 +1,308 @@
-
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from query_parser import parse_query
-from semantic_search import search
-from llm_reasoner import get_decision
-import motor.motor_asyncio
-import os
-from dotenv import load_dotenv
+from query_batcher import batcher
+import embeddings
+from llm_reasoner import get_decision_async, stream_decision, parse_decision, build_result
+from decision_cache import cache as decision_cache
+from semantic_cache import cache as semantic_cache, SEMANTIC_CACHE_ENABLED
+import context_packer
+import chunker
+import upload_cache
+import uploads
+from upload_cache import UPLOAD_CACHE_ENABLED
+import workers
+import semantic_search
+import shards
+import claim_rules
+import metrics
+import batch_analyzer
+import io
+import asyncio
 import json
 from typing import List, Optional
-import fitz
-from docx import Document
-import email
-from email import policy
-from email.parser import BytesParser
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import uuid
 from datetime import datetime
-import base64
-
-# Add import for db from mongodb.py
-from mongodb import db
-
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+import logging
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import mongodb
+import query_log
+import profile_pictures
+import models
+from mongodb import new_query_doc
 
-# MongoDB setup (keep for other async uses)
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db_async = client.insurance_llm
-queries_col = db_async.queries
+users_col = mongodb.users
 
 router = APIRouter()
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+logger = logging.getLogger("decigenie")
 
-# Helper functions for extracting text
+# Component stats, also exported as gauges at /metrics
+metrics.register_stats("query_batcher", batcher.stats)
+metrics.register_stats("decision_cache", decision_cache.stats)
+metrics.register_stats("semantic_cache", semantic_cache.stats)
+metrics.register_stats("upload_cache", upload_cache.cache.stats)
+metrics.register_stats("page_cache", uploads.page_cache.stats)
+metrics.register_stats("context_packer", context_packer.stats.stats)
+metrics.register_stats("query_log", query_log.writer.stats)
+metrics.register_stats("embeddings", embeddings.stats)
+metrics.register_stats("claim_rules", claim_rules.engine.stats)
 
-def chunk_text(text, max_chunk_size=300):
-    chunks = []
-    current = ""
-    for line in text.split("\n"):
-        if len(current) + len(line) < max_chunk_size:
-            current += " " + line
-        else:
-            chunks.append(current.strip())
-            current = line
-    if current:
-        chunks.append(current.strip())
-    return chunks
-
-def extract_text_from_docx(docx_file):
-    doc = Document(docx_file)
-    full_text = []
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    return "\n".join(full_text)
-
-def extract_text_from_eml(eml_file):
-    msg = BytesParser(policy=policy.default).parse(eml_file)
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() == 'text/plain':
-                return part.get_content()
-    else:
-        return msg.get_content()
-    return ""
+# Helper functions for extracting text
 
 def embed_chunks(chunks):
-    return [embedding_model.encode(chunk) for chunk in chunks]
+    # One batched encode() for the whole file
+    return np.asarray(embeddings.encode(chunks, batch_size=64), dtype="float32")
+
+def embed_units(filename, units):
+    # Chunk and embed one file's extracted text (runs on the CPU pool)
+    metadata = [meta for page, text in units for meta in chunker.chunk_unit(filename, page, text)]
+    if not metadata:
+        return metadata, np.empty((0, 0), dtype="float32")
+    return metadata, embed_chunks([meta["text"] for meta in metadata])
+
+async def load_upload(upload):
+    # (metadata, vectors) for one spooled upload. Files seen before come
+    # straight from the upload cache, unparsed and unembedded.
+    # The key names the embedding backend, so computing it may load the model
+    key = await workers.run_cpu(upload_cache.cache_key, upload.sha256) if UPLOAD_CACHE_ENABLED else None
+    cached = await workers.run_cpu(upload_cache.cache.get, key) if key else None
+    if cached is not None:
+        metadata, vectors = cached
+        return [dict(meta, source=upload.filename) for meta in metadata], vectors
+    units = await uploads.extract_units(upload)
+    metadata, vectors = await workers.run_cpu(embed_units, upload.filename, units)
+    if key and metadata:
+        await workers.run_cpu(upload_cache.cache.put, key, metadata, vectors)
+    return metadata, vectors
+
+def rank_chunks(query_vector, metadata, vectors, top_k=5):
+    # Compute cosine similarity
+    similarities = np.dot(vectors, query_vector) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-8)
+    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    return [metadata[i] for i in top_indices]
+
+async def read_uploads(files):
+    # Files are spooled to temp files (413 over the size limits) and removed afterwards
+    all_metadata = []
+    all_vectors = []
+    spooled = await uploads.spool_files(files)
+    try:
+        for upload in spooled:
+            metadata, vectors = await load_upload(upload)
+            all_metadata.extend(metadata)
+            if len(metadata):
+                all_vectors.append(vectors)
+    finally:
+        uploads.discard(spooled)
+    return all_metadata, all_vectors
+
+async def retrieve_from_uploads(query, files):
+    # The query is embedded (through the batcher) while the files are processed
+    (all_metadata, all_vectors), query_vector = await asyncio.gather(
+        metrics.timed("uploads", read_uploads(files)), metrics.timed("batcher.encode", batcher.encode(query)))
+    if not all_metadata:
+        raise HTTPException(status_code=400, detail="No valid text found in uploaded files.")
+    return rank_chunks(query_vector, all_metadata, np.concatenate(all_vectors))
+
+async def log_query(query, result, user_id=None):
+    # Queued for a batched write (and the user's queries_made), see query_log.py
+    with metrics.span("query_log"):
+        await query_log.writer.log(new_query_doc(query, result, user_id))
+
+async def read_search_filter(insurer, source):
+    # Optional comma-separated "insurer" codes (BAJ, HDF, ...) and "source" file
+    # names; retrieval then only searches the matching documents' shards
+    search_filter = shards.search_filter(shards.parse_list(source), shards.parse_list(insurer))
+    if search_filter and not await workers.run_cpu(semantic_search.filter_ranges, search_filter):
+        raise HTTPException(status_code=400, detail="No indexed documents match the insurer/source filter.")
+    return search_filter
+
+def cache_fields(parsed, search_filter):
+    # Semantic cache entries only match queries searched with the same filter
+    return dict(parsed, search_filter=search_filter) if search_filter else parsed
+
+async def retrieve(query, files, no_cache, search_filter=None):
+    # Returns (clauses, parsed, query_vector, cached_result). On a semantic
+    # cache hit clauses is None and cached_result is the earlier result.
+    # search_filter (from read_search_filter) doesn't apply to uploaded files.
+    sources, insurers = search_filter or (None, None)
+    if files:
+        # If files are uploaded, process them on the fly
+        clauses, parsed = await asyncio.gather(
+            retrieve_from_uploads(query, files), workers.run_cpu(parse_query, query))
+        return clauses, parsed, None, None
+    if SEMANTIC_CACHE_ENABLED:
+        # Embed first so a paraphrase of a recent query can skip retrieval and the LLM
+        query_vector, parsed = await asyncio.gather(
+            metrics.timed("batcher.encode", batcher.encode(query)), workers.run_cpu(parse_query, query))
+        cached = None if no_cache else semantic_cache.lookup(query_vector, cache_fields(parsed, search_filter))
+        if cached is not None:
+            return None, parsed, query_vector, cached
+        with metrics.span("batcher.search"):
+            clauses = await batcher.search_vector(query_vector, top_k=5, query=query, sources=sources, insurers=insurers)
+        return clauses, parsed, query_vector, None
+    # No files: use prebuilt index (insurance, legal, HR, etc.);
+    # concurrent queries are encoded and searched together
+    clauses, parsed = await asyncio.gather(
+        metrics.timed("batcher.search", batcher.search(query, top_k=5, sources=sources, insurers=insurers)),
+        workers.run_cpu(parse_query, query))
+    return clauses, parsed, None, None
 
 @router.post("/analyze-query")
 async def analyze_query(
     query: str = Form(...),
     files: Optional[List[UploadFile]] = File(None),
-    user_id: Optional[str] = Form(None)
+    user_id: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    insurer: Optional[str] = Form(None),
+    source: Optional[str] = Form(None)
 ):
     try:
-        # If files are uploaded, process them on the fly
-        if files:
-            all_chunks = []
-            all_metadata = []
-            for file in files:
-                filename = file.filename
-                ext = filename.lower().split('.')[-1]
-                if ext == "pdf":
-                    doc = fitz.open(stream=await file.read(), filetype="pdf")
-                    for page_num, page in enumerate(doc):
-                        text = page.get_text()
-                        chunks = chunk_text(text)
-                        for chunk in chunks:
-                            all_chunks.append(chunk)
-                            all_metadata.append({
-                                "source": filename,
-                                "page": page_num + 1,
-                                "text": chunk
-                            })
-                elif ext == "docx":
-                    text = extract_text_from_docx(file.file)
-                    chunks = chunk_text(text)
-                    for idx, chunk in enumerate(chunks):
-                        all_chunks.append(chunk)
-                        all_metadata.append({
-                            "source": filename,
-                            "section": idx + 1,
-                            "text": chunk
-                        })
-                elif ext == "eml":
-                    text = extract_text_from_eml(file.file)
-                    chunks = chunk_text(text)
-                    for idx, chunk in enumerate(chunks):
-                        all_chunks.append(chunk)
-                        all_metadata.append({
-                            "source": filename,
-                            "section": idx + 1,
-                            "text": chunk
-                        })
-                else:
-                    continue
-            if not all_chunks:
-                raise HTTPException(status_code=400, detail="No valid text found in uploaded files.")
-            # Embed and search
-            chunk_vectors = embed_chunks(all_chunks)
-            query_vector = embedding_model.encode([query])[0]
-            # Compute cosine similarity
-            similarities = np.dot(chunk_vectors, query_vector) / (
-                np.linalg.norm(chunk_vectors, axis=1) * np.linalg.norm(query_vector) + 1e-8)
-            top_indices = np.argsort(similarities)[-5:][::-1]
-            clauses = [all_metadata[i] for i in top_indices]
-        else:
-            # No files: use prebuilt index (insurance, legal, HR, etc.)
-            clauses = search(query, top_k=5)
-
-        parsed = parse_query(query)
-        decision_json = get_decision(query, parsed, clauses)
-
-        # Parse the LLM's response as JSON
-        try:
-            decision_data = json.loads(decision_json)
-        except Exception:
-            import re
-            match = re.search(r'\{.*\}', decision_json, re.DOTALL)
-            if match:
-                decision_data = json.loads(match.group(0))
-            else:
-                raise HTTPException(status_code=500, detail="LLM did not return valid JSON.")
-
-        justification = {
-            "explanation": decision_data.get("justification", ""),
-            "clauses": [
-                {"clause": c["text"], "document": c["source"], "page": c.get("page", c.get("section", None))}
-                for c in clauses
-            ]
-        }
-
-        result = {
-            "decision": decision_data.get("decision", ""),
-            "amount": decision_data.get("amount", 0),
-            "justification": justification
-        }
-
-        # Generate unique query_id and timestamp
-        query_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow()
-        
-        # Insert document with query_id and timestamp (and user_id if provided)
-        doc = {
-            "query_id": query_id,
-            "query": query,
-            "timestamp": timestamp,
-            **result
-        }
-        if user_id:
-            doc["user_id"] = user_id
-        await queries_col.insert_one(doc)
+        search_filter = await read_search_filter(insurer, source)
+        with metrics.span("retrieve"):
+            clauses, parsed, query_vector, cached = await retrieve(query, files, no_cache, search_filter)
+        if cached is not None:
+            await log_query(query, cached, user_id)
+            return JSONResponse(content=cached)
+
+        with metrics.span("decision"):
+            decision_json = await get_decision_async(query, parsed, clauses, use_cache=not no_cache)
+        result = build_result(parse_decision(decision_json), clauses)
+        if query_vector is not None:
+            semantic_cache.add(query_vector, cache_fields(parsed, search_filter), result)
+
+        await log_query(query, result, user_id)
         return JSONResponse(content=result)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("/analyze-query failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/analyze-query/stream")
+async def analyze_query_stream(
+    query: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    user_id: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    insurer: Optional[str] = Form(None),
+    source: Optional[str] = Form(None)
+):
+    # Same as /analyze-query, but as Server-Sent Events: a "clauses" event as
+    # soon as retrieval finishes, "token" events while the LLM writes, then a
+    # "decision" event with the parsed result (or an "error" event). The query
+    # is logged to Mongo after the response has been sent.
+    try:
+        # Uploads are read before the response starts, while they're still open
+        search_filter = await read_search_filter(insurer, source)
+        with metrics.span("retrieve"):
+            clauses, parsed, query_vector, cached = await retrieve(query, files, no_cache, search_filter)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("/analyze-query/stream failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finished = {}
+
+    async def events():
+        if cached is not None:
+            yield sse_event("clauses", cached["justification"]["clauses"])
+            finished["result"] = cached
+            yield sse_event("decision", cached)
+            return
+        yield sse_event("clauses", build_result({}, clauses)["justification"]["clauses"])
+        try:
+            pieces = []
+            async for piece in stream_decision(query, parsed, clauses, use_cache=not no_cache):
+                pieces.append(piece)
+                yield sse_event("token", piece)
+            result = build_result(parse_decision("".join(pieces)), clauses)
+        except Exception as e:
+            logger.exception("/analyze-query/stream failed while streaming")
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield sse_event("error", {"detail": detail})
+            return
+        if query_vector is not None:
+            semantic_cache.add(query_vector, cache_fields(parsed, search_filter), result)
+        finished["result"] = result
+        yield sse_event("decision", result)
+
+    async def log_when_finished():
+        if "result" in finished:
+            await log_query(query, finished["result"], user_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(log_when_finished),
+    )
+
+@router.post("/analyze-batch")
+async def analyze_batch(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    no_cache: bool = Form(False)
+):
+    # Takes a JSONL file of {"query": ..., "id": ..., "user_id": ...} lines and
+    # streams newline-delimited JSON progress and result events back
+    # Read lazily, one batch of lines at a time in a worker thread, rather
+    # than holding the whole upload
+    lines = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace")
+
+    async def events():
+        async for event in batch_analyzer.analyze_batch(
+                batch_analyzer.read_jsonl(lines), collection=query_log.writer, user_id=user_id, use_cache=not no_cache):
+            yield json.dumps(event, default=str) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/api/stats/query-batcher")
+def query_batcher_stats():
+    return batcher.stats()
+
+@router.get("/api/stats/decision-cache")
+def decision_cache_stats():
+    return decision_cache.stats()
+
+@router.get("/api/stats/semantic-cache")
+def semantic_cache_stats():
+    return semantic_cache.stats()
+
+@router.get("/api/stats/upload-cache")
+def upload_cache_stats():
+    return dict(upload_cache.cache.stats(), page_cache=uploads.page_cache.stats())
+
+@router.get("/api/stats/query-log")
+def query_log_stats():
+    return query_log.writer.stats()
+
+@router.get("/api/stats/embeddings")
+def embedding_stats():
+    return embeddings.stats()
+
+@router.get("/api/stats/claim-rules")
+def claim_rules_stats():
+    return claim_rules.engine.stats()
+
+@router.get("/api/stats/context-packer")
+def context_packer_stats():
+    return context_packer.stats.stats()
+
 
 # --- User Profile Models and Endpoints ---
 class UserProfile(BaseModel):
@@ -188,16 +310,42 @@ class UserProfile(BaseModel):
     email: str
 
 @router.put("/api/user/profile-picture")
-def update_profile_picture(user_id: str = Query(...), file: UploadFile = File(...)):
-    users_col = db["users"]
-    user = users_col.find_one({"_id": user_id})
-    if not user:
+async def update_profile_picture(user_id: str = Query(...), file: UploadFile = File(...)):
+    # Stored as thumbnails in GridFS, see profile_pictures.py
+    if not await users_col.find_one({"_id": user_id}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="User not found")
-    # Read and encode file as base64
-    file_bytes = file.file.read()
-    b64_str = base64.b64encode(file_bytes).decode("utf-8")
-    users_col.update_one({"_id": user_id}, {"$set": {"profile_picture": b64_str}})
-    return {"message": "Profile picture updated"}
+    file_bytes = await file.read(profile_pictures.PROFILE_PICTURE_MAX_BYTES + 1)
+    if len(file_bytes) > profile_pictures.PROFILE_PICTURE_MAX_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"Picture is larger than the {profile_pictures.PROFILE_PICTURE_MAX_BYTES} byte limit.")
+    try:
+        version = await profile_pictures.store(user_id, file_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Profile picture updated", "profile_picture": profile_pictures.picture_url(user_id, version)}
+
+@router.get("/api/user/profile-picture")
+async def get_profile_picture(
+    request: Request,
+    user_id: str = Query(...),
+    size: Optional[int] = Query(None, ge=1),
+    v: Optional[str] = Query(None)
+):
+    # The version is the ETag, so a browser revalidating an unchanged picture
+    # gets a 304 without any image bytes being read from GridFS
+    picture = await profile_pictures.open_picture(user_id, profile_pictures.pick_size(size))
+    if picture is None:
+        raise HTTPException(status_code=404, detail="No profile picture")
+    version = picture.metadata["version"]
+    etag = f'"{version}-{picture.metadata["size"]}"'
+    headers = {
+        "ETag": etag,
+        # Versioned URLs (from /api/user/profile) never change content
+        "Cache-Control": "private, max-age=31536000, immutable" if v == version else "private, no-cache",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(await picture.read(), media_type=picture.metadata["content_type"], headers=headers)
 
 class ChangePasswordRequest(BaseModel):
     user_id: str
@@ -205,43 +353,42 @@ class ChangePasswordRequest(BaseModel):
     new_password: str
 
 @router.post("/api/user/change-password")
-def change_password(data: ChangePasswordRequest):
-    users_col = db["users"]
-    user = users_col.find_one({"_id": data.user_id})
+async def change_password(data: ChangePasswordRequest):
+    user = await users_col.find_one({"_id": data.user_id}, mongodb.LOGIN_FIELDS)
     if not user or user.get("password") != data.old_password:
         raise HTTPException(status_code=401, detail="Old password is incorrect")
-    users_col.update_one({"_id": data.user_id}, {"$set": {"password": data.new_password}})
+    await users_col.update_one({"_id": data.user_id}, {"$set": {"password": data.new_password}})
     return {"message": "Password changed successfully"}
 
-# Update get and put profile endpoints to include profile_picture
-@router.get("/api/user/profile", response_model=UserProfile)
-def get_user_profile(user_id: str = Query(...)):
-    users_col = db["users"]
-    user = users_col.find_one({"_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def profile_response(user):
+    version = user.get("profile_picture_version")
+    if not version:
+        # A picture from before GridFS is moved there the first time it's needed
+        version = await profile_pictures.migrate_legacy(user["_id"])
     return {
         "name": user.get("name", ""),
         "email": user.get("email", ""),
-        "profile_picture": user.get("profile_picture", ""),
+        "profile_picture": profile_pictures.picture_url(user["_id"], version),
         "queries_made": user.get("queries_made", 0),
         "last_login": user.get("last_login", ""),
         "created_at": user.get("created_at", "")
     }
 
-@router.put("/api/user/profile", response_model=UserProfile)
-def update_user_profile(data: UserProfile, user_id: str = Query(...)):
-    users_col = db["users"]
-    result = users_col.update_one({"_id": user_id}, {"$set": data.dict()}, upsert=True)
-    user = users_col.find_one({"_id": user_id})
-    return {
-        "name": user.get("name", ""),
-        "email": user.get("email", ""),
-        "profile_picture": user.get("profile_picture", ""),
-        "queries_made": user.get("queries_made", 0),
-        "last_login": user.get("last_login", ""),
-        "created_at": user.get("created_at", "")
-    }
+# profile_picture is the URL of the picture ("" if none)
+@router.get("/api/user/profile", response_model=models.UserProfile)
+async def get_user_profile(user_id: str = Query(...)):
+    user = await users_col.find_one({"_id": user_id}, mongodb.PROFILE_FIELDS)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return await profile_response(user)
+
+@router.put("/api/user/profile", response_model=models.UserProfile)
+async def update_user_profile(data: UserProfile, user_id: str = Query(...)):
+    # Update and read back in one round trip
+    user = await users_col.find_one_and_update(
+        {"_id": user_id}, {"$set": data.dict()}, projection=mongodb.PROFILE_FIELDS,
+        upsert=True, return_document=ReturnDocument.AFTER)
+    return await profile_response(user)
 
 class SignupRequest(BaseModel):
     name: str
@@ -249,24 +396,25 @@ class SignupRequest(BaseModel):
     password: str
 
 @router.post("/api/user/signup")
-def signup_user(data: SignupRequest):
-    users_col = db["users"]
+async def signup_user(data: SignupRequest):
     # Check if user already exists
-    if users_col.find_one({"email": data.email}):
+    if await users_col.find_one({"email": data.email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
-    import uuid
     now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     user_doc = {
         "_id": str(uuid.uuid4()),
         "name": data.name,
         "email": data.email,
         "password": data.password,  # In production, hash this!
-        "profile_picture": "",
         "queries_made": 0,
         "last_login": now,
         "created_at": now
     }
-    users_col.insert_one(user_doc)
+    try:
+        await users_col.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same email (unique index)
+        raise HTTPException(status_code=400, detail="Email already registered")
     return {"message": "Signup successful", "user_id": user_doc["_id"]}
 
 class LoginRequest(BaseModel):
@@ -274,24 +422,29 @@ class LoginRequest(BaseModel):
     password: str
 
 @router.post("/api/user/login")
-def login_user(data: LoginRequest):
-    users_col = db["users"]
-    user = users_col.find_one({"email": data.email})
+async def login_user(data: LoginRequest):
+    user = await users_col.find_one({"email": data.email}, mongodb.LOGIN_FIELDS)
     if not user or user.get("password") != data.password:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    users_col.update_one({"_id": user["_id"]}, {"$set": {"last_login": now}})
+    await users_col.update_one({"_id": user["_id"]}, {"$set": {"last_login": now}})
     return {"message": "Login successful", "user_id": user["_id"]}
 
 @router.get("/api/user/chat-history")
-def get_user_chat_history(user_id: str = Query(...), limit: int = 10):
-    queries_col = db_async.queries
-    # Find recent queries for this user_id, sorted by timestamp descending
-    results = list(queries_col.find({"user_id": user_id}).sort("timestamp", -1).limit(limit))
+async def get_user_chat_history(
+    user_id: str = Query(...),
+    limit: int = Query(10, ge=1, le=100),
+    before: Optional[str] = Query(None)
+):
+    # Recent queries for this user_id, newest first. Pass the returned
+    # next_cursor as `before` to get the page after this one.
+    try:
+        results, next_cursor = await mongodb.query_history(user_id, limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # Remove MongoDB _id and format timestamp
     for r in results:
         r.pop("_id", None)
         if "timestamp" in r:
             r["timestamp"] = str(r["timestamp"])
-    return {"history": results}
-
+    return {"history": results, "next_cursor": next_cursor}
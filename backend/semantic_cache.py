@@ -0,0 +1,113 @@
+# semantic_cache.py
+#
+# Recent /analyze-query results keyed by query embedding. A new query whose
+# embedding is within SEMANTIC_CACHE_THRESHOLD cosine similarity of a cached
+# one, and whose parse_query fields are identical, reuses that result and
+# skips both retrieval and the LLM. The cache empties itself whenever the
+# clause index on disk changes.
+#
+# Only touched from the event loop thread; the index is small enough that
+# searching it inline costs microseconds.
+
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+import faiss
+import semantic_search
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # seconds
+CANDIDATES = 4  # neighbours checked for matching parsed fields
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+    return vector / (np.linalg.norm(vector) + 1e-8)
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index = None
+        self.entries = OrderedDict()  # id -> (stored_at, parsed, result), oldest first
+        self.next_id = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.field_mismatches = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def clear(self):
+        self.index = None
+        self.entries.clear()
+
+    def _check_version(self):
+        # Cached answers cite clauses from a specific index; drop them when it changes
+        version = semantic_search.index_version()
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+
+    def _remove(self, entry_id):
+        self.entries.pop(entry_id, None)
+        self.index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def lookup(self, vector, parsed):
+        self._check_version()
+        if not self.entries:
+            self.misses += 1
+            return None
+        scores, ids = self.index.search(normalize(vector), min(CANDIDATES, len(self.entries)))
+        now = time.time()
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id == -1 or score < self.threshold:
+                break
+            stored_at, cached_parsed, result = self.entries[int(entry_id)]
+            if now - stored_at > self.ttl:
+                self._remove(int(entry_id))
+                continue
+            if cached_parsed != parsed:
+                # Similar wording but e.g. a different age or policy duration
+                self.field_mismatches += 1
+                continue
+            self.entries.move_to_end(int(entry_id))
+            self.hits += 1
+            return result
+        self.misses += 1
+        return None
+
+    def add(self, vector, parsed, result):
+        self._check_version()
+        vector = normalize(vector)
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+        entry_id = self.next_id
+        self.next_id += 1
+        self.index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+        self.entries[entry_id] = (time.time(), parsed, result)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "field_mismatches": self.field_mismatches,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+cache = SemanticCache()
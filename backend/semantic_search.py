@@ -1,36 +1,206 @@
 # semantic_search.py
 
+import os
+import json
+import bisect
+import threading
 import faiss
-import pickle
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import faiss_indexes
+import chunk_store
+import bm25_index
+import shards
+import embeddings
+import metrics
 
 # Paths
 INDEX_PATH = "./faiss_index/clause_index.faiss"
-META_PATH = "./faiss_index/metadata.pkl"
+STORE_DIR = "./faiss_index/chunks"
+BM25_DIR = "./faiss_index/bm25"
+MANIFEST_PATH = "./faiss_index/manifest.json"
+VECTOR_DIR = "./faiss_index/vectors"
 
-# Load FAISS index + metadata
-index = faiss.read_index(INDEX_PATH)
-with open(META_PATH, "rb") as f:
-    metadata = pickle.load(f)
+# "hybrid" fuses FAISS and BM25 rankings with reciprocal rank fusion;
+# "vector" is FAISS only. Hybrid falls back to vector without a BM25 index.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("SEARCH_HYBRID_CANDIDATES", "50"))  # taken from each ranking before fusing
 
-# Load embedding model
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+class IndexState:
+    # Everything the ingestor writes for one version of the index, loaded
+    # together so a search never mixes files from two ingests. The chunk
+    # store is memory-mapped; shard indexes and vector files open on first use.
+    # index is None before the first ingest and after the last document is removed.
+    def __init__(self, version):
+        self.version = version
+        self.metadata = chunk_store.ChunkStore(STORE_DIR) if chunk_store.exists(STORE_DIR) else None
+        self.keyword_index = bm25_index.BM25Index(BM25_DIR) if bm25_index.exists(BM25_DIR) else None
+        self.shard_map = None  # shards.json, None without shards (filtered searches then use the main index)
+        if shards.SHARDS_ENABLED and os.path.exists(shards.SHARDS_PATH):
+            with open(shards.SHARDS_PATH) as f:
+                self.shard_map = json.load(f)
+        try:
+            with open(MANIFEST_PATH) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"documents": {}, "dim": None}
+        self.documents = manifest["documents"]
+        docs = sorted(self.documents.items(), key=lambda item: item[1]["ids"][0])
+        self.vector_ranges = [e["ids"] for _, e in docs]
+        self.vector_names = [name for name, _ in docs]
+        self.dim = manifest["dim"]
+        self.index = faiss.read_index(INDEX_PATH) if os.path.exists(INDEX_PATH) else None
+        self.shard_indexes = {}
+        self.vector_maps = {}
+        self._lock = threading.Lock()
 
-def search(query, top_k=5):
-    # Embed the query
-    query_vector = embedding_model.encode([query])
-    query_vector = np.array(query_vector).astype('float32')
+    def shard_index(self, key):
+        if key not in self.shard_indexes:
+            with self._lock:
+                if key not in self.shard_indexes:
+                    path = os.path.join(shards.SHARD_DIR, self.shard_map["shards"][key]["file"])
+                    self.shard_indexes[key] = faiss.read_index(path)
+        return self.shard_indexes[key]
+
+    def vector_file(self, name):
+        if name not in self.vector_maps:
+            with self._lock:
+                if name not in self.vector_maps:
+                    self.vector_maps[name] = np.memmap(
+                        os.path.join(VECTOR_DIR, name + ".f32"), dtype="float32", mode="r").reshape(-1, self.dim)
+        return self.vector_maps[name]
+
+_state = None
+_lock = threading.Lock()
+
+def index_version():
+    # Changes whenever the ingestor writes (or removes) the index, manifest or shard map
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                 for path in (INDEX_PATH, MANIFEST_PATH, shards.SHARDS_PATH))
+
+def current():
+    # The loaded IndexState, replaced as a whole once the files on disk change.
+    # Take it once per operation and use only that snapshot.
+    global _state
+    version = index_version()
+    if _state is None or _state.version != version:
+        with _lock:
+            if _state is None or _state.version != version:
+                _state = IndexState(version)
+    return _state
+
+def load_index():
+    state = current()
+    return state.index, state.metadata
+
+def filter_ranges(search_filter, state=None):
+    # [first, end) chunk id ranges of the documents matching the filter
+    state = state or current()
+    if state.shard_map is not None:
+        return sorted(ids for shard in state.shard_map["shards"].values()
+                      for filename, ids in shard["sources"].items() if shards.matches(filename, search_filter))
+    return shards.document_ranges(state.documents, search_filter)
+
+def filtered_vector_search(state, query_vectors, k, nprobe, ef_search, search_filter):
+    # Searches only the shards holding matching documents (narrowed further to
+    # the matching sources' ids where a shard holds others too) and merges
+    # each query's top k across them by distance
+    if state.shard_map is not None:
+        parts = [faiss_indexes.search(state.shard_index(key), query_vectors, k, nprobe, ef_search, ranges)
+                 for key, ranges in shards.route(state.shard_map, search_filter)]
+    else:
+        ranges = filter_ranges(search_filter, state)
+        parts = [faiss_indexes.search(state.index, query_vectors, k, nprobe, ef_search, ranges)] if ranges else []
+    if not parts:
+        return np.full((len(query_vectors), k), np.inf, dtype="float32"), np.full((len(query_vectors), k), -1)
+    distances = np.concatenate([d for d, _ in parts], axis=1)
+    indices = np.concatenate([i for _, i in parts], axis=1)
+    order = np.argsort(np.where(indices == -1, np.inf, distances), axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+def clause_vectors(chunk_ids):
+    # Stored embeddings of already-indexed chunks, read from the vector store
+    # rather than re-encoded; None for ids it doesn't hold
+    state = current()
+    ranges, names = state.vector_ranges, state.vector_names
+    vectors = []
+    for chunk_id in chunk_ids:
+        pos = bisect.bisect_right(ranges, [chunk_id, float("inf")]) - 1
+        if pos < 0 or not ranges[pos][0] <= chunk_id < ranges[pos][1]:
+            vectors.append(None)
+            continue
+        vectors.append(np.asarray(state.vector_file(names[pos])[chunk_id - ranges[pos][0]]))
+    return vectors
+
+def encode_queries(queries):
+    with metrics.span("encode"):
+        return np.array(embeddings.encode(list(queries))).astype('float32')
+
+def rrf_fuse(rankings, top_k, k=RRF_K):
+    # Reciprocal rank fusion: each ranking adds 1 / (k + rank) to a chunk's score,
+    # so only ranks matter and L2 distances never have to be compared with BM25 scores
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            if chunk_id != -1:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+def keyword_search(query, top_k=5, sources=None, insurers=None):
+    state = current()
+    if state.index is None or state.keyword_index is None:
+        return []
+    search_filter = shards.search_filter(sources, insurers)
+    ranges = filter_ranges(search_filter, state) if search_filter else None
+    with metrics.span("bm25_search"):
+        chunk_ids, _ = state.keyword_index.search(query, top_k, ranges)
+    return state.metadata.get_many(chunk_ids)
+
+def search_vectors(query_vectors, top_k=5, nprobe=None, ef_search=None, queries=None, mode=None, search_filter=None):
+    # nprobe (IVF indexes) and ef_search (HNSW) trade recall for latency;
+    # they default to SEARCH_NPROBE / SEARCH_EF_SEARCH. Hybrid search needs
+    # the query texts; entries that are None are searched by vector only.
+    # search_filter (from shards.search_filter) limits every query to the
+    # matching insurers / source files.
+    state = current()
+    if state.index is None:
+        return [[] for _ in query_vectors]
+    metadata, keyword_index = state.metadata, state.keyword_index
+    hybrid = (mode or SEARCH_MODE) == "hybrid" and queries is not None and keyword_index is not None
+    ranges = filter_ranges(search_filter, state) if search_filter else None
 
     # Perform search
-    distances, indices = index.search(query_vector, top_k)
+    k = max(top_k, HYBRID_CANDIDATES) if hybrid else top_k
+    query_vectors = np.asarray(query_vectors, dtype='float32')
+    with metrics.span("faiss_search"):
+        if search_filter:
+            distances, indices = filtered_vector_search(state, query_vectors, k, nprobe, ef_search, search_filter)
+        else:
+            distances, indices = faiss_indexes.search(state.index, query_vectors, k, nprobe, ef_search)
 
+    # FAISS pads with -1 when the index holds fewer than top_k vectors
+    if not hybrid:
+        return [metadata.get_many(row) for row in indices]
     results = []
-    for idx in indices[0]:
-        results.append(metadata[idx])
-
+    for row, query in zip(indices, queries):
+        if query is None:
+            results.append(metadata.get_many(row[:top_k]))
+            continue
+        with metrics.span("bm25_search"):
+            keyword_ids, _ = keyword_index.search(query, HYBRID_CANDIDATES, ranges)
+        results.append(metadata.get_many(rrf_fuse([row.tolist(), keyword_ids.tolist()], top_k)))
     return results
 
+def search_many(queries, top_k=5, nprobe=None, ef_search=None, mode=None, sources=None, insurers=None):
+    # One encode() and one index.search() for the whole list of queries.
+    # sources (file names) and insurers (codes like "BAJ") restrict the search
+    # to matching documents; only their shards are searched.
+    return search_vectors(encode_queries(queries), top_k, nprobe, ef_search, queries, mode,
+                          shards.search_filter(sources, insurers))
+
+def search(query, top_k=5, nprobe=None, ef_search=None, mode=None, sources=None, insurers=None):
+    return search_many([query], top_k, nprobe, ef_search, mode, sources, insurers)[0]
+
 # Example use
 if __name__ == "__main__":
     query = "46-year-old male, knee surgery in Pune, 3-month-old insurance policy"
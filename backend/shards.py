@@ -0,0 +1,65 @@
+# shards.py
+#
+# Per-insurer (or per-source) FAISS shards next to the main clause index.
+# The ingestor groups documents by shard key and builds one index per group
+# from the vector store; semantic_search routes a search restricted to some
+# insurers or source files to just the shards holding them. Layout:
+#   faiss_index/shards/shards.json  shard key -> index file and its sources' id ranges
+#   faiss_index/shards/<key>.faiss  one index per shard, holding the global chunk ids
+#
+# With SHARD_BY=insurer the key is the insurer code that starts each policy
+# file name (BAJHLIP23020V012223.pdf -> BAJ); with SHARD_BY=source every
+# file gets its own shard.
+
+import os
+import re
+
+SHARD_BY = os.getenv("SHARD_BY", "insurer")  # insurer | source
+SHARDS_ENABLED = os.getenv("SHARDS", "1") == "1"
+SHARD_DIR = "./faiss_index/shards"
+SHARDS_PATH = os.path.join(SHARD_DIR, "shards.json")
+
+INSURER_CODE_RE = re.compile(r"^([A-Za-z]{3})")
+
+def insurer_code(filename):
+    match = INSURER_CODE_RE.match(filename)
+    return match.group(1).upper() if match else "OTHER"
+
+def shard_key(filename, shard_by=SHARD_BY):
+    return insurer_code(filename) if shard_by == "insurer" else filename
+
+def shard_file(key):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", key) + ".faiss"
+
+def search_filter(sources=None, insurers=None):
+    # Hashable (sources, insurers) filter, None when nothing is filtered. Either
+    # part may be None; a chunk must match both parts that are given.
+    sources = tuple(sorted(set(sources))) if sources else None
+    insurers = tuple(sorted({code.upper() for code in insurers})) if insurers else None
+    if sources is None and insurers is None:
+        return None
+    return sources, insurers
+
+def parse_list(value):
+    # "BAJ, HDF" -> ["BAJ", "HDF"]; None or "" -> None
+    items = [item.strip() for item in (value or "").split(",") if item.strip()]
+    return items or None
+
+def matches(filename, search_filter):
+    sources, insurers = search_filter
+    return (sources is None or filename in sources) and (insurers is None or insurer_code(filename) in insurers)
+
+def route(shard_map, search_filter):
+    # [(shard key, id ranges to keep or None for the whole shard)] for the
+    # shards holding documents that match the filter
+    plan = []
+    for key, shard in sorted(shard_map["shards"].items()):
+        ranges = [ids for filename, ids in sorted(shard["sources"].items()) if matches(filename, search_filter)]
+        if not ranges:
+            continue
+        plan.append((key, None if len(ranges) == len(shard["sources"]) else ranges))
+    return plan
+
+def document_ranges(manifest_documents, search_filter):
+    # Id ranges of every document matching the filter, from the ingestor's manifest
+    return sorted(entry["ids"] for filename, entry in manifest_documents.items() if matches(filename, search_filter))
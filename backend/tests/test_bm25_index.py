@@ -0,0 +1,96 @@
+import faiss
+import numpy as np
+import bm25_index
+import chunk_store
+import semantic_search
+
+TEXTS = [
+    "Cataract surgery is covered after a waiting period of 24 months.",
+    "Room rent is limited to 1% of the sum insured per day.",
+    "Maternity expenses are excluded in the first year.",
+    "Clause 4.2.1 sets the sub-limit for cataract per eye.",
+    "Ambulance charges are paid up to the sum insured.",
+]
+
+def build(tmp_path, texts=TEXTS):
+    directory = str(tmp_path / "bm25")
+    bm25_index.build_index(directory, ((i, {"text": t}) for i, t in enumerate(texts)))
+    return bm25_index.BM25Index(directory)
+
+def test_tokenize_keeps_dotted_and_hyphenated_runs():
+    assert bm25_index.tokenize("Clause 4.2.1: the Sub-Limit") == ["clause", "4.2.1", "4", "2", "1", "sub-limit", "sub", "limit"]
+
+def test_search_ranks_matching_chunks(tmp_path):
+    index = build(tmp_path)
+    ids, scores = index.search("cataract sub limit", top_k=3)
+    # Chunk 3 matches all three terms, chunk 0 only "cataract"
+    assert ids.tolist() == [3, 0]
+    assert scores[0] > scores[1] > 0
+    # Chunks sharing no term are never returned, however large top_k is
+    assert index.search("dental", top_k=10)[0].tolist() == []
+
+def test_rare_terms_outweigh_common_ones(tmp_path):
+    index = build(tmp_path)
+    ids, _ = index.search("sum insured ambulance", top_k=2)
+    assert ids.tolist() == [4, 1]
+
+def test_search_within_id_ranges(tmp_path):
+    index = build(tmp_path)
+    assert index.search("cataract", top_k=5, id_ranges=[[0, 2]])[0].tolist() == [0]
+    assert index.search("cataract", top_k=5, id_ranges=[[2, 5]])[0].tolist() == [3]
+    assert index.search("cataract", top_k=5, id_ranges=[])[0].tolist() == []
+
+def test_rrf_fuse_rewards_agreement():
+    # 7 is first in one ranking only; 3 is second in both and wins
+    assert semantic_search.rrf_fuse([[7, 3, 5], [3, 9, 5]], 4, k=60) == [3, 5, 7, 9]
+    # FAISS pads with -1, which is never a result
+    assert semantic_search.rrf_fuse([[2, -1, -1], [4]], 5) == [2, 4]
+    assert semantic_search.rrf_fuse([[1, 2, 3], []], 2) == [1, 2]
+
+def test_hybrid_search_fuses_vector_and_keyword_rankings(tmp_path, monkeypatch):
+    directory = tmp_path / "faiss_index"
+    directory.mkdir()
+    chunks = [(i, {"source": "a.pdf", "text": t}) for i, t in enumerate(TEXTS)]
+    chunk_store.write_store(str(directory / "chunks"), chunks)
+    chunk_store.commit_store(str(directory / "chunks"))
+    bm25_index.build_index(str(directory / "bm25"), chunks)
+    # Chunk i sits at distance i from the query vector, so FAISS ranks 0, 1, 2, 3, 4
+    vectors = np.zeros((len(TEXTS), 4), dtype="float32")
+    vectors[:, 0] = np.arange(len(TEXTS))
+    index = faiss.IndexFlatL2(4)
+    index.add(vectors)
+    faiss.write_index(index, str(directory / "index.faiss"))
+    monkeypatch.setattr(semantic_search, "INDEX_PATH", str(directory / "index.faiss"))
+    monkeypatch.setattr(semantic_search, "STORE_DIR", str(directory / "chunks"))
+    monkeypatch.setattr(semantic_search, "BM25_DIR", str(directory / "bm25"))
+    monkeypatch.setattr(semantic_search, "MANIFEST_PATH", str(directory / "manifest.json"))
+    monkeypatch.setattr(semantic_search.shards, "SHARDS_ENABLED", False)
+    monkeypatch.setattr(semantic_search, "_state", None)
+
+    query = np.zeros((1, 4), dtype="float32")
+    vector_only = semantic_search.search_vectors(query, 3, queries=["ambulance"], mode="vector")[0]
+    assert [c["id"] for c in vector_only] == [0, 1, 2]
+    # 4 is last by vector but the only keyword match; appearing in both rankings
+    # puts it ahead of the vector-only 0
+    hybrid = semantic_search.search_vectors(query, 3, queries=["ambulance"], mode="hybrid")[0]
+    assert [c["id"] for c in hybrid] == [4, 0, 1]
+    # A query without text is searched by vector only
+    assert [c["id"] for c in semantic_search.search_vectors(query, 3, queries=[None], mode="hybrid")[0]] == [0, 1, 2]
+
+def test_search_after_the_last_document_is_removed(tmp_path, monkeypatch):
+    # The ingestor deletes the index file; the chunk store and BM25 index stay, empty
+    directory = tmp_path / "faiss_index"
+    chunk_store.write_store(str(directory / "chunks"), [])
+    chunk_store.commit_store(str(directory / "chunks"))
+    bm25_index.build_index(str(directory / "bm25"), [])
+    monkeypatch.setattr(semantic_search, "INDEX_PATH", str(directory / "index.faiss"))
+    monkeypatch.setattr(semantic_search, "STORE_DIR", str(directory / "chunks"))
+    monkeypatch.setattr(semantic_search, "BM25_DIR", str(directory / "bm25"))
+    monkeypatch.setattr(semantic_search, "MANIFEST_PATH", str(directory / "manifest.json"))
+    monkeypatch.setattr(semantic_search.shards, "SHARDS_ENABLED", False)
+    monkeypatch.setattr(semantic_search, "_state", None)
+
+    query = np.zeros((2, 4), dtype="float32")
+    assert semantic_search.search_vectors(query, 3, queries=["ambulance", None]) == [[], []]
+    assert semantic_search.keyword_search("ambulance") == []
+    assert semantic_search.clause_vectors([0]) == [None]
@@ -0,0 +1,86 @@
+import os
+import pickle
+import chunk_store
+
+CHUNKS = [
+    (0, {"source": "a.pdf", "page": 1, "start": 0, "end": 11, "text": "First page."}),
+    (1, {"source": "a.pdf", "page": 2, "text": "Zweite Seite, naïve café."}),
+    (2, {"source": "b.docx", "section": 3, "text": "A docx section."}),
+    (3, {"source": "c.eml", "text": ""}),
+]
+
+def test_write_and_lookup_round_trip(tmp_path):
+    directory = str(tmp_path / "chunks")
+    assert chunk_store.write_store(directory, CHUNKS) == 4
+    chunk_store.commit_store(directory)
+    store = chunk_store.ChunkStore(directory)
+    assert len(store) == 4
+    assert [meta for _, meta in store.items()] == [dict(meta, id=i) for i, meta in CHUNKS]
+    assert store.get(1)["text"] == "Zweite Seite, naïve café."
+    assert store[2] == dict(CHUNKS[2][1], id=2)
+    assert store.get(99) is None
+    # FAISS pads missing results with -1
+    assert [m["id"] for m in store.get_many([3, -1, 0])] == [3, 0]
+    store.close()
+
+def test_reads_are_memory_mapped(tmp_path):
+    directory = str(tmp_path / "chunks")
+    chunk_store.write_store(directory, CHUNKS)
+    chunk_store.commit_store(directory)
+    store = chunk_store.ChunkStore(directory)
+    assert store.ids.filename is not None
+    assert store.get(0)["text"] == "First page."
+    store.close()
+
+def test_store_without_offset_arrays(tmp_path):
+    # Stores written before chunks had start/end offsets
+    directory = str(tmp_path / "chunks")
+    chunk_store.write_store(directory, CHUNKS)
+    chunk_store.commit_store(directory)
+    os.remove(os.path.join(directory, "starts.npy"))
+    os.remove(os.path.join(directory, "ends.npy"))
+    store = chunk_store.ChunkStore(directory)
+    assert store.get(0) == {"id": 0, "source": "a.pdf", "page": 1, "text": "First page."}
+    store.close()
+
+def test_table_merges_edits_into_a_new_store(tmp_path):
+    directory = str(tmp_path / "chunks")
+    table = chunk_store.ChunkTable()
+    for chunk_id, meta in CHUNKS:
+        table[chunk_id] = meta
+    assert table.save(directory) == 4
+
+    table = chunk_store.ChunkTable(chunk_store.ChunkStore(directory))
+    table.pop(1)
+    table.pop(3)
+    table[4] = {"source": "d.pdf", "page": 7, "text": "Added later."}
+    table[5] = {"source": "d.pdf", "page": 8, "text": "Dropped before saving."}
+    table.pop(5)
+    assert table.save(directory) == 3
+    assert [chunk_id for chunk_id, _ in table.store.items()] == [0, 2, 4]
+    assert table.store.get(4)["source"] == "d.pdf"
+    assert table.store.get(1) is None
+    assert not table.added and not table.removed
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+    table.store.close()
+
+def test_convert_pickle_list(tmp_path):
+    pkl = tmp_path / "metadata.pkl"
+    with open(pkl, "wb") as f:
+        pickle.dump([meta for _, meta in CHUNKS], f)
+    directory = str(tmp_path / "chunks")
+    assert chunk_store.convert_pickle(str(pkl), directory) == 4
+    store = chunk_store.ChunkStore(directory)
+    assert [meta for _, meta in store.items()] == [dict(meta, id=i) for i, meta in CHUNKS]
+    store.close()
+
+def test_convert_pickle_dict(tmp_path):
+    pkl = tmp_path / "metadata.pkl"
+    with open(pkl, "wb") as f:
+        pickle.dump({10: CHUNKS[2][1], 5: CHUNKS[0][1]}, f)
+    directory = str(tmp_path / "chunks")
+    assert chunk_store.convert_pickle(str(pkl), directory) == 2
+    store = chunk_store.ChunkStore(directory)
+    assert [chunk_id for chunk_id, _ in store.items()] == [5, 10]
+    assert store.get(10)["section"] == 3
+    store.close()
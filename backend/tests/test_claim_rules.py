@@ -0,0 +1,134 @@
+import json
+import pytest
+import claim_rules
+
+PED = ("Expenses related to the treatment of a pre-existing disease (PED) and its direct complications shall be "
+       "excluded until the expiry of 36 months of continuous coverage after the date of inception of the policy. ")
+PORTABILITY = ("If the insured person is continuously covered without any break as defined under the portability "
+               "norms, then waiting period for the same would be reduced to the extent of prior coverage. ")
+CARRY_OVER = "The waiting period is reduced by the period of cover under the insured's previous policy with us. "
+LISTED = ("Expenses related to the treatment of the listed conditions, surgeries/treatments shall be excluded until "
+          "the expiry of 24 months of continuous coverage. ")
+INITIAL = ("Expenses related to the treatment of any illness within 30 days from the first policy commencement date "
+           "shall be excluded except claims arising due to an accident, provided the same are covered. ")
+COSMETIC = ("Exclusions: Expenses for cosmetic or plastic surgery or any treatment to change appearance unless for "
+            "reconstruction following an Accident, Burn(s) or Cancer. ")
+
+def chunks(*texts, source="a.pdf"):
+    return [(i, {"source": source, "page": i + 1, "text": text}) for i, text in enumerate(texts)]
+
+def by_id(rules):
+    return {rule["id"]: rule for rule in rules}
+
+def waiting(days, conditions=(), **extra):
+    return claim_rules.compile_rule(dict({"id": "w", "kind": "waiting_period", "days": days,
+                                          "period": f"{days // 30} months", "conditions": list(conditions),
+                                          "accident_exempt": True}, **extra))
+
+def test_extracts_waiting_periods_and_exclusions():
+    rules = by_id(claim_rules.extract_rules(chunks(INITIAL + COSMETIC, PED)))
+    ped = rules["pre_existing_disease_waiting_period"]
+    assert (ped["days"], ped["period"], ped["sources"]) == (1080, "36 months", ["a.pdf"])
+    assert ped["continuity_exception"] is False
+    assert ped["clause"] == {"text": PED.strip(), "source": "a.pdf", "page": 2}
+    initial = rules["initial_waiting_period"]
+    assert (initial["days"], initial["conditions"]) == (30, [])
+    # Counting from the first policy is just what a waiting period is
+    assert initial["continuity_exception"] is False
+    assert rules["cosmetic_surgery"]["kind"] == "exclusion"
+
+def test_first_policy_wording_is_not_an_exception():
+    first = PED.replace("inception of the policy", "inception of the first policy with us")
+    for text in (INITIAL, first, LISTED + "a. Cataract"):
+        assert claim_rules.extract_rules(chunks(text))[0]["continuity_exception"] is False
+
+def test_carried_over_cover_marks_the_rule():
+    # The standard portability paragraph only helps an insured who ported: the query says so
+    assert claim_rules.extract_rules(chunks(PED + PORTABILITY))[0]["continuity_exception"] is False
+    # In the same chunk or the next one of the same document
+    assert claim_rules.extract_rules(chunks(PED + CARRY_OVER))[0]["continuity_exception"] is True
+    assert claim_rules.extract_rules(chunks(PED, CARRY_OVER))[0]["continuity_exception"] is True
+    other = chunks(PED) + [(1, {"source": "b.pdf", "page": 1, "text": CARRY_OVER})]
+    assert claim_rules.extract_rules(other)[0]["continuity_exception"] is False
+
+def test_listed_conditions_continue_into_later_chunks():
+    rules = claim_rules.extract_rules(chunks(LISTED + "a. Cataract", "b. Hernia and hydrocele", "Excl03 c. Fistula"))
+    assert rules[0]["conditions"] == ["cataract", "hernia", "hydrocele"]
+
+def test_conflicting_statements_drop_the_rule():
+    first = "Insured persons not older than 65 years of age at the commencement of cover."
+    second = "Insured persons not older than 70 years of age at the commencement of cover."
+    assert claim_rules.extract_rules(chunks(first, second)) == []
+    assert len(claim_rules.extract_rules(chunks(first, first))) == 1
+
+@pytest.mark.parametrize("months, fired", [(28, True), (29, True), (30, False), (31, False)])
+def test_thirty_month_boundary(months, fired):
+    # Day 900 is the last of a 30-month wait; a 29-month-old policy is at most 900 days old
+    rule = waiting(900)
+    assert (claim_rules.fires(rule, "claim", {"policy_duration_months": months}) is not None) == fired
+
+def test_unknown_duration_never_fires():
+    assert claim_rules.fires(waiting(900), "claim", {"policy_duration_months": None}) is None
+    age_rule = claim_rules.compile_rule({"id": "a", "kind": "age_limit", "max_entry_age": 65})
+    assert claim_rules.fires(age_rule, "claim", {"age": 90, "policy_duration_months": None}) is None
+    assert claim_rules.fires(age_rule, "claim", {"age": 90, "policy_duration_months": 3}) is not None
+
+def test_accident_exemption():
+    rule = waiting(30)
+    assert claim_rules.fires(rule, "fever, admitted", {"policy_duration_months": 0}) is not None
+    assert claim_rules.fires(rule, "injured in a road accident", {"policy_duration_months": 0}) is None
+    cosmetic = claim_rules.compile_rule(by_id(claim_rules.extract_rules(chunks(COSMETIC)))["cosmetic_surgery"])
+    assert claim_rules.fires(cosmetic, "cosmetic surgery on the nose", {}) is not None
+    assert claim_rules.fires(cosmetic, "plastic surgery after a burn injury", {}) is None
+
+def test_conditions_and_continuity():
+    rule = waiting(720, conditions=["cataract"])
+    assert claim_rules.fires(rule, "cataract surgery", {"policy_duration_months": 3}) is not None
+    assert claim_rules.fires(rule, "knee surgery", {"policy_duration_months": 3}) is None
+    assert claim_rules.fires(rule, "cataract surgery, policy renewed 3 months ago",
+                             {"policy_duration_months": 3}) is None
+    assert claim_rules.fires(rule, "cataract, ported from another insurer", {"policy_duration_months": 3}) is None
+    excepted = waiting(720, conditions=["cataract"], continuity_exception=True)
+    assert claim_rules.fires(excepted, "cataract surgery", {"policy_duration_months": 3}) is None
+
+@pytest.fixture
+def engine(tmp_path):
+    rules = [
+        {"id": "w", "kind": "waiting_period", "sources": ["a.pdf"], "days": 720, "period": "24 months",
+         "conditions": ["cataract"], "accident_exempt": True, "clause": {"text": "A waits.", "source": "a.pdf", "page": 3}},
+        {"id": "w", "kind": "waiting_period", "insurers": ["HDF"], "days": 720, "period": "24 months",
+         "conditions": ["cataract"], "accident_exempt": True, "clause": {"text": "HDF waits.", "source": "HDF1.pdf"}},
+    ]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": rules}))
+    return claim_rules.RuleEngine(paths=(str(path),))
+
+def clause(source, chunk_id=0):
+    return {"id": chunk_id, "source": source, "text": "..."}
+
+def test_every_document_must_be_settled(engine):
+    parsed = {"policy_duration_months": 3}
+    query = "cataract surgery"
+    decision = engine.evaluate(query, parsed, [clause("a.pdf"), clause("HDFHLIP01.pdf", 1)])
+    assert decision["decision"] == "Rejected"
+    assert [(r["source"], r["clause"]["text"]) for r in decision["rules"]] == [
+        ("a.pdf", "A waits."), ("HDFHLIP01.pdf", "HDF waits.")]
+    # One document without a rule that settles it sends the claim to the LLM
+    assert engine.evaluate(query, parsed, [clause("a.pdf"), clause("b.pdf", 1)]) is None
+    assert engine.stats()["short_circuited"] == 1
+
+def test_uploads_are_never_pre_screened(engine):
+    upload = {"source": "a.pdf", "page": 1, "text": "..."}
+    assert engine.evaluate("cataract surgery", {"policy_duration_months": 3}, [upload]) is None
+    assert engine.evaluate("cataract surgery", {"policy_duration_months": 3}, []) is None
+
+def test_rules_are_reloaded_with_the_index(engine, monkeypatch, tmp_path):
+    monkeypatch.setattr(claim_rules.semantic_search, "index_version", lambda: (1,))
+    parsed = {"policy_duration_months": 3}
+    assert engine.evaluate("cataract surgery", parsed, [clause("a.pdf")]) is not None
+    # A re-ingest removed a.pdf's rule
+    (tmp_path / "rules.json").write_text(json.dumps({"rules": []}))
+    assert engine.evaluate("cataract surgery", parsed, [clause("a.pdf")]) is not None
+    monkeypatch.setattr(claim_rules.semantic_search, "index_version", lambda: (2,))
+    assert engine.evaluate("cataract surgery", parsed, [clause("a.pdf")]) is None
+    assert engine.stats()["rules_loaded"] == 0
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import context_packer
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # The word-based estimate, so counts don't depend on tiktoken being installed
+    monkeypatch.setattr(context_packer, "get_encoding", lambda: None)
+
+def words(prefix, n):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+def clause(text, **extra):
+    return dict({"text": text, "source": "a.pdf"}, **extra)
+
+def test_near_duplicates_keep_the_better_ranked_clause():
+    base = "pre existing diseases are covered after 36 months of continuous coverage"
+    clauses = [clause(base), clause(base + " with the company"), clause("room rent is capped at one percent")]
+    assert context_packer.drop_near_duplicates(clauses) == [clauses[0], clauses[2]]
+    # A short clause contained in a longer, better-ranked one goes too
+    assert context_packer.drop_near_duplicates([clauses[1], clauses[0]]) == [clauses[1]]
+
+def test_mmr_moves_redundant_clauses_down():
+    clauses = [clause("cataract surgery waiting period two years"),
+               clause("cataract surgery waiting period of two years"),
+               clause("ambulance charges are paid in full")]
+    order = context_packer.mmr_order(clauses, lambda_=0.5)
+    assert order == [clauses[0], clauses[2], clauses[1]]
+    # Relevance only keeps retrieval order
+    assert context_packer.mmr_order(clauses, lambda_=1.0) == clauses
+
+def test_mmr_uses_stored_vectors(monkeypatch):
+    # Same word sets, but the stored embeddings say 1 repeats 0 and 2 doesn't
+    vectors = {0: np.array([1, 0], dtype="float32"), 1: np.array([1, 0.01], dtype="float32"),
+               2: np.array([0, 1], dtype="float32")}
+    monkeypatch.setattr(context_packer.semantic_search, "clause_vectors", lambda ids: [vectors[i] for i in ids])
+    clauses = [clause("same words", id=i) for i in range(3)]
+    assert [c["id"] for c in context_packer.mmr_order(clauses, lambda_=0.5)] == [0, 2, 1]
+
+def test_pack_stays_within_the_budget():
+    clauses = [clause(words("a", 500)), clause(words("b", 500)), clause(words("c", 500))]
+    packed = context_packer.pack(clauses, budget=600, max_clause_tokens=400)
+    tokens = [context_packer.count_tokens(c["text"]) for c in packed]
+    # The first is cut to the per-clause limit, the second to what's left
+    assert len(packed) == 2
+    assert tokens[0] <= 400 and packed[0]["text"].endswith(" ...")
+    assert packed[1]["text"].endswith(" ...")
+    assert sum(tokens) <= 600
+    # Clauses are copied when cut, never edited in place
+    assert clauses[0]["text"] == words("a", 500)
+
+def test_pack_skips_fragments_below_the_minimum():
+    clauses = [clause(words("a", 100)), clause(words("b", 100))]
+    budget = 100 + context_packer.CONTEXT_MIN_CLAUSE_TOKENS - 1
+    packed = context_packer.pack(clauses, budget=budget, max_clause_tokens=400)
+    assert packed == clauses[:1]
+
+def test_assemble_context_records_savings(monkeypatch):
+    monkeypatch.setattr(context_packer, "stats", context_packer.PackerStats())
+    text = words("w", 50)
+    clauses = [clause(text), clause(text), clause(words("x", 50))]
+    packed = context_packer.assemble_context(clauses)
+    assert [c["text"] for c in packed] == [text, words("x", 50)]
+    stats = context_packer.stats.stats()
+    assert stats["duplicates_dropped"] == 1
+    assert stats["clauses_in"] == 3 and stats["clauses_out"] == 2
+    assert stats["clause_tokens_saved"] == context_packer.count_tokens(text)
@@ -0,0 +1,10 @@
+import pytest
+import document_ingestor
+
+def test_add_rejects_unsupported_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("Room rent is capped at 1% of the sum insured.")
+    with pytest.raises(ValueError):
+        document_ingestor.add_document(str(path), doc_dir=str(tmp_path / "data"))
+    with pytest.raises(SystemExit):
+        document_ingestor.main(["add", str(path)])
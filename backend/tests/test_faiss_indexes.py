@@ -0,0 +1,23 @@
+import numpy as np
+import faiss_indexes
+
+CONFIG = dict(faiss_indexes.index_config_from_env(), type="ivf_pq", nlist=0, pq_m=4, pq_nbits=4, train_size=50000)
+
+def build(ntotal, dim=8):
+    vectors = np.random.default_rng(0).random((ntotal, dim), dtype="float32")
+    index = faiss_indexes.create_index(CONFIG, dim, ntotal)
+    faiss_indexes.train_index(index, vectors)
+    index.add_with_ids(vectors, np.arange(100, 100 + ntotal, dtype="int64"))
+    return index, vectors
+
+def test_tiny_shard_gets_a_flat_index():
+    # 39 * 2**4 = 624 training points needed for 4-bit codes
+    index, vectors = build(50)
+    assert faiss_indexes.describe(index) == "IndexFlat"
+    _, ids = faiss_indexes.search(index, vectors[:1], 1)
+    assert ids.tolist() == [[100]]
+    assert faiss_indexes.describe(build(624)[0]) == "IndexIVFPQ"
+
+def test_small_training_sample_gets_a_flat_index():
+    config = dict(CONFIG, train_size=600)
+    assert faiss_indexes.factory_string(config, 8, 10000) == "IDMap2,Flat"
@@ -0,0 +1,68 @@
+import io
+import base64
+import pytest
+import motor.motor_asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+mongomock_motor = pytest.importorskip("mongomock_motor")
+import mongodb
+import profile_pictures
+import routes
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(routes.router)
+    with mongomock_motor.enabled_gridfs_integration(), TestClient(app) as client:
+        database = mongomock_motor.AsyncMongoMockClient()["decigenie_test"]
+
+        async def bucket():
+            # Motor binds the bucket to the loop it's created on: the test client's
+            return motor.motor_asyncio.AsyncIOMotorGridFSBucket(database, bucket_name="profile_pictures")
+
+        monkeypatch.setattr(mongodb, "users", database.users)
+        monkeypatch.setattr(mongodb, "pictures", client.portal.call(bucket))
+        monkeypatch.setattr(routes, "users_col", database.users)
+        client.db = database
+        yield client
+
+def png(width, height):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, "PNG")
+    return out.getvalue()
+
+def test_legacy_picture_is_migrated_when_the_profile_is_read(client):
+    data = png(300, 200)
+    client.portal.call(client.db.users.insert_one,
+                       {"_id": "u1", "name": "Asha", "email": "a@example.com", "profile_picture": base64.b64encode(data).decode()})
+
+    profile = client.get("/api/user/profile", params={"user_id": "u1"}).json()
+    version = profile_pictures.picture_version(data)
+    assert profile["profile_picture"] == profile_pictures.picture_url("u1", version)
+
+    user = client.portal.call(client.db.users.find_one, {"_id": "u1"})
+    assert "profile_picture" not in user
+    assert user["profile_picture_version"] == version
+
+    # The URL from the profile serves the thumbnail, cacheable for good
+    response = client.get(profile["profile_picture"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == profile_pictures.MEDIA_TYPES[profile_pictures.PROFILE_PICTURE_FORMAT]
+    assert "immutable" in response.headers["cache-control"]
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (200, 200)  # cropped square, never upscaled
+    revalidated = client.get(profile["profile_picture"], headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+    # Already migrated: the next read returns the same URL
+    assert client.get("/api/user/profile", params={"user_id": "u1"}).json()["profile_picture"] == profile["profile_picture"]
+
+def test_user_without_a_picture(client):
+    client.portal.call(client.db.users.insert_one, {"_id": "u2", "name": "Ravi"})
+    assert client.get("/api/user/profile", params={"user_id": "u2"}).json()["profile_picture"] == ""
+    assert client.get("/api/user/profile-picture", params={"user_id": "u2"}).status_code == 404
+
+def test_unreadable_legacy_picture_is_left_alone(client):
+    client.portal.call(client.db.users.insert_one, {"_id": "u3", "profile_picture": base64.b64encode(b"not an image").decode()})
+    assert client.get("/api/user/profile", params={"user_id": "u3"}).json()["profile_picture"] == ""
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from pymongo import UpdateOne
+import query_log
+
+class FakeQueries:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures  # insert_many calls that raise before succeeding
+
+    async def insert_many(self, docs, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("not connected")
+        self.batches.append([doc["query"] for doc in docs])
+
+class FakeUsers:
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("not connected")
+        self.calls.append(list(requests))
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(query_log, "QUERY_LOG_RETRY_BACKOFF", 0)
+
+def incs(**counts):
+    return [UpdateOne({"_id": user_id}, {"$inc": {"queries_made": n}}) for user_id, n in counts.items()]
+
+def docs(*user_ids):
+    return [{"query": f"q{i}", "user_id": user_id} for i, user_id in enumerate(user_ids)]
+
+def test_flushes_in_batches_with_one_bulk_inc_each():
+    queries, users = FakeQueries(), FakeUsers()
+    writer = query_log.QueryLogWriter(queries, users, batch_size=3, flush_ms=10_000)
+
+    async def run():
+        for doc in docs("a", "a", "b", None, "b", "b", "c"):
+            await writer.log(doc)
+        await writer.close()
+
+    asyncio.run(run())
+    assert queries.batches == [["q0", "q1", "q2"], ["q3", "q4", "q5"], ["q6"]]
+    # One $inc per user per batch, anonymous queries not counted
+    assert users.calls == [incs(a=2, b=1), incs(b=2), incs(c=1)]
+    stats = writer.stats()
+    assert (stats["logged"], stats["written"], stats["flushes"], stats["counter_updates"]) == (7, 7, 3, 4)
+
+def test_flushes_a_partial_batch_once_it_is_old_enough():
+    queries, users = FakeQueries(), FakeUsers()
+    writer = query_log.QueryLogWriter(queries, users, batch_size=100, flush_ms=20)
+
+    async def run():
+        await writer.log(docs("a")[0])
+        await asyncio.sleep(0.2)
+        written = list(queries.batches)
+        await writer.close()
+        return written
+
+    assert asyncio.run(run()) == [["q0"]]
+    assert users.calls == [incs(a=1)]
+
+def test_failed_counter_update_does_not_insert_twice():
+    queries, users = FakeQueries(failures=1), FakeUsers(failures=1)
+    writer = query_log.QueryLogWriter(queries, users, batch_size=2, flush_ms=10_000)
+
+    async def run():
+        for doc in docs("a", "a"):
+            await writer.log(doc)
+        await writer.close()
+
+    asyncio.run(run())
+    assert queries.batches == [["q0", "q1"]]
+    assert users.calls == [incs(a=2)]
+    assert writer.stats()["retries"] == 2
+
+def test_writes_immediately_without_write_behind():
+    queries, users = FakeQueries(), FakeUsers()
+    writer = query_log.QueryLogWriter(queries, users, enabled=False)
+    asyncio.run(writer.log(docs("a")[0]))
+    assert queries.batches == [["q0"]] and users.calls == [incs(a=1)]
@@ -0,0 +1,46 @@
+import pytest
+import query_parser
+from benchmarks.parser_benchmark import FIELDS, synthetic_queries
+
+def parse(query):
+    # The NER fallback needs en_core_web_sm; everything here is gazetteer + regex
+    return query_parser.parse_query_fast(query, ner_fallback=False)
+
+@pytest.mark.parametrize("query, expected", [
+    ("46-year-old male, knee surgery in Pune, 3-month-old insurance policy",
+     {"age": 46, "gender": "male", "procedure": "knee surgery", "city": "Pune", "policy_duration_months": 3}),
+    ("46M, knee surgery in Pune, 3-month-old insurance policy",
+     {"age": 46, "gender": "male", "procedure": "knee surgery", "city": "Pune", "policy_duration_months": 3}),
+    ("32F cataract surgery Mumbai 2 year policy",
+     {"age": 32, "gender": "female", "procedure": "cataract surgery", "city": "Mumbai", "policy_duration_months": 24}),
+    ("surgery for his wife, 3m policy",
+     {"age": None, "gender": None, "procedure": None, "city": None, "policy_duration_months": None}),
+    ("she had a hip replacement in Chennai, policy taken 2 years ago",
+     {"age": None, "gender": None, "procedure": "hip replacement", "city": "Chennai", "policy_duration_months": 24}),
+    ("female aged 29, maternity claim, 14 months into the policy",
+     {"age": 29, "gender": "female", "procedure": None, "city": None, "policy_duration_months": 14}),
+])
+def test_sample_queries(query, expected):
+    assert parse(query) == expected
+
+def test_schema_matches_full_parser():
+    assert list(parse("46-year-old male, knee surgery in Pune")) == FIELDS
+
+def test_parity_with_full_parser_regexes():
+    # Where the original regexes read a field (the "NN-year-old" age, a duration
+    # in a query with no age in it) the fast path reads the same value
+    for query in synthetic_queries(500, 0):
+        parsed = parse(query)
+        age = query_parser.extract_age(query)
+        if age is not None:
+            assert parsed["age"] == age, query
+        if "old" not in query.replace("-month-old", ""):
+            assert parsed["policy_duration_months"] == query_parser.extract_policy_duration(query), query
+
+def test_batch_resolved_by_the_gazetteer_skips_ner(monkeypatch):
+    def no_model():
+        raise AssertionError("spaCy model loaded")
+    monkeypatch.setattr(query_parser, "NER_FALLBACK", True)
+    monkeypatch.setattr(query_parser, "get_ner_nlp", no_model)
+    parsed = query_parser.parse_queries(["knee surgery in Pune", "cataract, 3 month policy"])
+    assert [p["city"] for p in parsed] == ["Pune", None]
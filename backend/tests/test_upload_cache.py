@@ -0,0 +1,14 @@
+import embeddings
+import upload_cache
+
+def test_key_names_the_backend_that_loaded(monkeypatch):
+    # onnx was asked for but couldn't load; torch serves
+    monkeypatch.setattr(embeddings, "EMBEDDING_BACKEND", "onnx")
+    monkeypatch.setattr(embeddings, "_model", None)
+    monkeypatch.setattr(embeddings, "active_backend", None)
+    monkeypatch.setattr(embeddings, "load", lambda: (object(), "torch", None))
+    key = upload_cache.cache_key("abc")
+    assert embeddings.settings()["backend"] == "torch"
+    # The same key once the model is serving queries
+    embeddings.get_model()
+    assert upload_cache.cache_key("abc") == key
@@ -0,0 +1,121 @@
+# upload_cache.py
+#
+# Chunks and embeddings of uploaded files by content hash (plus model and
+# chunking settings), evicted LRU past UPLOAD_CACHE_MAX_BYTES.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import chunker
+import embeddings
+
+UPLOAD_CACHE_ENABLED = os.getenv("UPLOAD_CACHE", "1") == "1"
+UPLOAD_CACHE_DIR = os.getenv("UPLOAD_CACHE_DIR", "./upload_cache")
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+def settings_tag():
+    # Keyed on the backend actually loaded: onnx/int8 fall back to torch when they can't load
+    embeddings.get_model()
+    settings = json.dumps({"embedding": embeddings.settings(), "chunking": chunker.settings()}, sort_keys=True)
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+
+def cache_key(content_sha256):
+    return f"{content_sha256}-{settings_tag()}"
+
+class UploadCache:
+    def __init__(self, directory=UPLOAD_CACHE_DIR, max_bytes=UPLOAD_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _paths(self, key):
+        return os.path.join(self.directory, key + ".json"), os.path.join(self.directory, key + ".npy")
+
+    def _load_entries(self):
+        # Rebuilt from the directory on first use; file mtimes give the LRU order
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            json_path, npy_path = self._paths(key)
+            if not os.path.exists(npy_path):
+                continue
+            stat = os.stat(json_path)
+            found.append((stat.st_mtime, key, stat.st_size + os.path.getsize(npy_path)))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self.total_bytes = sum(self._entries.values())
+
+    def _remove(self, key):
+        self.total_bytes -= self._entries.pop(key, 0)
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, key):
+        # (metadata list, float32 matrix) or None
+        with self._lock:
+            self._load_entries()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            json_path, npy_path = self._paths(key)
+            try:
+                with open(json_path) as f:
+                    metadata = json.load(f)
+                vectors = np.load(npy_path)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(json_path, (now, now))
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return metadata, vectors
+
+    def put(self, key, metadata, vectors):
+        metadata = [{k: v for k, v in meta.items() if k != "source"} for meta in metadata]
+        json_path, npy_path = self._paths(key)
+        with self._lock:
+            self._load_entries()
+            with open(json_path + ".tmp", "w") as f:
+                json.dump(metadata, f)
+            with open(npy_path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(vectors, dtype="float32"))
+            os.replace(npy_path + ".tmp", npy_path)
+            os.replace(json_path + ".tmp", json_path)
+            size = os.path.getsize(json_path) + os.path.getsize(npy_path)
+            self.total_bytes += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": UPLOAD_CACHE_ENABLED,
+            "entries": len(self._entries or ()),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+cache = UploadCache()
@@ -0,0 +1,180 @@
+# uploads.py
+#
+# Files attached to /analyze-query. Each one is spooled to a temp file in
+# UPLOAD_READ_CHUNK_BYTES pieces, hashed on the way, instead of being read
+# into memory whole, and a request is rejected with 413 as soon as a file
+# or the request as a whole goes over its size limit. PDF pages are then
+# extracted from the temp file in parallel on the extraction process pool,
+# and page texts are cached by (file hash, page number). Files of a type the
+# ingestor can't read are skipped before anything is written.
+
+import os
+import asyncio
+import hashlib
+import tempfile
+from collections import OrderedDict
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+import document_ingestor
+import workers
+
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None  # None = the system temp dir
+UPLOAD_PAGES_PER_TASK = int(os.getenv("UPLOAD_PAGES_PER_TASK", "8"))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+class SpooledUpload:
+    def __init__(self, filename, path, sha256, size):
+        self.filename = filename
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+    @property
+    def ext(self):
+        return self.filename.lower().rsplit(".", 1)[-1]
+
+def supported(filename):
+    return bool(filename) and filename.lower().endswith(document_ingestor.SUPPORTED_EXTENSIONS)
+
+async def spool_upload(file, limit, too_large):
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=os.path.splitext(file.filename)[1], dir=UPLOAD_TMP_DIR)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(UPLOAD_READ_CHUNK_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if size > limit:
+                    raise HTTPException(status_code=413, detail=f"{file.filename}: {too_large}")
+                digest.update(block)
+                await run_in_threadpool(out.write, block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(file.filename, path, digest.hexdigest(), size)
+
+async def spool_files(files):
+    # Spools every file or none: on any error the ones already written are removed
+    spooled = []
+    remaining = UPLOAD_MAX_REQUEST_BYTES
+    try:
+        for file in files:
+            if not supported(file.filename):
+                continue
+            if UPLOAD_MAX_FILE_BYTES <= remaining:
+                upload = await spool_upload(
+                    file, UPLOAD_MAX_FILE_BYTES, f"file is larger than the {UPLOAD_MAX_FILE_BYTES} byte limit.")
+            else:
+                upload = await spool_upload(
+                    file, remaining, f"uploads exceed the {UPLOAD_MAX_REQUEST_BYTES} byte limit per request.")
+            remaining -= upload.size
+            spooled.append(upload)
+    except BaseException:
+        discard(spooled)
+        raise
+    return spooled
+
+def discard(spooled):
+    for upload in spooled:
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+
+# --- Text extraction ---
+
+def pdf_page_count(path):
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+def extract_page_range(path, start, stop):
+    # Runs in an extraction worker process
+    with fitz.open(path) as doc:
+        return [doc[page_num].get_text() for page_num in range(start, stop)]
+
+class PageCache:
+    # Page texts by (file hash, page number), least recently used evicted first
+    # once their text takes more than max_bytes. Only used on the event loop.
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sha256, page_num):
+        text = self._pages.get((sha256, page_num))
+        if text is None:
+            self.misses += 1
+            return None
+        self._pages.move_to_end((sha256, page_num))
+        self.hits += 1
+        return text
+
+    def put(self, sha256, page_num, text):
+        key = (sha256, page_num)
+        if key in self._pages:
+            self.total_bytes -= len(self._pages.pop(key))
+        self._pages[key] = text
+        self.total_bytes += len(text)
+        while self.total_bytes > self.max_bytes and self._pages:
+            self.total_bytes -= len(self._pages.popitem(last=False)[1])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "pages": len(self._pages),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+page_cache = PageCache()
+
+def page_ranges(pages, size):
+    # Splits sorted page numbers into runs of consecutive pages, at most `size` long
+    ranges = []
+    for page_num in pages:
+        if ranges and page_num == ranges[-1][1] and page_num - ranges[-1][0] < size:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([page_num, page_num + 1])
+    return ranges
+
+async def extract_pdf_pages(upload):
+    count = await workers.run_cpu(pdf_page_count, upload.path)
+    texts = {}
+    for page_num in range(count):
+        text = page_cache.get(upload.sha256, page_num)
+        if text is not None:
+            texts[page_num] = text
+    missing = [p for p in range(count) if p not in texts]
+    ranges = page_ranges(missing, UPLOAD_PAGES_PER_TASK)
+    if len(missing) <= UPLOAD_PAGES_PER_TASK:
+        # Not worth a round trip to the process pool
+        results = [await workers.run_cpu(extract_page_range, upload.path, start, stop) for start, stop in ranges]
+    else:
+        results = await asyncio.gather(*[
+            workers.run_extract(extract_page_range, upload.path, start, stop) for start, stop in ranges])
+    for (start, _), extracted in zip(ranges, results):
+        for page_num, text in enumerate(extracted, start):
+            texts[page_num] = text
+            page_cache.put(upload.sha256, page_num, text)
+    return [(page_num + 1, texts[page_num]) for page_num in range(count)]
+
+async def extract_units(upload):
+    # [(page number, text)] for a PDF, [(None, text)] for docx/eml, [] otherwise
+    if upload.ext == "pdf":
+        return await extract_pdf_pages(upload)
+    if upload.ext == "docx":
+        return [(None, await workers.run_cpu(document_ingestor.extract_text_from_docx, upload.path))]
+    if upload.ext == "eml":
+        return [(None, await workers.run_cpu(document_ingestor.extract_text_from_eml, upload.path))]
+    return []
@@ -0,0 +1,52 @@
+# workers.py
+#
+# Bounded pool for CPU-bound and blocking request work (PDF parsing,
+# embedding, FAISS search, spaCy), so async handlers never run it on the
+# event loop. PyMuPDF, torch and FAISS release the GIL for their heavy
+# lifting, so threads are enough and avoid copying documents between
+# processes.
+#
+# Page text extraction for large uploads is the exception: it runs in a
+# small process pool (as in document_ingestor), which only needs the path of
+# the spooled upload, so nothing large is copied between processes.
+
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(8, os.cpu_count() or 1))))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+_extract_pool = None
+_extract_lock = threading.Lock()
+
+async def run_cpu(fn, *args, **kwargs):
+    # Runs in a copy of the caller's context, so metrics spans land in the request's trace
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_pool, functools.partial(ctx.run, fn, *args, **kwargs))
+
+def get_extract_pool():
+    # Started on first use; "spawn" because forking a process that already
+    # runs threads (and torch) is not safe
+    global _extract_pool
+    if _extract_pool is None:
+        with _extract_lock:
+            if _extract_pool is None:
+                _extract_pool = ProcessPoolExecutor(
+                    max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _extract_pool
+
+async def run_extract(fn, *args):
+    # fn and its arguments must be picklable (a module-level function and paths)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extract_pool(), fn, *args)
+
+def shutdown():
+    if _extract_pool is not None:
+        _extract_pool.shutdown(wait=False, cancel_futures=True)
@@ -855,7 +855,7 @@ function App() {
       const res = await axios.get("/api/user/profile", { params: { user_id: userId } });
       setProfileData(res.data);
       setProfileEdit({ name: res.data.name, email: res.data.email });
-      setProfilePicPreview(res.data.profile_picture ? `data:image/*;base64,${res.data.profile_picture}` : "");
+      setProfilePicPreview(res.data.profile_picture || "");
     } catch (err: any) {
       setProfileError(err?.response?.data?.detail || "Failed to load profile.");
     } finally {